@@ -0,0 +1,256 @@
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+def make_cache_key(image_bytes: Union[bytes, memoryview], prompt: str, model: str) -> str:
+    """
+    Content-addressed key for an extraction
+
+    Args:
+        image_bytes: Raw bytes of the uploaded image
+        prompt: Prompt sent with the image
+        model: Model name/version used for extraction
+
+    Returns:
+        Hex sha256 digest covering image, prompt and model
+    """
+    digest = hashlib.sha256()
+    digest.update(model.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(prompt.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(image_bytes)
+    return digest.hexdigest()
+
+class ExtractionCache:
+    """
+    Two-tier cache for extraction results
+
+    A bounded in-memory LRU sits in front of an optional on-disk tier whose
+    entries expire after ttl_seconds. Concurrent lookups of the same key
+    share a single in-flight extraction. Callers get their own copy of the
+    items, so editing a result never changes what the cache holds.
+    """
+
+    def __init__(self, max_entries: int = 256, disk_dir: Optional[str] = None,
+                 ttl_seconds: float = 7 * 24 * 3600):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.ttl_seconds = ttl_seconds
+
+        self._memory: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._in_flight_reports: Dict[str, Dict] = {}
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expired": 0,
+        }
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _remember(self, key: str, items: List[Dict]):
+        """Put items in the memory tier, evicting the least recently used"""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._memory[key] = items
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def _read_disk(self, key: str) -> Optional[List[Dict]]:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl_seconds:
+                os.remove(path)
+                self._count("expired")
+                return None
+            with open(path, "r") as f:
+                return json.load(f)["items"]
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Cache read error: {e}")
+            return None
+
+    def _write_disk(self, key: str, items: List[Dict]):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file first so readers never see a partial entry
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"created": time.time(), "items": items}, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Cache write error: {e}")
+
+    def get(self, key: str) -> Optional[List[Dict]]:
+        """Look up a key in memory, then on disk (returns a copy)"""
+        with self._lock:
+            items = self._memory.get(key)
+            if items is not None:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return copy.deepcopy(items)
+
+        items = self._read_disk(key)
+        if items is None:
+            return None
+        self._count("disk_hits")
+        self._remember(key, items)
+        return copy.deepcopy(items)
+
+    def contains(self, key: str) -> bool:
+        """Whether key is cached, without touching LRU order or counters"""
+        with self._lock:
+            if key in self._memory:
+                return True
+        if not self.disk_dir:
+            return False
+        try:
+            return time.time() - os.path.getmtime(self._disk_path(key)) <= self.ttl_seconds
+        except OSError:
+            return False
+
+    def set(self, key: str, items: List[Dict]):
+        """Store a copy of items in both tiers (empty results are not cached)"""
+        if not items:
+            return
+        self._count("stores")
+        self._remember(key, copy.deepcopy(items))
+        self._write_disk(key, items)
+
+    async def get_or_extract(self, key: str,
+                             extract: Callable[[], Awaitable[List[Dict]]],
+                             cacheable: Optional[Callable[[List[Dict]], bool]] = None,
+                             report: Optional[Dict] = None) -> List[Dict]:
+        """
+        Return cached items for key, or run extract() once for all concurrent callers
+
+        Args:
+            key: Cache key from make_cache_key
+            extract: Coroutine factory performing the actual extraction
+            cacheable: Called with the extracted items; a false result (an
+                incomplete extraction) is shared with concurrent callers but
+                not stored
+            report: The caller's report on the extraction; a caller that joins
+                an in-flight extraction gets cache="coalesced" and the fields
+                of the leader's report it doesn't have yet (such as why it failed)
+
+        Returns:
+            List of dictionaries with ingredient data
+        """
+        items = self.get(key)
+        if items is not None:
+            return items
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            self._count("coalesced")
+            leader_report = self._in_flight_reports.get(key)
+            try:
+                # The leader returns its own list, so each waiter gets a copy
+                return copy.deepcopy(await asyncio.shield(in_flight))
+            finally:
+                if report is not None and leader_report is not None:
+                    report["cache"] = "coalesced"
+                    for field, value in leader_report.items():
+                        report.setdefault(field, value)
+
+        self._count("misses")
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        if report is not None:
+            self._in_flight_reports[key] = report
+        try:
+            items = await extract()
+            if cacheable is None or cacheable(items):
+                self.set(key, items)
+            future.set_result(items)
+            return items
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            self._in_flight.pop(key, None)
+            self._in_flight_reports.pop(key, None)
+
+    def evict_expired(self) -> int:
+        """Remove expired entries from the disk tier"""
+        if not self.disk_dir:
+            return 0
+        removed = 0
+        cutoff = time.time() - self.ttl_seconds
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+        self._count("expired", removed)
+        return removed
+
+    def clear(self):
+        """Empty the memory tier"""
+        with self._lock:
+            self._memory.clear()
+
+    def stats(self) -> Dict:
+        """Hit/miss/coalescing counters and current size"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+        stats["in_flight"] = len(self._in_flight)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_rate"] = round((lookups - stats["misses"]) / lookups, 4) if lookups else 0.0
+        stats["disk_enabled"] = bool(self.disk_dir)
+        return stats
+
+_extraction_cache: Optional[ExtractionCache] = None
+
+def get_extraction_cache() -> ExtractionCache:
+    """
+    Return the process-wide extraction cache
+
+    Configured through EXTRACTION_CACHE_SIZE, EXTRACTION_CACHE_DIR (enables
+    the disk tier) and EXTRACTION_CACHE_TTL (seconds).
+    """
+    global _extraction_cache
+    if _extraction_cache is None:
+        _extraction_cache = ExtractionCache(
+            max_entries=int(os.getenv("EXTRACTION_CACHE_SIZE", "256")),
+            disk_dir=os.getenv("EXTRACTION_CACHE_DIR") or None,
+            ttl_seconds=float(os.getenv("EXTRACTION_CACHE_TTL", str(7 * 24 * 3600)))
+        )
+    return _extraction_cache
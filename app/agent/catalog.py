@@ -0,0 +1,342 @@
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List, Optional
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(__file__), "data", "ingredients.json")
+
+NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+def normalize_name(name: str) -> str:
+    """Lowercase, strip accents and punctuation, collapse spaces"""
+    text = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode('ascii')
+    return NON_ALNUM.sub(' ', text.lower()).strip()
+
+def trigrams(key: str) -> set:
+    """Character trigrams of a normalised name, padded so short words still index"""
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+# Two words are taken for the same (misspelt or abbreviated) word from this
+# similarity; lenient, since the whole names already scored above the threshold
+TOKEN_MATCH = 0.6
+
+def name_tokens(key: str) -> List[str]:
+    """Words of a normalised name, without sizes and counts ("eggs 12" -> ["eggs"])"""
+    return [token for token in key.split() if not any(char.isdigit() for char in token)]
+
+def tokens_covered(key: str, other: str) -> bool:
+    """
+    Whether every word of each name has a counterpart in the other
+
+    Character trigrams alone score "skimmed milk powder" close to "skimmed
+    milk"; the leftover "powder" is what makes it a different product.
+    """
+    if key.replace(" ", "") == other.replace(" ", ""):
+        # Only the spacing differs ("butter milk")
+        return True
+    tokens, other_tokens = name_tokens(key), name_tokens(other)
+    return all(has_counterpart(token, other_tokens) for token in tokens) and \
+        all(has_counterpart(token, tokens) for token in other_tokens)
+
+def has_counterpart(token: str, candidates: List[str]) -> bool:
+    """Whether token is (nearly) one of candidates"""
+    # SequenceMatcher rather than trigrams: short words with swapped letters ("mlik") share no trigram
+    return any(SequenceMatcher(None, token, candidate).ratio() >= TOKEN_MATCH for candidate in candidates)
+
+def names_related(key: str, other: str) -> bool:
+    """
+    Whether two normalised names share at least one (nearly) equal word
+
+    "tsc frsh crm" and "single cream" are related through "crm"; a row the
+    reviewer replaced outright ("milk" -> "bread") is not.
+    """
+    if key.replace(" ", "") == other.replace(" ", ""):
+        return True
+    other_tokens = name_tokens(other)
+    return any(has_counterpart(token, other_tokens) for token in name_tokens(key))
+
+def price_key(price) -> str:
+    """Price with currency signs and spacing dropped, for pairing rows"""
+    return re.sub(r'[^0-9.,-]', '', str(price or '')).replace(',', '.')
+
+def pair_rows(extracted: List[Dict], approved: List[Dict]) -> List[tuple]:
+    """
+    (extracted row or None, approved row) pairs for a reviewed receipt
+
+    An approved row is paired with an unused extracted row of the same
+    price first, so deleting or inserting a row doesn't shift every pair
+    after it; otherwise with the row at the same position when the review
+    kept the row count.
+    """
+    unused = list(range(len(extracted)))
+    same_count = len(extracted) == len(approved)
+    pairs = []
+    for position, item in enumerate(approved):
+        price = price_key(item.get("Price"))
+        index = next((i for i in unused if price and price_key(extracted[i].get("Price")) == price), None)
+        if index is None and same_count and position in unused:
+            index = position
+        if index is not None:
+            unused.remove(index)
+        pairs.append((extracted[index] if index is not None else None, item))
+    return pairs
+
+class IngredientCatalog:
+    """
+    Canonical ingredient names with fuzzy lookup
+
+    Every canonical name and alias is indexed by character trigrams and
+    scored with the Dice coefficient, so OCR-mangled names like "S/SKIM
+    MLK" still find "Semi Skimmed Milk". A lookup only reads the postings
+    of the query's rarest trigrams (an entry reaching the threshold must
+    share at least one of them) and skips entries whose trigram count
+    rules the threshold out, so common trigrams ("ed ", " mi") never walk
+    long lists and lookups stay under a millisecond with tens of thousands
+    of entries. A fuzzy match also needs every word on either side to have a
+    counterpart, so a longer product name isn't merged into a shorter one.
+    """
+
+    def __init__(self, threshold: float = 0.75):
+        self.threshold = threshold
+        self._names: List[str] = []           # canonical display names
+        self._name_ids: Dict[str, int] = {}   # normalised canonical -> name id
+        self._keys: List[str] = []            # normalised names and aliases
+        self._key_names: List[int] = []       # key id -> name id
+        self._key_ids: Dict[str, int] = {}    # normalised key -> key id
+        self._grams: List[frozenset] = []     # trigrams per key
+        self._index: Dict[str, Dict[int, List[int]]] = {}  # trigram -> key trigram count -> key ids
+        self._frequency: Dict[str, int] = {}  # keys per trigram
+        self._learned: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, name: str, aliases: Iterable[str] = ()) -> int:
+        """
+        Add a canonical name (if new) and aliases that map to it
+
+        Returns:
+            The name id
+        """
+        with self._lock:
+            normalized = normalize_name(name)
+            name_id = self._name_ids.get(normalized)
+            if name_id is None:
+                name_id = len(self._names)
+                self._names.append(name)
+                self._name_ids[normalized] = name_id
+            for key in [normalized, *map(normalize_name, aliases)]:
+                if key and key not in self._key_ids:
+                    self._index_key(key, name_id)
+            return name_id
+
+    def _index_key(self, key: str, name_id: int):
+        key_id = len(self._keys)
+        self._keys.append(key)
+        self._key_names.append(name_id)
+        self._key_ids[key] = key_id
+        grams = frozenset(trigrams(key))
+        self._grams.append(grams)
+        for gram in grams:
+            self._index.setdefault(gram, {}).setdefault(len(grams), []).append(key_id)
+            self._frequency[gram] = self._frequency.get(gram, 0) + 1
+
+    def load(self, path: str, learned: bool = False) -> int:
+        """
+        Load a {canonical name: [aliases]} JSON file
+
+        Returns:
+            Number of canonical names in the file
+        """
+        if not os.path.exists(path):
+            return 0
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        for name, aliases in entries.items():
+            self.add(name, aliases)
+            if learned:
+                self._learned.setdefault(name, []).extend(aliases)
+        return len(entries)
+
+    def match(self, name: str, threshold: Optional[float] = None) -> Optional[Dict]:
+        """
+        Best catalogue entry for a (possibly OCR-mangled) name
+
+        Args:
+            name: Ingredient name as read from the receipt
+            threshold: Minimum score, defaults to the catalogue threshold
+
+        Returns:
+            Dict with the canonical 'name', the 'score' (1.0 for an exact
+            name or alias) and the catalogue key that 'matched', or None
+        """
+        key = normalize_name(name)
+        if not key:
+            return None
+
+        key_id = self._key_ids.get(key)
+        if key_id is not None:
+            return {"name": self._names[self._key_names[key_id]], "score": 1.0, "matched": key}
+
+        grams = trigrams(key)
+        size = len(grams)
+        minimum = self.threshold if threshold is None else threshold
+        if minimum <= 0:
+            return None
+
+        # Dice >= minimum bounds the other key's trigram count, and a key of
+        # other_size trigrams needs `needed` of them in common, so it shares
+        # one of the query's size - needed + 1 rarest trigrams: only those
+        # postings are read, fewer for longer keys
+        smallest = math.ceil(size * minimum / (2 - minimum) - 1e-9)
+        largest = math.floor(size * (2 - minimum) / minimum + 1e-9)
+        frequency = self._frequency
+        rarest = sorted(grams, key=lambda gram: frequency.get(gram, 0))
+
+        index = self._index
+        all_grams = self._grams
+        seen = set()
+        candidates = []
+        for other_size in range(max(smallest, 1), largest + 1):
+            needed = math.ceil(minimum * (size + other_size) / 2 - 1e-9)
+            for gram in rarest[:size - needed + 1]:
+                for key_id in index.get(gram, {}).get(other_size, ()):
+                    if key_id in seen:
+                        continue
+                    seen.add(key_id)
+                    score = 2.0 * len(grams & all_grams[key_id]) / (size + other_size)
+                    if score >= minimum:
+                        candidates.append((score, key_id))
+        for score, key_id in sorted(candidates, reverse=True):
+            if tokens_covered(key, self._keys[key_id]):
+                return {
+                    "name": self._names[self._key_names[key_id]],
+                    "score": round(score, 4),
+                    "matched": self._keys[key_id]
+                }
+        return None
+
+    def canonical_name(self, name: str) -> str:
+        """Canonical name for name, or name title-cased if nothing matches"""
+        if not name:
+            return "Unknown Item"
+        match = self.match(name)
+        return match["name"] if match else name.title()
+
+    def learn(self, name: str, alias: Optional[str] = None) -> bool:
+        """
+        Add a user-approved name, and optionally the raw name it was corrected from
+
+        An approved name close to an existing entry (a typo, or a spelling
+        the catalogue doesn't know) becomes an alias of that entry rather
+        than a new canonical name.
+
+        Returns:
+            True if the catalogue changed
+        """
+        key = normalize_name(name)
+        if not key:
+            return False
+        aliases = [alias] if alias and normalize_name(alias) else []
+        if key not in self._key_ids:
+            match = self.match(name)
+            if match is not None:
+                aliases.insert(0, name)
+                name = match["name"]
+        new_aliases = [entry for entry in aliases if normalize_name(entry) not in self._key_ids]
+        if normalize_name(name) in self._key_ids and not new_aliases:
+            return False
+
+        name_id = self.add(name, new_aliases)
+        with self._lock:
+            self._learned.setdefault(self._names[name_id], []).extend(new_aliases)
+        return True
+
+    def learn_from_submission(self, extracted: List[Dict], approved: List[Dict]) -> int:
+        """
+        Grow the catalogue from a reviewed receipt
+
+        Approved names become canonical entries, or aliases of the entry
+        they nearly match. Extracted rows are paired with approved ones by
+        price, then position (see pair_rows); an extracted name the user
+        corrected becomes an alias of the approved name only if the two
+        share a word, so a row that was replaced rather than fixed isn't
+        learned as a spelling of something else.
+
+        Returns:
+            Number of changes
+        """
+        changes = 0
+        for raw, item in pair_rows(extracted, approved):
+            name = str(item.get("Ingredient", "")).strip()
+            raw_name = str(raw.get("Ingredient", "")).strip() if raw else ""
+            raw_key, key = normalize_name(raw_name), normalize_name(name)
+            alias = raw_name if raw_key and raw_key != key and names_related(raw_key, key) else None
+            changes += self.learn(name, alias)
+        return changes
+
+    def save_learned(self, path: str):
+        """Write the learned names and aliases (atomically) to path"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            payload = json.dumps(self._learned, indent=2, ensure_ascii=False)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+    def stats(self) -> Dict:
+        """Catalogue size"""
+        return {
+            "names": len(self._names),
+            "keys": len(self._keys),
+            "trigrams": len(self._index),
+            "learned": len(self._learned),
+            "threshold": self.threshold
+        }
+
+def canonicalize_items(items: List[Dict], catalog: Optional[IngredientCatalog] = None) -> List[Dict]:
+    """
+    Copies of items with names merged into their catalogue entries
+
+    Names without a match are left exactly as they are.
+    """
+    catalog = catalog or get_ingredient_catalog()
+    result = []
+    for item in items:
+        match = catalog.match(str(item.get("Ingredient", "")))
+        result.append({**item, "Ingredient": match["name"]} if match else item)
+    return result
+
+_catalog: Optional[IngredientCatalog] = None
+_catalog_lock = threading.Lock()
+
+def get_ingredient_catalog() -> IngredientCatalog:
+    """
+    Return the process-wide catalogue
+
+    Built from CATALOG_PATH (the bundled data/ingredients.json by default)
+    plus the names learned from submissions at CATALOG_LEARNED_PATH.
+    CATALOG_MATCH_THRESHOLD sets the minimum fuzzy score.
+    """
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                catalog = IngredientCatalog(float(os.getenv("CATALOG_MATCH_THRESHOLD", "0.75")))
+                catalog.load(os.getenv("CATALOG_PATH", DEFAULT_CATALOG_PATH))
+                catalog.load(learned_catalog_path(), learned=True)
+                _catalog = catalog
+    return _catalog
+
+def learned_catalog_path() -> str:
+    """Where names learned from submissions are kept (CATALOG_LEARNED_PATH)"""
+    return os.getenv("CATALOG_LEARNED_PATH", "data/ingredients_learned.json")
@@ -0,0 +1,285 @@
+import io
+import math
+import os
+from typing import TYPE_CHECKING, BinaryIO, Dict, List, Tuple, Union
+
+# PIL is only needed once an image is actually decoded, so it is imported
+# in the functions that use it rather than when the app starts
+if TYPE_CHECKING:
+    from PIL import Image
+
+# Images at or below this size on both sides are sent with "low" detail
+LOW_DETAIL_MAX_SIDE = 512
+
+# Anything the pipeline stages accept as an image: a path, an in-memory
+# buffer, or an open binary file (e.g. an upload spooled to disk)
+ImageSource = Union[str, os.PathLike, bytes, bytearray, memoryview, BinaryIO]
+
+def read_image_bytes(image: ImageSource) -> Union[bytes, memoryview]:
+    """
+    Get the raw bytes of an image source without copying in-memory buffers
+
+    Args:
+        image: Path, bytes-like object or binary file object
+
+    Returns:
+        bytes or a memoryview over the caller's buffer
+    """
+    if isinstance(image, (bytes, memoryview)):
+        return image
+    if isinstance(image, bytearray):
+        return memoryview(image)
+    if isinstance(image, (str, os.PathLike)):
+        with open(image, "rb") as image_file:
+            return image_file.read()
+    image.seek(0)
+    return image.read()
+
+def open_image(image: ImageSource) -> "Image.Image":
+    """Open an image source with PIL (lazily, nothing is decoded yet)"""
+    from PIL import Image
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        return Image.open(io.BytesIO(image))
+    if isinstance(image, (str, os.PathLike)):
+        return Image.open(image)
+    image.seek(0)
+    return Image.open(image)
+
+def decode_image(image: ImageSource, min_side: int = 0) -> "Image.Image":
+    """
+    Decode image bytes once, applying the EXIF orientation from phone cameras
+
+    Args:
+        image: Encoded image source
+        min_side: If set, JPEGs may be decoded at a reduced scale as long as
+            both sides stay at least this large (much cheaper than resizing later)
+    """
+    from PIL import ImageOps
+
+    img = open_image(image)
+    if min_side and img.format == 'JPEG':
+        shorter = min(img.size)
+        if shorter > min_side:
+            ratio = min_side / shorter
+            img.draft(img.mode, (int(img.width * ratio), int(img.height * ratio)))
+    img = ImageOps.exif_transpose(img)
+    img.load()
+    return img
+
+def find_paper_bbox(img: "Image.Image", sample_side: int = 256) -> Tuple[int, int, int, int]:
+    """
+    Locate the bright paper region of a receipt photo
+
+    Works on a small grayscale thumbnail: pixels brighter than the midpoint
+    between the dark and light ends of the histogram count as paper. Columns
+    and rows are kept where the share of paper pixels is at least half of the
+    best column/row, so stray bright background (desks, walls) is ignored.
+
+    Returns:
+        (left, top, right, bottom) in full-resolution coordinates
+    """
+    from PIL import Image
+
+    thumb = img.copy()
+    thumb.thumbnail((sample_side, sample_side))
+    thumb = thumb.convert('L')
+
+    histogram = thumb.histogram()
+    total = sum(histogram)
+    low = _percentile(histogram, total, 0.10)
+    high = _percentile(histogram, total, 0.90)
+
+    full_box = (0, 0, img.width, img.height)
+    if high - low < 32:
+        # Not enough contrast to tell paper from background
+        return full_box
+
+    threshold = (low + high) // 2
+    mask = thumb.point(lambda p: 255 if p > threshold else 0)
+
+    # Box-resizing to a single row/column averages the mask along each axis
+    columns = list(mask.resize((mask.width, 1), Image.BOX).tobytes())
+    rows = list(mask.resize((1, mask.height), Image.BOX).tobytes())
+    left, right = _dense_span(columns)
+    top, bottom = _dense_span(rows)
+    if right <= left or bottom <= top:
+        return full_box
+
+    scale_x = img.width / thumb.width
+    scale_y = img.height / thumb.height
+    return (
+        int(left * scale_x),
+        int(top * scale_y),
+        min(img.width, int(round(right * scale_x))),
+        min(img.height, int(round(bottom * scale_y)))
+    )
+
+def _dense_span(profile: list) -> Tuple[int, int]:
+    """First and last (exclusive) index where the profile reaches half its peak"""
+    peak = max(profile)
+    if not peak:
+        return 0, 0
+    dense = [i for i, value in enumerate(profile) if value >= peak / 2]
+    return dense[0], dense[-1] + 1
+
+def _percentile(histogram: list, total: int, fraction: float) -> int:
+    running = 0
+    for value, count in enumerate(histogram):
+        running += count
+        if running >= total * fraction:
+            return value
+    return len(histogram) - 1
+
+def crop_to_paper(img: "Image.Image", margin: float = 0.02, min_area: float = 0.2) -> "Image.Image":
+    """
+    Crop away background around the receipt, keeping a small margin
+
+    The crop is skipped when the detected region is implausibly small.
+    """
+    left, top, right, bottom = find_paper_bbox(img)
+    area = (right - left) * (bottom - top)
+    if area < min_area * img.width * img.height:
+        return img
+
+    pad_x = int(img.width * margin)
+    pad_y = int(img.height * margin)
+    box = (
+        max(0, left - pad_x),
+        max(0, top - pad_y),
+        min(img.width, right + pad_x),
+        min(img.height, bottom + pad_y)
+    )
+    if box == (0, 0, img.width, img.height):
+        return img
+    return img.crop(box)
+
+def downscale_for_legibility(img: "Image.Image", target_width: int, max_side: int) -> "Image.Image":
+    """
+    Shrink to the smallest size that keeps printed line items readable
+
+    Receipt text is laid out across the paper width, so the width sets
+    legibility: anything wider than target_width is scaled down to it. The
+    long side is also capped at max_side, beyond which the vision API
+    downsamples anyway. Images are never upscaled.
+    """
+    from PIL import Image
+
+    scale = min(1.0, target_width / img.width, max_side / max(img.width, img.height))
+    if scale >= 1.0:
+        return img
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.resize(size, Image.LANCZOS)
+
+def encode_jpeg(img: "Image.Image", quality: int) -> bytes:
+    """Re-encode an image as an optimised JPEG"""
+    if img.mode not in ('L', 'RGB'):
+        img = img.convert('RGB')
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=quality, optimize=True)
+    return buffer.getvalue()
+
+def preprocessing_settings() -> Dict:
+    """VLM preprocessing settings from the environment"""
+    return {
+        "target_width": int(os.getenv("VLM_TARGET_WIDTH", "1024")),
+        "max_side": int(os.getenv("VLM_MAX_SIDE", "2048")),
+        "quality": int(os.getenv("VLM_JPEG_QUALITY", "80")),
+        "grayscale": os.getenv("VLM_GRAYSCALE", "true").lower() in ("1", "true", "yes"),
+        "crop": os.getenv("VLM_AUTOCROP", "true").lower() in ("1", "true", "yes"),
+        "tile_aspect": float(os.getenv("VLM_TILE_ASPECT", "3.0")),
+        "tile_overlap": float(os.getenv("VLM_TILE_OVERLAP", "0.15")),
+    }
+
+def _load_for_vlm(image_bytes: Union[bytes, memoryview], settings: Dict) -> Tuple["Image.Image", Dict]:
+    """Decode, crop and colour-convert an upload; returns the image and the size report"""
+    # Decode with 2x headroom over target_width so a receipt filling at least
+    # half the photo still has enough pixels after cropping
+    original_size = open_image(image_bytes).size
+    img = decode_image(image_bytes, min_side=2 * settings["target_width"])
+
+    if settings["crop"]:
+        img = crop_to_paper(img)
+    cropped_size = img.size
+
+    img = img.convert('L') if settings["grayscale"] else img.convert('RGB')
+    report = {
+        "original_bytes": len(image_bytes),
+        "original_size": list(original_size),
+        "cropped_size": list(cropped_size),
+    }
+    return img, report
+
+def _encode_for_vlm(img: "Image.Image", settings: Dict, report: Dict) -> Tuple[bytes, str, Dict]:
+    img = downscale_for_legibility(img, settings["target_width"], settings["max_side"])
+    encoded = encode_jpeg(img, settings["quality"])
+    detail = "low" if max(img.size) <= LOW_DETAIL_MAX_SIDE else "high"
+    report = {**report, "encoded_bytes": len(encoded), "final_size": list(img.size), "detail": detail}
+    return encoded, detail, report
+
+def prepare_image_for_vlm(image_bytes: Union[bytes, memoryview], settings: Dict = None) -> Tuple[bytes, str, Dict]:
+    """
+    Crop, downscale and re-encode a receipt photo for the vision model
+
+    Args:
+        image_bytes: Raw uploaded image bytes
+        settings: Overrides for preprocessing_settings()
+
+    Returns:
+        Tuple of (encoded bytes, detail level, report with before/after sizes)
+    """
+    settings = settings or preprocessing_settings()
+    img, report = _load_for_vlm(image_bytes, settings)
+    return _encode_whole(img, settings, report, image_bytes)
+
+def _encode_whole(img: "Image.Image", settings: Dict, report: Dict,
+                  image_bytes: Union[bytes, memoryview]) -> Tuple[bytes, str, Dict]:
+    encoded, detail, report = _encode_for_vlm(img, settings, report)
+
+    # Keep the original file if re-encoding didn't make it any smaller
+    # and the geometry is unchanged
+    original_size = tuple(report["original_size"])
+    if len(encoded) >= len(image_bytes) and tuple(report["final_size"]) in (original_size, original_size[::-1]):
+        encoded = image_bytes
+        report["encoded_bytes"] = len(encoded)
+    return encoded, detail, report
+
+def strip_bounds(height: int, strip_height: int, overlap: int) -> List[Tuple[int, int]]:
+    """
+    Top/bottom rows of evenly spaced horizontal strips covering height
+
+    Consecutive strips share at least overlap rows, so a line cut by one
+    strip's edge appears whole in its neighbour.
+    """
+    if height <= strip_height:
+        return [(0, height)]
+    count = math.ceil((height - overlap) / (strip_height - overlap))
+    step = (height - strip_height) / (count - 1)
+    return [(round(i * step), round(i * step) + strip_height) for i in range(count)]
+
+def prepare_strips_for_vlm(image_bytes: Union[bytes, memoryview], settings: Dict = None) -> List[Tuple[bytes, str, Dict]]:
+    """
+    Like prepare_image_for_vlm, but cut tall receipts into overlapping strips
+
+    A receipt taller than tile_aspect times its width (with 25% slack) is
+    split into strips of about that aspect ratio, overlapping by
+    tile_overlap of a strip, so every call sees a legible, bounded slice and
+    its reply stays well under the token limit. tile_aspect 0 disables
+    tiling.
+
+    Returns:
+        One (encoded bytes, detail level, report) per strip, top to bottom
+    """
+    settings = settings or preprocessing_settings()
+    aspect = settings.get("tile_aspect", 0)
+    img, report = _load_for_vlm(image_bytes, settings)
+    if not aspect or img.height <= img.width * aspect * 1.25:
+        return [_encode_whole(img, settings, report, image_bytes)]
+
+    strip_height = int(img.width * aspect)
+    overlap = int(strip_height * settings.get("tile_overlap", 0.15))
+    bounds = strip_bounds(img.height, strip_height, overlap)
+    strips = []
+    for index, (top, bottom) in enumerate(bounds):
+        strip_report = {**report, "strip": index, "strips": len(bounds), "rows": [top, bottom]}
+        strips.append(_encode_for_vlm(img.crop((0, top, img.width, bottom)), settings, strip_report))
+    return strips
@@ -1,5 +1,7 @@
 import re
-from typing import Dict
+from typing import Dict, Optional
+
+from .catalog import get_ingredient_catalog
 
 def clean_quantity_and_price(item: Dict) -> Dict:
     """
@@ -11,33 +13,133 @@ def clean_quantity_and_price(item: Dict) -> Dict:
     
     return item
 
+# Unit spelling -> (display form, base unit, amount of base unit per 1 unit)
+UNITS = {
+    'mg': ('mg', 'g', 0.001),
+    'g': ('g', 'g', 1.0),
+    'gram': ('g', 'g', 1.0),
+    'grams': ('g', 'g', 1.0),
+    'kg': ('kg', 'g', 1000.0),
+    'kilo': ('kg', 'g', 1000.0),
+    'kilos': ('kg', 'g', 1000.0),
+    'oz': ('oz', 'g', 28.3495),
+    'lb': ('lb', 'g', 453.592),
+    'lbs': ('lb', 'g', 453.592),
+    'ml': ('mL', 'mL', 1.0),
+    'cl': ('cL', 'mL', 10.0),
+    'l': ('L', 'mL', 1000.0),
+    'ltr': ('L', 'mL', 1000.0),
+    'litre': ('L', 'mL', 1000.0),
+    'litres': ('L', 'mL', 1000.0),
+    'pt': ('PT', 'mL', 568.261),
+    'pint': ('PT', 'mL', 568.261),
+    'pints': ('PT', 'mL', 568.261),
+    'x': ('x', 'each', 1.0),
+    'ea': ('ea', 'each', 1.0),
+    'each': ('each', 'each', 1.0),
+    'pc': ('pc', 'each', 1.0),
+    'pcs': ('pcs', 'each', 1.0),
+    'pack': ('pack', 'each', 1.0),
+    'packs': ('packs', 'each', 1.0),
+    'bag': ('bag', 'each', 1.0),
+    'bags': ('bags', 'each', 1.0),
+    'bottle': ('bottle', 'each', 1.0),
+    'bottles': ('bottles', 'each', 1.0),
+    'can': ('can', 'each', 1.0),
+    'cans': ('cans', 'each', 1.0),
+    'dozen': ('dozen', 'each', 12.0),
+}
+
+# One token per amount: a number, optional spacing and an optional unit that
+# isn't the start of a longer word (longest spellings first)
+QUANTITY_TOKEN = re.compile(
+    r'(?<![\d.,])(?P<number>\d+(?:[.,]\d+)?)(?P<space>\s*)(?:(?P<unit>'
+    + '|'.join(sorted(UNITS, key=len, reverse=True))
+    + r')(?![a-z]))?'
+)
+
+def normalize_quantity(quantity: str) -> Dict:
+    """
+    Parse a quantity into display text and numbers in one pass
+
+    Counts multiply a measure, so "2 x 500g" is 1000 g in total.
+
+    Returns:
+        Dict with 'display' (the standardized text), 'value' and 'unit' of
+        the measure (or count), the 'count' multiplier, and the total as
+        'base_amount' in 'base_unit' (g, mL or each). Numbers are None
+        when the text has no amount in it.
+    """
+    if not quantity or not quantity.strip():
+        return {"display": "1", "value": 1.0, "unit": None, "count": 1.0,
+                "base_amount": 1.0, "base_unit": "each"}
+
+    text = quantity.lower()
+    pieces = []
+    position = 0
+    count, count_unit, found = 1.0, None, False
+    measure = None
+
+    for match in QUANTITY_TOKEN.finditer(text):
+        found = True
+        number = float(match.group('number').replace(',', '.'))
+        unit = match.group('unit')
+        display, base_unit, factor = UNITS[unit] if unit else (None, 'each', 1.0)
+
+        pieces.append(text[position:match.start()])
+        pieces.append(match.group('number') + match.group('space') + (display or ''))
+        position = match.end()
+
+        if base_unit == 'each':
+            count *= number * factor
+            count_unit = (display if factor == 1.0 else 'each') if display else count_unit
+        elif measure is None:
+            measure = (number, display, base_unit, factor)
+
+    pieces.append(text[position:])
+    display_text = "".join(pieces).strip()
+
+    if not found:
+        return {"display": display_text, "value": None, "unit": None, "count": None,
+                "base_amount": None, "base_unit": None}
+    if measure is None:
+        return {"display": display_text, "value": count, "unit": count_unit, "count": 1.0,
+                "base_amount": count, "base_unit": "each"}
+
+    number, display, base_unit, factor = measure
+    return {
+        "display": display_text,
+        "value": number,
+        "unit": display,
+        "count": count,
+        "base_amount": round(count * number * factor, 4),
+        "base_unit": base_unit
+    }
+
 def standardize_quantity(quantity: str) -> str:
     """
     Standardize quantity formats
     """
-    if not quantity:
-        return "1"
-    
-    # Convert common abbreviations
-    replacements = {
-        'kg': 'kg',
-        'g': 'g', 
-        'lb': 'lb',
-        'oz': 'oz',
-        'pt': 'PT',
-        'l': 'L',
-        'ml': 'mL',
-        'pack': 'pack',
-        'bag': 'bag',
-        'bottle': 'bottle',
-        'can': 'can'
-    }
-    
-    quantity_lower = quantity.lower()
-    for old, new in replacements.items():
-        quantity_lower = quantity_lower.replace(old, new)
-    
-    return quantity_lower.strip()
+    return normalize_quantity(quantity)["display"]
+
+def unit_price(quantity: str, price: str) -> Optional[Dict]:
+    """
+    Price per kg, per litre or per item
+
+    Returns:
+        Dict with 'amount' and 'per' ("kg", "L" or "each"), or None if the
+        quantity or price can't be read
+    """
+    info = normalize_quantity(quantity)
+    try:
+        price_value = float(clean_price(price))
+    except ValueError:
+        return None
+    if not info["base_amount"]:
+        return None
+
+    per, scale = {"g": ("kg", 1000.0), "mL": ("L", 1000.0), "each": ("each", 1.0)}[info["base_unit"]]
+    return {"amount": round(price_value / info["base_amount"] * scale, 4), "per": per}
 
 def clean_price(price: str) -> str:
     """
@@ -59,26 +161,8 @@ def clean_price(price: str) -> str:
 def improve_ingredient_name(name: str) -> str:
     """
     Improve ingredient name formatting
+
+    Names close to an ingredient catalogue entry (including OCR-mangled
+    spellings) become its canonical name; anything else is title-cased.
     """
-    if not name:
-        return "Unknown Item"
-    
-    # Common corrections
-    corrections = {
-        'milk': 'Milk',
-        'bread': 'Bread',
-        'eggs': 'Eggs',
-        'butter': 'Butter',
-        'cheese': 'Cheese',
-        'chicken': 'Chicken',
-        'beef': 'Beef',
-        'rice': 'Rice',
-        'pasta': 'Pasta'
-    }
-    
-    name_lower = name.lower()
-    for key, value in corrections.items():
-        if key in name_lower:
-            return value
-    
-    return name.title()
+    return get_ingredient_catalog().canonical_name(name)
@@ -0,0 +1,126 @@
+import numpy as np
+from typing import Dict, List
+
+# Two boxes are on the same printed row when they share at least this
+# fraction of the shorter box's height
+ROW_OVERLAP = 0.5
+
+def box_extents(detections: List[Dict]) -> np.ndarray:
+    """
+    Axis-aligned extents of EasyOCR boxes
+
+    Args:
+        detections: Dicts with a 'bbox' of four [x, y] corner points
+
+    Returns:
+        (n, 4) array of left, top, right, bottom
+    """
+    corners = np.asarray([d['bbox'] for d in detections], dtype=np.float64).reshape(len(detections), 4, 2)
+    return np.column_stack((
+        corners[:, :, 0].min(axis=1),
+        corners[:, :, 1].min(axis=1),
+        corners[:, :, 0].max(axis=1),
+        corners[:, :, 1].max(axis=1),
+    ))
+
+def assign_rows(extents: np.ndarray, min_overlap: float = ROW_OVERLAP) -> np.ndarray:
+    """
+    Row number for each box
+
+    Boxes are ordered by vertical centre; a new row starts wherever a box
+    overlaps its predecessor by less than min_overlap of the shorter height.
+
+    Returns:
+        Array of row numbers (0 = top row), aligned with extents
+    """
+    if len(extents) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    top, bottom = extents[:, 1], extents[:, 3]
+    order = np.argsort((top + bottom) / 2, kind='stable')
+    top, bottom = top[order], bottom[order]
+
+    overlap = np.minimum(bottom[1:], bottom[:-1]) - np.maximum(top[1:], top[:-1])
+    shorter = np.minimum(bottom[1:] - top[1:], bottom[:-1] - top[:-1])
+    breaks = overlap < min_overlap * np.maximum(shorter, 1e-6)
+
+    rows = np.empty(len(extents), dtype=np.int64)
+    rows[order] = np.concatenate(([0], np.cumsum(breaks)))
+    return rows
+
+def group_rows(detections: List[Dict], min_overlap: float = ROW_OVERLAP) -> List[Dict]:
+    """
+    Merge EasyOCR detections into printed rows
+
+    An item name and its price are usually detected as separate boxes;
+    joining boxes that sit on the same row, left to right, gives the parser
+    whole receipt lines.
+
+    Args:
+        detections: Dicts with 'text', 'confidence' and a four-point 'bbox'
+        min_overlap: Vertical overlap needed to put two boxes on one row
+
+    Returns:
+        Rows top to bottom, each with the joined 'text', mean 'confidence',
+        lowest 'min_confidence', 'bbox' as [left, top, right, bottom], the
+        number of 'boxes' merged and the 'spans' they came from as
+        [text, left, right]
+    """
+    if not detections:
+        return []
+
+    extents = box_extents(detections)
+    rows = assign_rows(extents, min_overlap)
+    confidences = np.asarray([d['confidence'] for d in detections], dtype=np.float64)
+
+    # Group by row, then left to right within a row
+    order = np.lexsort((extents[:, 0], rows))
+    rows, extents, confidences = rows[order], extents[order], confidences[order]
+    starts = np.flatnonzero(np.concatenate(([True], rows[1:] != rows[:-1])))
+    counts = np.diff(np.append(starts, len(rows)))
+
+    lefts = np.minimum.reduceat(extents[:, 0], starts)
+    tops = np.minimum.reduceat(extents[:, 1], starts)
+    rights = np.maximum.reduceat(extents[:, 2], starts)
+    bottoms = np.maximum.reduceat(extents[:, 3], starts)
+    means = np.add.reduceat(confidences, starts) / counts
+    minimums = np.minimum.reduceat(confidences, starts)
+
+    texts = [detections[i]['text'] for i in order]
+    result = []
+    for index, (start, count) in enumerate(zip(starts, counts)):
+        result.append({
+            'text': " ".join(text for text in texts[start:start + count] if text),
+            'confidence': float(means[index]),
+            'min_confidence': float(minimums[index]),
+            'bbox': [float(lefts[index]), float(tops[index]), float(rights[index]), float(bottoms[index])],
+            'boxes': int(count),
+            'spans': [[texts[i], float(extents[i, 0]), float(extents[i, 2])]
+                      for i in range(start, start + count) if texts[i]]
+        })
+    return result
+
+def single_rows(detections: List[Dict]) -> List[Dict]:
+    """
+    Each EasyOCR detection as a row of its own, in group_rows' format
+
+    For callers that want the boxes unmerged but the same row fields
+    ('bbox' as [left, top, right, bottom], 'spans', ...), top to bottom.
+    """
+    if not detections:
+        return []
+
+    extents = box_extents(detections)
+    result = []
+    for index in np.argsort(extents[:, 1], kind='stable'):
+        left, top, right, bottom = (float(value) for value in extents[index])
+        detection = detections[index]
+        result.append({
+            'text': detection['text'],
+            'confidence': detection['confidence'],
+            'min_confidence': detection['confidence'],
+            'bbox': [left, top, right, bottom],
+            'boxes': 1,
+            'spans': [[detection['text'], left, right]] if detection['text'] else []
+        })
+    return result
@@ -0,0 +1,169 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Dict, Optional
+
+class AdaptiveLimiter:
+    """
+    AIMD limit on concurrent calls to a rate-limited API
+
+    A call that finishes in less than latency_tolerance x the baseline
+    latency, while the limit is in use, raises the limit by 1/limit. That
+    adds about one slot per limit's worth of calls (additive increase).
+    A 429, or a call slower than that, cuts the limit by backoff_ratio
+    (multiplicative decrease). A burst of throttled calls from the same
+    window only cuts it once.
+
+    A Retry-After on a 429 pauses every new call until it has passed.
+    Other errors say nothing about capacity and leave the limit alone.
+    Slots are granted in arrival order.
+    """
+
+    def __init__(self, initial: float = 8, min_limit: float = 1, max_limit: float = 8,
+                 backoff_ratio: float = 0.5, latency_tolerance: float = 3.0):
+        self.min_limit = max(1.0, float(min_limit))
+        self.max_limit = max(self.min_limit, float(max_limit))
+        self.limit = min(max(float(initial), self.min_limit), self.max_limit)
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+
+        self._waiters: deque = deque()
+        self._resume_at = 0.0
+        self._wake_handle: Optional[asyncio.TimerHandle] = None
+        self._smoothed: Optional[float] = None
+        self._baseline: Optional[float] = None
+        self._last_decrease = 0.0
+        self._counters = {"calls": 0, "queued": 0, "throttled": 0, "slow": 0, "decreases": 0, "paused_seconds": 0.0}
+
+    def _available(self) -> bool:
+        return self.in_flight < int(self.limit) and time.monotonic() >= self._resume_at
+
+    async def acquire(self):
+        """Wait for a slot"""
+        self._counters["calls"] += 1
+        if not self._waiters and self._available():
+            self.in_flight += 1
+            return
+
+        self._counters["queued"] += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._schedule_wake()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted as the waiter was cancelled; pass it on
+                self.in_flight -= 1
+                self._wake()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self, outcome: str = "ok", latency: Optional[float] = None,
+                retry_after: Optional[float] = None):
+        """
+        Give a slot back and adjust the limit
+
+        Args:
+            outcome: "ok", "throttled" (429) or "error"
+            latency: Seconds the call took (for "ok")
+            retry_after: Seconds the API asked callers to wait (for "throttled")
+        """
+        saturated = self.in_flight >= int(self.limit) or bool(self._waiters)
+        self.in_flight -= 1
+        now = time.monotonic()
+        if outcome == "throttled":
+            self._counters["throttled"] += 1
+            self._decrease(now)
+            if retry_after:
+                resume_at = now + retry_after
+                if resume_at > self._resume_at:
+                    self._counters["paused_seconds"] += resume_at - max(now, self._resume_at)
+                    self._resume_at = resume_at
+        elif outcome == "ok" and latency is not None:
+            self._observe(latency, now, saturated)
+        self._wake()
+
+    def _observe(self, latency: float, now: float, saturated: bool):
+        self._smoothed = latency if self._smoothed is None else 0.8 * self._smoothed + 0.2 * latency
+        if self._baseline is None or self._smoothed < self._baseline:
+            self._baseline = self._smoothed
+        else:
+            # Drift up slowly so a lasting change in the API's speed becomes the new normal
+            self._baseline += (self._smoothed - self._baseline) * 0.01
+
+        if self.latency_tolerance and self._smoothed > self._baseline * self.latency_tolerance:
+            self._counters["slow"] += 1
+            self._decrease(now)
+        elif saturated:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _decrease(self, now: float):
+        # Calls that were already in flight report the same congestion; count it once
+        window = max(self._smoothed or 0.0, 1.0)
+        if now - self._last_decrease < window:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+        self._counters["decreases"] += 1
+
+    def _wake(self):
+        """Grant free slots to waiters in arrival order"""
+        while self._waiters and self._available():
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(None)
+        self._schedule_wake()
+
+    def _schedule_wake(self):
+        """Make sure waiters held back by a Retry-After pause are woken when it ends"""
+        delay = self._resume_at - time.monotonic()
+        if not self._waiters or delay <= 0:
+            return
+        if self._wake_handle is not None and not self._wake_handle.cancelled():
+            self._wake_handle.cancel()
+        self._wake_handle = asyncio.get_running_loop().call_later(delay, self._wake)
+
+    def stats(self) -> Dict:
+        return {
+            "limit": round(self.limit, 2),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "paused_for": round(max(0.0, self._resume_at - time.monotonic()), 3),
+            "latency_seconds": round(self._smoothed, 4) if self._smoothed is not None else None,
+            "baseline_seconds": round(self._baseline, 4) if self._baseline is not None else None,
+            **{name: round(value, 3) for name, value in self._counters.items()}
+        }
+
+_vlm_limiter: Optional[AdaptiveLimiter] = None
+
+def get_vlm_limiter() -> AdaptiveLimiter:
+    """
+    Return the process-wide limiter in front of the vision API
+
+    Configured through VLM_MAX_CONCURRENCY (ceiling), VLM_MIN_CONCURRENCY,
+    VLM_INITIAL_CONCURRENCY (defaults to the ceiling) and
+    VLM_LATENCY_TOLERANCE (0 turns off the latency signal).
+    """
+    global _vlm_limiter
+    if _vlm_limiter is None:
+        max_limit = float(os.getenv("VLM_MAX_CONCURRENCY", "8"))
+        _vlm_limiter = AdaptiveLimiter(
+            initial=float(os.getenv("VLM_INITIAL_CONCURRENCY") or max_limit),
+            min_limit=float(os.getenv("VLM_MIN_CONCURRENCY", "1")),
+            max_limit=max_limit,
+            latency_tolerance=float(os.getenv("VLM_LATENCY_TOLERANCE", "3.0"))
+        )
+    return _vlm_limiter
+
+def reset_vlm_limiter():
+    """Drop the limiter (its waiters belong to an event loop that is going away)"""
+    global _vlm_limiter
+    _vlm_limiter = None
@@ -0,0 +1,206 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Seconds, from a fast parse up to a slow vision call
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Bytes, from a thumbnail to a full-resolution phone photo
+SIZE_BUCKETS = (1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 2.5e7)
+
+def _format_labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Counter:
+    """Monotonic counter, one series per combination of label values"""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values) -> float:
+        return self._values.get(label_values, 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+class Histogram:
+    """
+    Bucketed distribution, one series per combination of label values
+
+    An observation is a binary search and a locked increment, so it is
+    cheap enough to leave on for every request; buckets are only made
+    cumulative when scraped.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Iterable[float] = LATENCY_BUCKETS,
+                 labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket..., count above the last bucket, sum]
+        self._series: Dict[Tuple, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *label_values) -> int:
+        series = self._series.get(label_values)
+        return int(sum(series[:-1])) if series else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        lines = []
+        names = self.labels + ("le",)
+        for key, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+# A collector returns values read at scrape time from counters kept elsewhere:
+# (name, type, help, [(labels, value)]) with type "gauge" or "counter"
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]
+
+class Registry:
+    """Metrics and scrape-time collectors rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._collectors: Dict[str, Collector] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, buckets: Iterable[float] = LATENCY_BUCKETS,
+                  labels: Tuple[str, ...] = ()) -> Histogram:
+        return self._register(Histogram(name, help, buckets, labels))
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def add_collector(self, name: str, collector: Collector):
+        """Register (or replace) a function returning values at scrape time"""
+        with self._lock:
+            self._collectors[name] = collector
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.items())
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        for collector_name, collector in collectors:
+            try:
+                values = list(collector())
+            except Exception as e:
+                print(f"Metrics collector {collector_name} failed: {e}")
+                continue
+            for name, metric_type, help, samples in values:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    key = tuple(labels.values())
+                    lines.append(f"{name}{_format_labels(tuple(labels), key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "receipt_stage_seconds", "Time spent in each pipeline stage", labels=("stage",))
+STAGE_ERRORS = registry.counter(
+    "receipt_stage_errors_total", "Pipeline stages that raised", labels=("stage",))
+PAYLOAD_BYTES = registry.histogram(
+    "receipt_payload_bytes", "Size of uploads and of the images sent to the vision model",
+    buckets=SIZE_BUCKETS, labels=("kind",))
+VLM_REQUESTS = registry.counter(
+    "vlm_requests_total", "Vision model calls by outcome", labels=("outcome",))
+VLM_RETRIES = registry.counter(
+    "vlm_retries_total", "Vision model calls retried, by error kind", labels=("kind",))
+VLM_TOKENS = registry.counter(
+    "vlm_tokens_total", "Tokens used by vision model calls", labels=("kind",))
+JOBS = registry.counter(
+    "receipt_jobs_total", "Finished receipt jobs", labels=("method", "status"))
+SHEET_ROWS = registry.counter(
+    "sheet_rows_appended_total", "Rows appended to the spreadsheet")
+
+# Stages timed inside OCR worker processes; they are recorded from the
+# timings the job brings back instead of in the worker
+WORKER_STAGES = ("decode", "ocr", "parse", "infer")
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage and count it as an error if it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(1, name)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, name)
+
+def observe_timings(timings: Dict, stages: Iterable[str] = WORKER_STAGES):
+    """Record stage timings reported in extraction metadata"""
+    for name in stages:
+        seconds = timings.get(name)
+        if isinstance(seconds, (int, float)):
+            STAGE_SECONDS.observe(seconds, name)
+
+def record_usage(usage: Optional[object]):
+    """Count the prompt/completion tokens of an API response's usage block"""
+    if usage is None:
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        tokens = getattr(usage, kind, None)
+        if tokens:
+            VLM_TOKENS.inc(tokens, kind.split("_")[0])
+
+def get_metrics_registry() -> Registry:
+    """Return the process-wide metrics registry"""
+    return registry
@@ -1,61 +1,156 @@
-import easyocr
-from PIL import Image
 import numpy as np
+import os
+import threading
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
 
-def extract_text_from_image(image_path: str) -> list:
+from .imaging import ImageSource, crop_to_paper, decode_image
+from .layout import group_rows, single_rows
+
+# easyocr pulls in torch, so it is imported when the first reader is built
+if TYPE_CHECKING:
+    import easyocr
+
+# Process-wide EasyOCR readers, keyed by language set. Building a reader loads
+# the detection and recognition models, so each one is created once and reused.
+# Each entry carries its own lock because readtext isn't safe to run
+# concurrently on the same model.
+_readers: Dict[Tuple[str, ...], Tuple["easyocr.Reader", threading.Lock]] = {}
+_registry_lock = threading.Lock()
+
+def default_languages() -> Tuple[str, ...]:
+    """Language set configured through OCR_LANGUAGES (comma separated, default 'en')"""
+    raw = os.getenv("OCR_LANGUAGES", "en")
+    languages = [lang.strip() for lang in raw.split(",") if lang.strip()]
+    return _language_key(languages or ["en"])
+
+def _language_key(languages: Iterable[str]) -> Tuple[str, ...]:
+    return tuple(sorted(set(languages)))
+
+def get_reader(languages: Optional[Iterable[str]] = None) -> "easyocr.Reader":
     """
-    Extract text lines from receipt image using EasyOCR
+    Return the shared EasyOCR reader for a language set, loading it on first use
     
     Args:
-        image_path: Path to the receipt image
+        languages: Language codes for the reader, defaults to OCR_LANGUAGES
         
     Returns:
-        List of text lines detected in the image
+        A warm easyocr.Reader instance
+    """
+    return _get_entry(languages)[0]
+
+def _get_entry(languages: Optional[Iterable[str]] = None) -> Tuple["easyocr.Reader", threading.Lock]:
+    key = _language_key(languages) if languages else default_languages()
+    
+    entry = _readers.get(key)
+    if entry is not None:
+        return entry
+    
+    with _registry_lock:
+        # Another thread may have finished loading while we waited
+        entry = _readers.get(key)
+        if entry is None:
+            import easyocr
+            gpu = os.getenv("OCR_GPU", "false").lower() in ("1", "true", "yes")
+            entry = (easyocr.Reader(list(key), gpu=gpu), threading.Lock())
+            _readers[key] = entry
+    return entry
+
+def warm_readers(language_sets: Optional[Iterable[Iterable[str]]] = None) -> list:
+    """
+    Load readers ahead of time so the first request doesn't pay for model loading
+    
+    Args:
+        language_sets: Language sets to load, defaults to OCR_LANGUAGES
+        
+    Returns:
+        List of language keys that are loaded
+    """
+    for languages in (language_sets or [default_languages()]):
+        get_reader(languages)
+    return list(_readers.keys())
+
+def clear_readers():
+    """Drop all cached readers (frees model memory)"""
+    with _registry_lock:
+        _readers.clear()
+
+def read_text_lines(image: ImageSource, languages: Optional[Iterable[str]] = None,
+                    min_confidence: float = 0.5, merge_rows: bool = True) -> List[Dict]:
+    """
+    Detect text lines with their EasyOCR confidences
+    
+    Args:
+        image: Path, bytes/memoryview, file object or decoded array of the receipt image
+        languages: Language codes to read, defaults to OCR_LANGUAGES
+        min_confidence: Detections below this confidence are dropped
+        merge_rows: Join boxes on the same printed row (see layout.group_rows);
+            otherwise each box is a row of its own (layout.single_rows)
+        
+    Returns:
+        Rows sorted top to bottom in the same format either way: 'text',
+        'confidence', 'min_confidence', 'bbox' as [left, top, right, bottom],
+        'boxes' and 'spans'
     """
     try:
-        # Initialize EasyOCR reader
-        reader = easyocr.Reader(['en'])
+        reader, lock = _get_entry(languages)
         
-        # Read image and extract text
-        results = reader.readtext(image_path)
+        # EasyOCR takes paths and arrays; decode in-memory sources ourselves
+        if not isinstance(image, (str, os.PathLike, np.ndarray)):
+            image = np.asarray(decode_image(image).convert('RGB'))
+        
+        # Readers are shared between threads, so serialise calls per reader
+        with lock:
+            results = reader.readtext(image)
         
-        # Extract just the text strings, sorted by vertical position
         text_lines = []
         for (bbox, text, confidence) in results:
-            if confidence > 0.5:  # Filter out low-confidence detections
+            if confidence > min_confidence:  # Filter out low-confidence detections
                 text_lines.append({
                     'text': text.strip(),
-                    'confidence': confidence,
-                    'bbox': bbox
+                    'confidence': float(confidence),
+                    'bbox': [[float(x), float(y)] for x, y in bbox]
                 })
         
-        # Sort by y-coordinate (top to bottom)
-        text_lines.sort(key=lambda x: x['bbox'][0][1])
-        
-        # Return just the text strings
-        return [line['text'] for line in text_lines]
+        return group_rows(text_lines) if merge_rows else single_rows(text_lines)
         
     except Exception as e:
         print(f"OCR Error: {e}")
         return []
 
-def preprocess_image(image_path: str) -> str:
+def extract_text_from_image(image: ImageSource, languages: Optional[Iterable[str]] = None) -> list:
+    """
+    Extract text lines from receipt image using EasyOCR
+    
+    Args:
+        image: Path, bytes/memoryview, file object or decoded array of the receipt image
+        languages: Language codes to read, defaults to OCR_LANGUAGES
+        
+    Returns:
+        List of text lines detected in the image
+    """
+    return [line['text'] for line in read_text_lines(image, languages)]
+
+def preprocess_image(image: ImageSource) -> np.ndarray:
     """
     Optional: Preprocess image for better OCR results
+    
+    Returns:
+        Grayscale array ready for extract_text_from_image (kept in memory),
+        or the original image if preprocessing fails
     """
+    from PIL import ImageOps
+
     try:
-        img = Image.open(image_path)
+        img = decode_image(image)
         
-        # Convert to grayscale
-        img = img.convert('L')
+        # Crop to the paper and convert to grayscale
+        img = crop_to_paper(img).convert('L')
         
         # Enhance contrast if needed
-        # You can add more preprocessing here
+        img = ImageOps.autocontrast(img, cutoff=1)
         
-        processed_path = f"processed_{image_path}"
-        img.save(processed_path)
-        return processed_path
+        return np.asarray(img)
         
     except Exception as e:
         print(f"Preprocessing error: {e}")
-        return image_path
+        return image
@@ -1,61 +1,217 @@
 import re
 from datetime import datetime
-from typing import List, Dict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
 
-def parse_receipt_lines(text_lines: List[str]) -> List[Dict]:
+# Lines containing any of these (case-insensitive) are receipt headers/footers
+SKIP_KEYWORDS = [
+    'receipt', 'total', 'subtotal', 'tax', 'vat', 'change', 'cash', 'card',
+    'thank you', 'visit', 'store', 'phone', 'address', 'date', 'time',
+    'cashier', 'till', 'transaction', 'balance', 'discount'
+]
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """
+    Regex alternation for a word list, factored by common prefixes
+
+    'cash', 'cashier', 'card' become 'ca(?:rd|sh(?:ier)?)', so the regex
+    engine walks a trie instead of trying every word at each position.
+    """
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: Dict) -> str:
+        optional = '' in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if optional:
+            body = (body if len(branches) > 1 else '(?:' + body + ')') + '?'
+        return body
+
+    return build(trie)
+
+HEADER_FOOTER_PATTERN = re.compile(_trie_pattern(SKIP_KEYWORDS), re.IGNORECASE)
+
+# A line with its price at the end (£1.99, $2.50, 1.99, etc.): the lazy name
+# part makes the price the leftmost amount that runs to the end of the line
+PRICE_LINE_PATTERN = re.compile(r'(.*?)[\£\$]?(\d+\.\d{2})$', re.DOTALL)
+DIGITS = '0123456789'
+
+# Quantity tokens ("2 x", "500g", "2 PT", "6 pack"). When a line has several,
+# an "x" count wins over a unit and a unit over a pack size, wherever they
+# sit; the named groups tell the kinds apart in one pass
+QUANTITY_PATTERN = re.compile(
+    r'\d+\s*(?:(?P<times>x)\s*|(?P<unit>kg|g|lb|oz|pt|l|ml)|(?P<pack>pack|bag|bottle|can))',
+    re.IGNORECASE
+)
+
+PREFIX_PATTERN = re.compile(r'^(organic|fresh|free range|)\s*', re.IGNORECASE)
+SUFFIX_PATTERN = re.compile(r'\s*(ea|each)$', re.IGNORECASE)
+
+def parse_receipt_lines(text_lines: List[str], date: Optional[str] = None, template=None) -> List[Dict]:
     """
     Parse OCR text lines into structured ingredient data
     
     Args:
         text_lines: List of text lines from OCR
+        date: Date to stamp on the items, defaults to today
+        template: Store template (see store_templates) whose learned rules
+            are applied on top of the generic ones
         
     Returns:
         List of dictionaries with ingredient data
     """
+    current_date = date or datetime.now().strftime("%Y-%m-%d")
+    if template is not None:
+        items = []
+        for line in text_lines:
+            if is_header_footer(line, template):
+                continue
+            item = extract_item_from_line(line, current_date, template)
+            if item:
+                items.append(item)
+        return items
+
     items = []
-    current_date = datetime.now().strftime("%Y-%m-%d")
-    
+
     for line in text_lines:
-        # Skip empty lines and common receipt headers/footers
-        if not line.strip() or is_header_footer(line):
+        # Lines without a trailing price can't be items
+        split = split_price(line.strip())
+        if split is None:
             continue
-            
-        # Try to extract item data from line
-        item_data = extract_item_from_line(line, current_date)
-        if item_data:
-            items.append(item_data)
-    
+
+        # Headers/footers give None; keywords never contain digits, so
+        # checking the part before the price is the same as the whole line
+        parsed = _parse_item_text(split[0].strip())
+        if parsed is None:
+            continue
+
+        items.append({
+            "Date": current_date,
+            "Ingredient": parsed[0],
+            "Quantity": parsed[1],
+            "Price": split[1],
+            "Notes": ""
+        })
+
     return items
 
-def extract_item_from_line(line: str, date: str) -> Dict:
+def split_price(line: str) -> Optional[Tuple[str, str]]:
+    """
+    Split a stripped line into the text before its trailing price and the price
+
+    Same result as PRICE_LINE_PATTERN, but plain ASCII lines (nearly all OCR
+    output) are handled with string methods, which is several times faster.
+
+    Returns:
+        (item text, price) or None if the line doesn't end in a price
+    """
+    if not line.isascii():
+        match = PRICE_LINE_PATTERN.match(line)
+        return (match.group(1), match.group(2)) if match else None
+
+    if len(line) < 4 or line[-3] != '.' or not line[-2:].isdigit():
+        return None
+    head = line[:-3].rstrip(DIGITS)
+    if len(head) == len(line) - 3:
+        return None
+    price = line[len(head):]
+    if head.endswith('$'):
+        head = head[:-1]
+    return head, price
+
+def parse_receipts(receipts: Iterable[List[str]], date: Optional[str] = None,
+                   memo_size: int = 1_000_000) -> List[List[Dict]]:
+    """
+    Parse the lines of many receipts in one call
+
+    Meant for re-parsing an OCR archive. Lines repeat a lot across receipts
+    (headers, footers, regular purchases), so each distinct line is parsed
+    once and later copies cost a dict lookup.
+
+    Args:
+        receipts: One list of OCR lines per receipt
+        date: Date to stamp on the items, defaults to today
+        memo_size: Distinct lines remembered before the memo is reset
+
+    Returns:
+        One list of items per receipt, in input order
+    """
+    current_date = date or datetime.now().strftime("%Y-%m-%d")
+    memo: Dict[str, Optional[Tuple[str, str, str]]] = {}
+    results = []
+
+    for text_lines in receipts:
+        items = []
+        for line in text_lines:
+            parsed = memo.get(line, _MISSING)
+            if parsed is _MISSING:
+                if len(memo) >= memo_size:
+                    memo.clear()
+                parsed = memo[line] = parse_line(line)
+            if parsed is not None:
+                items.append({
+                    "Date": current_date,
+                    "Ingredient": parsed[0],
+                    "Quantity": parsed[1],
+                    "Price": parsed[2],
+                    "Notes": ""
+                })
+        results.append(items)
+
+    return results
+
+_MISSING = object()
+
+def parse_line(line: str) -> Optional[Tuple[str, str, str]]:
+    """
+    (name, quantity, price) for an item line, or None for anything else
+    """
+    split = split_price(line.strip())
+    if split is None:
+        return None
+    parsed = _parse_item_text(split[0].strip())
+    if parsed is None:
+        return None
+    return parsed[0], parsed[1], split[1]
+
+@lru_cache(maxsize=65536)
+def _parse_item_text(item_line: str) -> Optional[Tuple[str, str]]:
+    """(name, quantity) for the text before the price, or None for a header/footer"""
+    if HEADER_FOOTER_PATTERN.search(item_line):
+        return None
+    quantity = extract_quantity(item_line)
+    return clean_item_name(item_line, quantity), quantity
+
+def extract_item_from_line(line: str, date: str, template=None) -> Dict:
     """
     Extract item name, quantity, and price from a single line
+
+    A store template first strips the markers that store prints after its
+    prices (VAT codes and the like), which would otherwise hide the price.
     """
     line = line.strip()
-    
-    # Pattern to match price at end of line (£1.99, $2.50, 1.99, etc.)
-    price_pattern = r'[\£\$]?(\d+\.\d{2})$'
-    price_match = re.search(price_pattern, line)
-    
-    if not price_match:
+    if template is not None:
+        line = template.strip_line(line)
+    split = split_price(line)
+    if not split:
         return None
-    
-    price = price_match.group(1)
-    
-    # Remove price from line to get item name
-    item_line = line[:price_match.start()].strip()
-    
-    # Try to extract quantity (common patterns)
+
+    # Everything before the price is the item text
+    item_line = split[0].strip()
     quantity = extract_quantity(item_line)
-    
-    # Clean up item name
-    item_name = clean_item_name(item_line, quantity)
-    
+
     return {
         "Date": date,
-        "Ingredient": item_name,
+        "Ingredient": clean_item_name(item_line, quantity),
         "Quantity": quantity,
-        "Price": price,
+        "Price": split[1],
         "Notes": ""
     }
 
@@ -63,18 +219,15 @@ def extract_quantity(text: str) -> str:
     """
     Extract quantity from item text
     """
-    # Common quantity patterns
-    qty_patterns = [
-        r'(\d+)\s*x\s*',       # "2 x", "3x"
-        r'(\d+)\s*(kg|g|lb|oz|pt|l|ml)', # "2 kg", "500g", "2 PT"
-        r'(\d+)\s*(pack|bag|bottle|can)', # "1 pack", "2 bottles"
-    ]
-    
-    for pattern in qty_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
+    first = {}
+    for match in QUANTITY_PATTERN.finditer(text):
+        if match.lastgroup == 'times':
             return match.group(0).strip()
-    
+        first.setdefault(match.lastgroup, match)
+
+    for kind in ('unit', 'pack'):
+        if kind in first:
+            return first[kind].group(0).strip()
     return "1"  # Default quantity
 
 def clean_item_name(text: str, quantity: str) -> str:
@@ -85,23 +238,21 @@ def clean_item_name(text: str, quantity: str) -> str:
     clean_text = text.replace(quantity, "").strip()
     
     # Remove common prefixes/suffixes
-    clean_text = re.sub(r'^(organic|fresh|free range|)\s*', '', clean_text, flags=re.IGNORECASE)
-    clean_text = re.sub(r'\s*(ea|each)$', '', clean_text, flags=re.IGNORECASE)
+    clean_text = PREFIX_PATTERN.sub('', clean_text, count=1)
+    clean_text = SUFFIX_PATTERN.sub('', clean_text, count=1)
     
     # Capitalize properly
     clean_text = clean_text.title()
     
     return clean_text.strip()
 
-def is_header_footer(line: str) -> bool:
+def is_header_footer(line: str, template=None) -> bool:
     """
     Check if line is likely a header/footer and should be skipped
+
+    Besides the generic keywords, a store template skips the lines that
+    store's receipts were seen to print outside the item list.
     """
-    skip_keywords = [
-        'receipt', 'total', 'subtotal', 'tax', 'vat', 'change', 'cash', 'card',
-        'thank you', 'visit', 'store', 'phone', 'address', 'date', 'time',
-        'cashier', 'till', 'transaction', 'balance', 'discount'
-    ]
-    
-    line_lower = line.lower()
-    return any(keyword in line_lower for keyword in skip_keywords)
+    if HEADER_FOOTER_PATTERN.search(line) is not None:
+        return True
+    return template is not None and template.is_skip_line(line)
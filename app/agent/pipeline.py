@@ -0,0 +1,382 @@
+import asyncio
+import os
+import time
+from concurrent.futures import Executor
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from .catalog import canonicalize_items
+from .imaging import ImageSource, read_image_bytes
+from .routing import get_routing_stats, routing_threshold, score_local_result
+from .store_templates import compact_rows, get_template_store
+from .vlm import (
+    extract_prepared_async, extract_with_gpt4v_async, failure_metadata, partial_metadata, prepare_request
+)
+
+async def extract_receipt_vlm(image: ImageSource,
+                              on_item: Optional[Callable[[Dict], None]] = None) -> Tuple[List[Dict], Dict]:
+    """
+    Extract items from a receipt with the vision model
+
+    Args:
+        image: Path, bytes/memoryview or file object of the receipt image
+        on_item: Called with each item as it streams in
+
+    Returns:
+        Tuple of (items, extraction metadata)
+    """
+    if not os.getenv("OPENAI_API_KEY"):
+        return [], {
+            "method": "vlm",
+            "success": False,
+            "error": "OpenAI API key not configured"
+        }
+
+    # Item names are merged into the ingredient catalogue before anyone sees
+    # them, streamed or not; cached results are copied, never changed
+    def canonical_item(item: Dict):
+        on_item(canonicalize_items([item])[0])
+
+    start = time.perf_counter()
+    payload_report = {}
+    items = await extract_with_gpt4v_async(image, payload_report, canonical_item if on_item else None)
+    items = canonicalize_items(items)
+    timings = {"extract": round(time.perf_counter() - start, 4)}
+
+    if not items:
+        # Throttling that outlasted the retries is reported apart from hard failures
+        return [], {
+            "method": "vlm",
+            "success": False,
+            **failure_metadata(payload_report),
+            "payload": payload_report,
+            "timings": timings
+        }
+    # A reply cut off part way still shows its items, with a warning
+    partial = partial_metadata(payload_report)
+    return items, {
+        "method": "vlm",
+        "success": not partial,
+        "error": None,
+        **partial,
+        "payload": payload_report,
+        "timings": timings
+    }
+
+def ocr_receipt_lines(image_bytes: bytes) -> Tuple[List[Dict], Dict]:
+    """
+    Run EasyOCR over a receipt
+
+    Blocking and CPU heavy; meant to run in a worker process. Takes plain
+    bytes so it can be sent to another process.
+
+    Returns:
+        Tuple of (detected lines with confidences, timings)
+    """
+    # Imported here so the web process doesn't load torch unless it runs OCR itself
+    from .ocr import read_text_lines
+
+    start = time.perf_counter()
+    lines = read_text_lines(image_bytes)
+    return lines, {"ocr": round(time.perf_counter() - start, 4)}
+
+def parse_receipt_items(lines: List[Dict]) -> Tuple[List[Dict], Dict]:
+    """
+    Turn OCR lines into cleaned items and score the result
+
+    Receipts from a store with a learned template are parsed with that
+    store's rules; the rest with the generic parser. The rows are kept in
+    the "layout" metadata so the template can learn from the review.
+
+    Returns:
+        Tuple of (items, metadata with timings, the routing score and layout)
+    """
+    from .parser import parse_receipt_lines
+    from .infer import clean_quantity_and_price
+
+    timings = {}
+    start = time.perf_counter()
+    store = get_template_store()
+    store.reload_if_changed()
+    match = store.template_for(lines)
+    template = match[0] if match else None
+    if template is not None:
+        items = template.parse(lines)
+    else:
+        items = parse_receipt_lines([line["text"] for line in lines])
+    timings["parse"] = round(time.perf_counter() - start, 4)
+
+    start = time.perf_counter()
+    items = [clean_quantity_and_price(item) for item in items]
+    timings["infer"] = round(time.perf_counter() - start, 4)
+
+    routing = score_local_result(lines, items, template)
+    routing["store"] = template.store_id if template else None
+    layout = {
+        "store": template.store_id if template else None,
+        "store_score": match[1] if match else None,
+        "rows": compact_rows(lines)
+    }
+    return items, {"timings": timings, "routing": routing, "layout": layout}
+
+def local_metadata(items: List[Dict], timings: Dict, routing: Optional[Dict] = None,
+                   layout: Optional[Dict] = None) -> Dict:
+    """Extraction metadata for a local OCR result"""
+    metadata = {
+        "method": "ocr",
+        "success": True,
+        "error": None,
+        "timings": timings,
+        "routing": routing or {},
+        "layout": layout
+    }
+    if not items:
+        metadata.update({"success": False, "error": "OCR extraction failed - no items found"})
+    return metadata
+
+def extract_receipt_local(image_bytes: bytes) -> Tuple[List[Dict], Dict]:
+    """
+    Extract items with the local EasyOCR + parser + inference pipeline
+
+    Blocking and CPU heavy; meant to run in a worker process.
+
+    Returns:
+        Tuple of (items, extraction metadata including the routing score)
+    """
+    lines, timings = ocr_receipt_lines(image_bytes)
+    items, parsed = parse_receipt_items(lines)
+    timings.update(parsed["timings"])
+    return items, local_metadata(items, timings, parsed["routing"], parsed["layout"])
+
+async def extract_receipt_auto(image: ImageSource, ocr_executor: Optional[Executor] = None,
+                               filename: str = "") -> Tuple[List[Dict], Dict]:
+    """
+    Local-first extraction: run EasyOCR + parser, escalate to the VLM only
+    when the local result scores below ROUTING_THRESHOLD
+
+    The decision is recorded in the routing stats and in metadata["routing"];
+    metadata["method"] is the engine whose items were returned.
+
+    Args:
+        image: Path, bytes/memoryview or file object of the receipt image
+        ocr_executor: Executor for EasyOCR (a process pool); None runs it in a thread
+        filename: Name used when logging the decision
+
+    Returns:
+        Tuple of (items, extraction metadata)
+    """
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    image_bytes = bytes(await asyncio.to_thread(read_image_bytes, image))
+    items, metadata = await loop.run_in_executor(ocr_executor, extract_receipt_local, image_bytes)
+
+    routing = dict(metadata.get("routing") or {"score": 0.0})
+    routing["threshold"] = routing_threshold()
+    decision = "local"
+    if not items or routing["score"] < routing["threshold"]:
+        vlm_items, vlm_metadata = await extract_receipt_vlm(image_bytes)
+        if vlm_items:
+            decision = "vlm"
+            vlm_metadata["timings"] = {**metadata["timings"], **vlm_metadata.get("timings", {})}
+            # The OCR rows let the store template learn from the reviewed VLM items
+            vlm_metadata["layout"] = metadata.get("layout")
+            items, metadata = vlm_items, vlm_metadata
+        else:
+            # Keep whatever the local pipeline found
+            decision = "local_fallback"
+            routing["escalation_error"] = vlm_metadata.get("error")
+
+    routing["decision"] = decision
+    metadata["routing"] = routing
+    get_routing_stats().record(decision, routing["score"], time.perf_counter() - start, filename)
+    return items, metadata
+
+def warm_worker():
+    """Process-pool initializer: load the OCR models once per worker process"""
+    if os.getenv("OCR_WARMUP", "false").lower() in ("1", "true", "yes"):
+        from .ocr import warm_readers
+        warm_readers()
+
+def warm_ocr_worker(hold: float = 0.05) -> int:
+    """
+    Process-pool task: load the OCR models in this worker (if not yet) and return its pid
+
+    Holds the worker for a moment so the other warm tasks sent with it go
+    to the other workers.
+    """
+    from .ocr import warm_readers
+    warm_readers()
+    time.sleep(hold)
+    return os.getpid()
+
+async def _run_stage(inbox: asyncio.Queue, outbox: asyncio.Queue, workers: int,
+                     downstream_workers: int, handler: Callable[[Dict], Awaitable[None]]):
+    """
+    Run one pipeline stage with a fixed number of workers
+
+    Entries flow from inbox to outbox; None is the end-of-stream marker. An
+    entry that failed upstream is passed along untouched. Once every worker
+    has seen its marker, one marker per downstream worker is sent on.
+    """
+    async def worker():
+        while True:
+            entry = await inbox.get()
+            if entry is None:
+                return
+            if entry["metadata"].get("error") is None:
+                try:
+                    await handler(entry)
+                except Exception as e:
+                    entry["metadata"].update({"success": False, "error": f"Processing failed: {e}"})
+            await outbox.put(entry)
+
+    await asyncio.gather(*[worker() for _ in range(workers)])
+    for _ in range(downstream_workers):
+        await outbox.put(None)
+
+async def _receipt_stream(receipts: Union[Iterable, AsyncIterable]) -> AsyncIterator[Tuple[str, ImageSource]]:
+    """(filename, image) pairs from a plain or an async iterable"""
+    if hasattr(receipts, "__aiter__"):
+        async for receipt in receipts:
+            yield receipt
+    else:
+        for receipt in receipts:
+            yield receipt
+
+async def process_batch(receipts: Union[Iterable[Tuple[str, ImageSource]], AsyncIterable[Tuple[str, ImageSource]]],
+                        method: str = "vlm",
+                        decode_workers: Optional[int] = None,
+                        extract_concurrency: Optional[int] = None,
+                        queue_size: Optional[int] = None,
+                        ocr_executor: Optional[Executor] = None,
+                        on_result: Optional[Callable[[Dict], None]] = None,
+                        keep_results: bool = True) -> List[Dict]:
+    """
+    Extract many receipts as an overlapping three-stage pipeline
+
+    decode (read, hash, crop/resize/encode; threads) -> extract (vision calls
+    or EasyOCR in ocr_executor) -> parse (parse_receipt_items for OCR
+    output, canonicalize_items for vision output; threads). Stages are
+    connected by bounded queues, so decoding the next receipts overlaps
+    with waiting on the model for earlier ones while memory stays bounded.
+
+    Args:
+        receipts: (filename, image) pairs; an async iterable is consumed only
+            as fast as the pipeline takes receipts, so it can load them lazily
+        method: "vlm", "ocr" or "auto" (local first, see extract_receipt_auto)
+        decode_workers: Decode threads, defaults to BATCH_DECODE_WORKERS or the CPU count
+        extract_concurrency: Extractions in flight, defaults to BATCH_EXTRACT_CONCURRENCY
+        queue_size: Capacity of each inter-stage queue, defaults to BATCH_QUEUE_SIZE
+        ocr_executor: Executor for EasyOCR (a process pool); None runs it in threads
+        on_result: Called with each finished receipt, in completion order
+        keep_results: False returns an empty list instead, so a long stream
+            handled through on_result doesn't build up in memory
+
+    Returns:
+        One dict per receipt (filename, items, metadata) in input order
+    """
+    decode_workers = decode_workers or int(os.getenv("BATCH_DECODE_WORKERS", "0")) or os.cpu_count() or 2
+    extract_concurrency = extract_concurrency or int(os.getenv("BATCH_EXTRACT_CONCURRENCY", "8"))
+    queue_size = queue_size or int(os.getenv("BATCH_QUEUE_SIZE", "16"))
+    loop = asyncio.get_running_loop()
+
+    if method == "vlm" and not os.getenv("OPENAI_API_KEY"):
+        results = []
+        async for name, _ in _receipt_stream(receipts):
+            result = {"filename": name, "items": [], "metadata": {
+                "method": method, "success": False, "error": "OpenAI API key not configured"
+            }}
+            if keep_results:
+                results.append(result)
+            if on_result:
+                on_result(result)
+        return results
+
+    async def decode(entry: Dict):
+        start = time.perf_counter()
+        if method in ("ocr", "auto"):
+            entry["image_bytes"] = bytes(await asyncio.to_thread(read_image_bytes, entry["image"]))
+        else:
+            entry["request"] = await asyncio.to_thread(prepare_request, entry["image"])
+        entry["metadata"]["timings"]["decode"] = round(time.perf_counter() - start, 4)
+
+    async def extract(entry: Dict):
+        start = time.perf_counter()
+        if method == "auto":
+            items, metadata = await extract_receipt_auto(entry.pop("image_bytes"), ocr_executor, entry["filename"])
+            metadata["timings"].update(entry["metadata"]["timings"])
+            entry["items"] = items
+            entry["metadata"] = metadata
+        elif method == "ocr":
+            lines, timings = await loop.run_in_executor(ocr_executor, ocr_receipt_lines, entry.pop("image_bytes"))
+            entry["lines"] = lines
+            entry["metadata"]["timings"].update(timings)
+        else:
+            payload_report = {}
+            entry["items"] = await extract_prepared_async(entry.pop("request"), payload_report)
+            entry["metadata"]["payload"] = payload_report
+        entry["metadata"]["timings"]["extract"] = round(time.perf_counter() - start, 4)
+
+    async def parse(entry: Dict):
+        if method == "auto":
+            return
+        if method == "ocr":
+            items, parsed = await asyncio.to_thread(parse_receipt_items, entry.pop("lines"))
+            entry["items"] = items
+            entry["metadata"]["timings"].update(parsed["timings"])
+            entry["metadata"]["routing"] = parsed["routing"]
+            entry["metadata"]["layout"] = parsed["layout"]
+        else:
+            entry["items"] = await asyncio.to_thread(canonicalize_items, entry["items"])
+        if not entry["items"]:
+            if method == "ocr":
+                entry["metadata"].update({"success": False, "error": "OCR extraction failed - no items found"})
+            else:
+                entry["metadata"].update({"success": False, **failure_metadata(entry["metadata"]["payload"])})
+        elif method == "vlm" and partial_metadata(entry["metadata"]["payload"]):
+            entry["metadata"].update({"success": False, **partial_metadata(entry["metadata"]["payload"])})
+
+    decode_queue = asyncio.Queue(maxsize=queue_size)
+    extract_queue = asyncio.Queue(maxsize=queue_size)
+    parse_queue = asyncio.Queue(maxsize=queue_size)
+    done_queue = asyncio.Queue(maxsize=queue_size)
+    results: List[Optional[Dict]] = []
+
+    async def feed():
+        index = 0
+        async for filename, image in _receipt_stream(receipts):
+            if keep_results:
+                results.append(None)
+            await decode_queue.put({
+                "index": index,
+                "filename": filename,
+                "image": image,
+                "items": [],
+                "metadata": {"method": method, "success": True, "error": None, "timings": {}}
+            })
+            index += 1
+        for _ in range(decode_workers):
+            await decode_queue.put(None)
+
+    async def collect():
+        while True:
+            entry = await done_queue.get()
+            if entry is None:
+                return
+            result = {
+                "filename": entry["filename"],
+                "items": entry["items"],
+                "metadata": entry["metadata"]
+            }
+            if keep_results:
+                results[entry["index"]] = result
+            if on_result:
+                on_result(result)
+
+    await asyncio.gather(
+        feed(),
+        _run_stage(decode_queue, extract_queue, decode_workers, extract_concurrency, decode),
+        _run_stage(extract_queue, parse_queue, extract_concurrency, 1, extract),
+        _run_stage(parse_queue, done_queue, 1, 1, parse),
+        collect(),
+    )
+    return results
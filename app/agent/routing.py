@@ -0,0 +1,145 @@
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from .parser import is_header_footer
+
+# A price-like amount anywhere in a line
+AMOUNT_PATTERN = re.compile(r'[\£\$€]?(\d+\.\d{2})\b')
+TOTAL_PATTERN = re.compile(r'\b(grand\s+total|total|balance\s+due|amount\s+due)\b', re.IGNORECASE)
+
+def routing_threshold() -> float:
+    """Minimum local confidence score to skip the VLM (ROUTING_THRESHOLD, default 0.75)"""
+    return float(os.getenv("ROUTING_THRESHOLD", "0.75"))
+
+def find_receipt_total(lines: List[str]) -> Optional[float]:
+    """
+    Find the printed receipt total
+
+    Takes the last line mentioning a total (but not a subtotal) that carries
+    an amount, since totals are printed below the items.
+
+    Returns:
+        The total, or None if no total line was recognised
+    """
+    total = None
+    for line in lines:
+        if 'subtotal' in line.lower() or not TOTAL_PATTERN.search(line):
+            continue
+        amounts = AMOUNT_PATTERN.findall(line)
+        if amounts:
+            total = float(amounts[-1])
+    return total
+
+def score_local_result(ocr_lines: List[Dict], items: List[Dict], template=None) -> Dict:
+    """
+    Score how far the local OCR + parser result can be trusted
+
+    Three signals, each between 0 and 1:
+        ocr_confidence: mean EasyOCR confidence of the detected lines
+        parse_coverage: share of item-like lines (non header/footer lines
+            with an amount) that parsed into items
+        total_match: 1 if the item prices add up to the printed total, 0 if
+            they don't, 0.5 if no total was found
+
+    Args:
+        ocr_lines: Detections from read_text_lines ({'text', 'confidence'})
+        items: Items parsed from those lines
+        template: Store template used for parsing; lines it skips don't
+            count against coverage
+
+    Returns:
+        Dict with the overall score (weighted 0.4/0.3/0.3) and each signal
+    """
+    texts = [line['text'] for line in ocr_lines]
+    if not items:
+        return {"score": 0.0, "ocr_confidence": 0.0, "parse_coverage": 0.0,
+                "total_match": 0.0, "total": find_receipt_total(texts), "items_total": 0.0}
+
+    ocr_confidence = sum(line['confidence'] for line in ocr_lines) / len(ocr_lines) if ocr_lines else 0.0
+
+    candidates = [text for text in texts if AMOUNT_PATTERN.search(text) and not is_header_footer(text, template)]
+    parse_coverage = min(1.0, len(items) / len(candidates)) if candidates else 0.0
+
+    items_total = 0.0
+    for item in items:
+        try:
+            items_total += float(item.get('Price') or 0)
+        except ValueError:
+            pass
+    total = find_receipt_total(texts)
+    if total is None:
+        total_match = 0.5
+    else:
+        total_match = 1.0 if abs(items_total - total) <= max(0.01, total * 0.01) else 0.0
+
+    score = 0.4 * ocr_confidence + 0.3 * parse_coverage + 0.3 * total_match
+    return {
+        "score": round(score, 4),
+        "ocr_confidence": round(ocr_confidence, 4),
+        "parse_coverage": round(parse_coverage, 4),
+        "total_match": total_match,
+        "total": total,
+        "items_total": round(items_total, 2)
+    }
+
+class RoutingStats:
+    """
+    Counters for local-first routing decisions
+
+    Each decision is "local" (local result accepted), "vlm" (escalated to
+    the vision model) or "local_fallback" (escalation failed, local result
+    kept). Every receipt kept local saves one vision call, priced at
+    VLM_COST_PER_RECEIPT for the savings estimate.
+    """
+
+    def __init__(self, cost_per_call: float = 0.01, history_size: int = 200):
+        self.cost_per_call = cost_per_call
+        self._decisions = {"local": 0, "vlm": 0, "local_fallback": 0}
+        self._latencies = {decision: deque(maxlen=history_size) for decision in self._decisions}
+        self._recent = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+
+    def record(self, decision: str, score: float, seconds: float, filename: str = ""):
+        """Record one routing decision and log it"""
+        with self._lock:
+            self._decisions[decision] += 1
+            self._latencies[decision].append(seconds)
+            self._recent.append({
+                "filename": filename,
+                "decision": decision,
+                "score": score,
+                "seconds": round(seconds, 4),
+                "at": time.time()
+            })
+        print(f"Routing {filename or 'receipt'}: score {score:.2f} -> {decision} ({seconds:.2f}s)")
+
+    def stats(self) -> Dict:
+        """Decision counts, per-decision median latency and estimated savings"""
+        with self._lock:
+            total = sum(self._decisions.values())
+            medians = {}
+            for decision, values in self._latencies.items():
+                ordered = sorted(values)
+                medians[decision] = round(ordered[len(ordered) // 2], 4) if ordered else 0.0
+            return {
+                "threshold": routing_threshold(),
+                "decisions": dict(self._decisions),
+                "local_rate": round(self._decisions["local"] / total, 4) if total else 0.0,
+                "median_seconds": medians,
+                "vlm_calls_saved": self._decisions["local"],
+                "estimated_savings": round(self._decisions["local"] * self.cost_per_call, 4),
+                "recent": list(self._recent)[-20:]
+            }
+
+_routing_stats: Optional[RoutingStats] = None
+
+def get_routing_stats() -> RoutingStats:
+    """Return the process-wide routing counters"""
+    global _routing_stats
+    if _routing_stats is None:
+        _routing_stats = RoutingStats(cost_per_call=float(os.getenv("VLM_COST_PER_RECEIPT", "0.01")))
+    return _routing_stats
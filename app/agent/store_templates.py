@@ -0,0 +1,499 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from statistics import median
+from typing import Dict, List, Optional, Tuple
+
+from .parser import is_header_footer, parse_receipt_lines
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves are only serialised within one process
+    fcntl = None
+
+# Header words that identify a store: letters only, so dates, times and
+# transaction numbers never end up in a fingerprint
+HEADER_WORD = re.compile(r'[a-z]{3,}')
+HEADER_ROWS = 6
+# Words many stores print near the top, which say nothing about which store it is
+GENERIC_WORDS = {
+    "the", "and", "ltd", "limited", "plc", "inc", "store", "stores", "shop", "supermarket",
+    "supermarkets", "superstore", "express", "extra", "metro", "local", "welcome", "receipt",
+    "road", "street", "lane", "avenue", "tel", "phone", "vat", "reg", "www", "com",
+}
+
+AMOUNT_PATTERN = re.compile(r'[\£\$€]?(\d+\.\d{2})')
+# Short codes some stores print after a price ("2.10 A", "0.85 *")
+MARKER_PATTERN = re.compile(r'^[A-Za-z*#]{1,2}$')
+DIGIT_RUN = re.compile(r'\d+')
+NON_SHAPE = re.compile(r'[^a-z#.]+')
+
+# Spans starting this far (as a fraction of receipt width) left of the
+# learned price column still count as part of the row
+COLUMN_TOLERANCE = 0.01
+
+def line_shape(line: str) -> str:
+    """
+    Line with every number collapsed to '#', so "POINTS 120 0.00" and
+    "POINTS 95 0.00" share the shape "points # #.#"
+    """
+    shape = DIGIT_RUN.sub('#', line.lower())
+    return " ".join(NON_SHAPE.sub(' ', shape).split())
+
+def row_spans(row: Dict) -> List[List]:
+    """[text, left, right] boxes of a row, falling back to the row's bbox"""
+    spans = row.get('spans')
+    if spans:
+        return spans
+    bbox = row.get('bbox') or [0.0, 0.0, 0.0, 0.0]
+    return [[row['text'], bbox[0], bbox[2]]]
+
+def receipt_extent(rows: List[Dict]) -> Tuple[float, float]:
+    """(left edge, width) of the printed area, for relative positions"""
+    lefts, rights = [], []
+    for row in rows:
+        for _, left, right in row_spans(row):
+            lefts.append(left)
+            rights.append(right)
+    if not lefts:
+        return 0.0, 1.0
+    return min(lefts), max(max(rights) - min(lefts), 1e-6)
+
+def header_rows(rows: List[Dict]) -> List[Dict]:
+    """Rows above the first line carrying an amount (at most HEADER_ROWS)"""
+    header = []
+    for row in rows[:HEADER_ROWS]:
+        if AMOUNT_PATTERN.search(row['text']):
+            break
+        header.append(row)
+    return header
+
+def store_words(text: str) -> set:
+    """Words of a line that could name a store"""
+    return set(HEADER_WORD.findall(text.lower())) - GENERIC_WORDS
+
+def header_tokens(rows: List[Dict]) -> set:
+    """Store-naming words printed anywhere in the receipt header"""
+    return {word for row in header_rows(rows) for word in store_words(row['text'])}
+
+def name_tokens(rows: List[Dict]) -> set:
+    """
+    Words of the store-name row: the first header row with a store-naming word
+
+    Only this row goes into a fingerprint. Address and contact lines below
+    it share too many words between stores ("London Road", "VAT Reg").
+    """
+    for row in header_rows(rows):
+        words = store_words(row['text'])
+        if words:
+            return words
+    return set()
+
+def price_position(row: Dict, left: float, width: float) -> Optional[float]:
+    """Relative right edge of the rightmost box in a row that holds an amount"""
+    positions = [(right - left) / width for text, _, right in row_spans(row) if AMOUNT_PATTERN.search(text)]
+    return max(positions) if positions else None
+
+def price_column(rows: List[Dict]) -> Optional[float]:
+    """Median relative position of the prices on a receipt"""
+    left, width = receipt_extent(rows)
+    positions = [p for p in (price_position(row, left, width) for row in rows) if p is not None]
+    return median(positions) if positions else None
+
+def compact_rows(rows: List[Dict]) -> List[Dict]:
+    """Just the text and boxes of OCR rows, for keeping with a job until review"""
+    return [{"text": row['text'], "spans": row_spans(row)} for row in rows]
+
+class StoreTemplate:
+    """
+    What has been learned about one store's receipts
+
+    fingerprint: words of the store-name row seen on at least half the
+        store's receipts
+    skip_shapes: shapes of priced lines that were never approved as items
+        (loyalty points, savings, totals in the store's own wording)
+    markers: codes the store prints after prices
+    price_column: where prices sit, as a fraction of the receipt width;
+        boxes further right (a separate VAT code column) are dropped
+    """
+
+    def __init__(self, store_id: str, name: str, receipts: int = 0,
+                 name_tokens: Optional[Dict] = None, skip_shapes: Optional[Dict] = None,
+                 item_shapes: Optional[Dict] = None, markers: Optional[Dict] = None,
+                 price_column: Optional[float] = None):
+        self.store_id = store_id
+        self.name = name
+        self.receipts = receipts
+        self.name_tokens = Counter(name_tokens or {})
+        self.skip_shapes = Counter(skip_shapes or {})
+        self.item_shapes = Counter(item_shapes or {})
+        self.markers = Counter(markers or {})
+        self.price_column = price_column
+        self._marker_pattern = None
+        self._compile()
+
+    def _compile(self):
+        if self.markers:
+            codes = "|".join(re.escape(code) for code in sorted(self.markers, key=len, reverse=True))
+            self._marker_pattern = re.compile(r'(\d\.\d{2})\s+(?:' + codes + r')$', re.IGNORECASE)
+        else:
+            self._marker_pattern = None
+
+    def fingerprint(self) -> set:
+        """Store-name words common to this store's receipts"""
+        needed = max(1, self.receipts / 2)
+        return {token for token, count in self.name_tokens.items() if count >= needed}
+
+    def is_skip_line(self, line: str) -> bool:
+        """True for lines this store prints outside its item list"""
+        shape = line_shape(line)
+        return self.skip_shapes.get(shape, 0) > self.item_shapes.get(shape, 0)
+
+    def strip_line(self, line: str) -> str:
+        """Line without the code printed after its price"""
+        if self._marker_pattern is None:
+            return line
+        return self._marker_pattern.sub(r'\1', line)
+
+    def row_line(self, row: Dict, left: float, width: float) -> str:
+        """Row text without the boxes printed right of the price column"""
+        spans = row_spans(row)
+        if self.price_column is None or len(spans) < 2:
+            return row['text']
+        limit = self.price_column - COLUMN_TOLERANCE
+        kept = [text for text, span_left, _ in spans
+                if (span_left - left) / width <= limit or AMOUNT_PATTERN.search(text)]
+        return " ".join(kept)
+
+    def parse(self, rows: List[Dict], date: Optional[str] = None) -> List[Dict]:
+        """Parse OCR rows from this store's receipt"""
+        left, width = receipt_extent(rows)
+        return parse_receipt_lines([self.row_line(row, left, width) for row in rows], date, self)
+
+    def learn(self, rows: List[Dict], items: List[Dict]) -> int:
+        """
+        Update the template from a receipt's OCR rows and its approved items
+
+        Rows are paired with items by price, top to bottom. Paired rows give
+        the price column and the codes printed after prices; priced rows
+        left unpaired become skip rules.
+
+        Returns:
+            Number of rows paired with an item
+        """
+        prices = Counter()
+        for item in items:
+            try:
+                prices[f"{float(str(item.get('Price', '')).lstrip('£$€')):.2f}"] += 1
+            except ValueError:
+                continue
+
+        left, width = receipt_extent(rows)
+        positions, markers, paired = [], Counter(), []
+        unpaired = []
+        for row in rows:
+            text = row['text'].strip()
+            amounts = list(AMOUNT_PATTERN.finditer(text))
+            if not amounts:
+                continue
+            match = amounts[-1]
+            if prices[match.group(1)] > 0 and not is_header_footer(text):
+                prices[match.group(1)] -= 1
+                paired.append(row)
+                position = price_position(row, left, width)
+                if position is not None:
+                    positions.append(position)
+                tail = text[match.end():].strip()
+                if MARKER_PATTERN.match(tail):
+                    markers[tail.upper()] += 1
+            else:
+                unpaired.append(row)
+
+        if not paired:
+            return 0
+
+        self.receipts += 1
+        self.name_tokens.update(name_tokens(rows))
+        self.markers.update(markers)
+        self._compile()
+        if positions:
+            column = median(positions)
+            # Running mean over receipts, so one skewed photo doesn't move it far
+            self.price_column = column if self.price_column is None else \
+                self.price_column + (column - self.price_column) / self.receipts
+
+        self.item_shapes.update(line_shape(self.row_line(row, left, width)) for row in paired)
+        self.skip_shapes.update(line_shape(self.row_line(row, left, width)) for row in unpaired)
+        return len(paired)
+
+    def to_dict(self) -> Dict:
+        return {
+            "store_id": self.store_id,
+            "name": self.name,
+            "receipts": self.receipts,
+            "name_tokens": dict(self.name_tokens),
+            "skip_shapes": dict(self.skip_shapes),
+            "item_shapes": dict(self.item_shapes),
+            "markers": dict(self.markers),
+            "price_column": self.price_column
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "StoreTemplate":
+        data = dict(data)
+        if "header_tokens" in data:
+            # Saved before fingerprints were cut down to the store-name row
+            del data["header_tokens"]
+            data["name_tokens"] = {word: data.get("receipts", 1) for word in store_words(data["name"])}
+        return cls(**data)
+
+class TemplateStore:
+    """
+    Store templates keyed by store id, persisted as JSON
+
+    Receipts are matched to a store by how well their store-name row
+    agrees with its fingerprint (weighted 0.8) and how close their price
+    column is to the learned one (0.2). Words are weighted by how few
+    stores use them, so a word two stores share counts for little.
+
+    Several processes may learn into the same file: learn_and_save holds a
+    lock file from re-reading the templates to writing them back, so what
+    another process learned in between is kept.
+    """
+
+    def __init__(self, path: Optional[str] = None, threshold: float = 0.6, min_receipts: int = 1):
+        self.path = path
+        self.threshold = threshold
+        self.min_receipts = min_receipts
+        self._templates: Dict[str, StoreTemplate] = {}
+        self._mtime: Optional[float] = None
+        # Submissions learn in threadpool threads while others identify and save
+        self._lock = threading.RLock()
+        self.reload_if_changed()
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def get(self, store_id: str) -> Optional[StoreTemplate]:
+        return self._templates.get(store_id)
+
+    def reload_if_changed(self) -> bool:
+        """
+        Re-read the file if another process saved it since it was loaded
+
+        OCR runs in worker processes, which only see what the web process
+        learns through the file.
+
+        Returns:
+            True if templates were (re)loaded
+        """
+        if not self.path or not os.path.exists(self.path):
+            return False
+        if os.path.getmtime(self.path) == self._mtime:
+            return False
+        return self._load()
+
+    def _load(self) -> bool:
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.path)
+                with open(self.path, "r", encoding="utf-8") as f:
+                    entries = json.load(f)
+            except FileNotFoundError:
+                return False
+            except (OSError, ValueError) as e:
+                print(f"Store template load error: {e}")
+                return False
+            self._templates = {entry["store_id"]: StoreTemplate.from_dict(entry) for entry in entries}
+            self._mtime = mtime
+        return True
+
+    @contextmanager
+    def _file_lock(self):
+        """Hold the store's lock file, shared by every process using the path"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{self.path}.lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(self):
+        """Write all templates (atomically) to the store's path"""
+        if not self.path:
+            return
+        with self._lock, self._file_lock():
+            self._write()
+
+    def _write(self):
+        payload = json.dumps([template.to_dict() for template in self._templates.values()], indent=2)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.path.getmtime(self.path)
+
+    def learn_and_save(self, rows: List[Dict], items: List[Dict]) -> Optional[StoreTemplate]:
+        """
+        Learn from a receipt on top of the latest saved templates and save them
+
+        The file is re-read under the lock file (whatever its mtime), so
+        templates learned by other processes since it was loaded aren't
+        overwritten.
+        """
+        if not self.path:
+            return self.learn(rows, items)
+        with self._lock, self._file_lock():
+            self._load()
+            template = self.learn(rows, items)
+            if template is not None:
+                self._write()
+            return template
+
+    def identify(self, rows: List[Dict]) -> Optional[Tuple[StoreTemplate, float]]:
+        """
+        Find the store a receipt comes from
+
+        Returns:
+            (template, match score) or None if no store matches well enough
+        """
+        tokens = header_tokens(rows)
+        if not tokens:
+            return None
+        name = name_tokens(rows)
+        column = price_column(rows)
+
+        with self._lock:
+            fingerprints = [(template, template.fingerprint()) for template in self._templates.values()]
+        stores = Counter(token for _, fingerprint in fingerprints for token in fingerprint)
+
+        def weight(words: set) -> float:
+            # Inverse store frequency: a word in every store's name is worth a fraction of a unique one
+            return sum(math.log(1 + len(fingerprints) / stores.get(word, 1)) for word in words)
+
+        best, best_score = None, 0.0
+        for template, fingerprint in fingerprints:
+            if not fingerprint:
+                continue
+            # The fingerprint may be found anywhere in the header (the name row can be
+            # misread), but name-row words the store never prints count against it
+            text_score = weight(tokens & fingerprint) / weight(fingerprint | name)
+            if template.price_column is None or column is None:
+                # Nothing to compare; neither for nor against
+                layout_score = 0.5
+            else:
+                layout_score = max(0.0, 1.0 - abs(column - template.price_column) / 0.25)
+            score = 0.8 * text_score + 0.2 * layout_score
+            if score > best_score:
+                best, best_score = template, score
+
+        if best is None or best_score < self.threshold:
+            return None
+        return best, round(best_score, 4)
+
+    def template_for(self, rows: List[Dict]) -> Optional[Tuple[StoreTemplate, float]]:
+        """Like identify, but only templates learned from enough receipts"""
+        match = self.identify(rows)
+        if match is None or match[0].receipts < self.min_receipts:
+            return None
+        return match
+
+    def learn(self, rows: List[Dict], items: List[Dict]) -> Optional[StoreTemplate]:
+        """
+        Update (or start) the template for a receipt's store from approved items
+
+        Returns:
+            The template, or None if the receipt had no header or no row
+            could be paired with an item
+        """
+        if not rows or not items:
+            return None
+        with self._lock:
+            match = self.identify(rows)
+            if match is not None:
+                template = match[0]
+                template.learn(rows, items)
+                return template
+
+            name_row = next((row for row in header_rows(rows) if store_words(row['text'])), None)
+            if name_row is None:
+                return None
+            name = name_row['text'].strip()
+            template = StoreTemplate(self._new_id(name), name)
+            if not template.learn(rows, items):
+                return None
+            self._templates[template.store_id] = template
+            return template
+
+    def _new_id(self, name: str) -> str:
+        base = "-".join(HEADER_WORD.findall(name.lower())) or "store"
+        store_id, suffix = base, 2
+        while store_id in self._templates:
+            store_id = f"{base}-{suffix}"
+            suffix += 1
+        return store_id
+
+    def stats(self) -> Dict:
+        """Known stores and how much has been learned about each"""
+        with self._lock:
+            templates = list(self._templates.values())
+        return {
+            "stores": len(templates),
+            "threshold": self.threshold,
+            "min_receipts": self.min_receipts,
+            "templates": [
+                {
+                    "store_id": template.store_id,
+                    "name": template.name,
+                    "receipts": template.receipts,
+                    "fingerprint": sorted(template.fingerprint()),
+                    "skip_rules": sum(1 for shape in template.skip_shapes if template.is_skip_line(shape)),
+                    "markers": sorted(template.markers),
+                    "price_column": round(template.price_column, 3) if template.price_column is not None else None
+                }
+                for template in templates
+            ]
+        }
+
+def learn_from_submission(layout: Optional[Dict], items: List[Dict]) -> Optional[StoreTemplate]:
+    """
+    Update the store templates from a reviewed receipt and save them
+
+    Args:
+        layout: The OCR rows kept with the job (metadata["layout"])
+        items: Items the user approved
+    """
+    if not layout or not layout.get("rows"):
+        return None
+    return get_template_store().learn_and_save(layout["rows"], items)
+
+_template_store: Optional[TemplateStore] = None
+_template_store_lock = threading.Lock()
+
+def get_template_store() -> TemplateStore:
+    """
+    Return the process-wide store templates
+
+    Kept at STORE_TEMPLATES_PATH. STORE_MATCH_THRESHOLD is the minimum
+    fingerprint score and STORE_TEMPLATE_MIN_RECEIPTS the number of
+    approved receipts before a template is used for parsing.
+    """
+    global _template_store
+    if _template_store is None:
+        with _template_store_lock:
+            if _template_store is None:
+                _template_store = TemplateStore(
+                    os.getenv("STORE_TEMPLATES_PATH", "data/store_templates.json"),
+                    threshold=float(os.getenv("STORE_MATCH_THRESHOLD", "0.6")),
+                    min_receipts=int(os.getenv("STORE_TEMPLATE_MIN_RECEIPTS", "1"))
+                )
+    return _template_store
@@ -1,43 +1,30 @@
-import openai
+import asyncio
 import base64
-from PIL import Image
 import json
-from typing import List, Dict, Optional
+import random
+import re
+import sys
+import time
+from typing import TYPE_CHECKING, Callable, List, Dict, Optional, Union
 import os
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 
-# Initialize OpenAI client
-client = None
+from .cache import get_extraction_cache, make_cache_key
+from .limiter import get_vlm_limiter, reset_vlm_limiter
+from .metrics import PAYLOAD_BYTES, STAGE_ERRORS, STAGE_SECONDS, VLM_REQUESTS, VLM_RETRIES, record_usage, stage
+from .imaging import (
+    ImageSource, prepare_image_for_vlm, prepare_strips_for_vlm, preprocessing_settings, read_image_bytes
+)
 
-def init_openai_client(api_key: str):
-    """Initialize OpenAI client with API key"""
-    global client
-    client = openai.OpenAI(api_key=api_key)
+# The openai SDK takes longer to import than the rest of the app together,
+# so it is imported where a client is built, not when this module loads
+if TYPE_CHECKING:
+    import openai
 
-def encode_image_to_base64(image_path: str) -> str:
-    """Convert image to base64 for OpenAI API"""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+VLM_MODEL = os.getenv("VLM_MODEL", "gpt-4o")  # or "gpt-4-vision-preview" if you have that
 
-def extract_with_gpt4v(image_path: str) -> List[Dict]:
-    """
-    Use GPT-4V to extract ingredient data from receipt image
-    
-    Args:
-        image_path: Path to the receipt image
-        
-    Returns:
-        List of dictionaries with ingredient data
-    """
-    if not client:
-        raise Exception("OpenAI client not initialized. Call init_openai_client() first.")
-    
-    try:
-        # Encode image
-        base64_image = encode_image_to_base64(image_path)
-        
-        # Create the prompt
-        prompt = """
+EXTRACTION_PROMPT = """
         Analyze this receipt image and extract all food/grocery items with their details.
         
         For each item, provide:
@@ -63,42 +50,601 @@ def extract_with_gpt4v(image_path: str) -> List[Dict]:
         - Leave Notes field empty unless you deem necessary to add some info based on the receipt
         - Only return valid JSON, no explanations
         """
+
+# Tall receipts are sent as overlapping strips. The top strip gets the full
+# prompt (it carries the header and date); the rest only list their items.
+FIRST_STRIP_NOTE = """
+        This image is the top part (1 of {parts}) of a long receipt that was cut into
+        overlapping strips. Only extract the items visible in this part.
+        """
+
+STRIP_PROMPT = """
+        This image is part {part} of {parts} of a long grocery receipt that was cut into
+        overlapping horizontal strips, so a few lines may also appear in the neighbouring parts.
+        
+        Extract the food/grocery item lines visible in this part. Skip lines cut off at the top or
+        bottom edge, and skip headers, totals and payment lines.
+        
+        Return the data as a JSON array with this exact format:
+        [
+            {{
+                "Date": "",
+                "Ingredient": "Whole Milk",
+                "Quantity": "2 PT",
+                "Price": "2.40",
+                "Notes": ""
+            }}
+        ]
+        
+        Rules:
+        - Skip non-food items (bags, receipts, etc.)
+        - Clean up ingredient names (remove barcodes, store codes)
+        - Leave Date empty; it is read from the first part
+        - Only return valid JSON, no explanations
+        """
+
+# Initialize OpenAI client
+client = None
+
+# Shared async client for the async extraction path (its concurrency is
+# governed by the adaptive limiter in limiter.py)
+_async_client: Optional["openai.AsyncOpenAI"] = None
+
+def init_openai_client(api_key: str):
+    """Initialize OpenAI client with API key"""
+    import openai
+    global client
+    # Retries are handled by _call_model, not by the SDK
+    client = openai.OpenAI(api_key=api_key, max_retries=0)
+
+def load_client_libraries():
+    """Import the openai SDK and httpx now rather than on the first vision call"""
+    import httpx
+    import openai
+
+def get_async_client() -> "openai.AsyncOpenAI":
+    """
+    Return the shared async OpenAI client, creating it on first use
+    
+    The client keeps one pooled HTTP connection pool for the whole process.
+    Configured through OPENAI_API_KEY, OPENAI_BASE_URL (e.g. a local fake server),
+    VLM_TIMEOUT, VLM_CONNECT_TIMEOUT and VLM_MAX_CONNECTIONS. The SDK doesn't
+    retry; _call_model does, under the adaptive limiter.
+    """
+    global _async_client
+    if _async_client is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise Exception("OpenAI API key not configured")
+        
+        import httpx
+        import openai
         
-        # Make API call
-        response = client.chat.completions.create(
-            model="gpt-4o",  # or "gpt-4-vision-preview" if you have that
-            messages=[
+        max_connections = int(os.getenv("VLM_MAX_CONNECTIONS", "20"))
+        timeout = httpx.Timeout(
+            float(os.getenv("VLM_TIMEOUT", "60")),
+            connect=float(os.getenv("VLM_CONNECT_TIMEOUT", "5"))
+        )
+        http_client = openai.DefaultAsyncHttpxClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            )
+        )
+        _async_client = openai.AsyncOpenAI(
+            api_key=api_key,
+            base_url=os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1",
+            timeout=timeout,
+            max_retries=0,
+            http_client=http_client
+        )
+    return _async_client
+
+async def close_async_client():
+    """Close the shared async client and its connection pool"""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+    _async_client = None
+    reset_vlm_limiter()
+
+# Errors worth another attempt; the rest fail the extraction at once
+RETRYABLE_ERRORS = ("rate_limited", "transient")
+
+def classify_error(error: Exception) -> str:
+    """
+    Kind of a failed vision call
+
+    Returns:
+        "rate_limited" (429), "transient" (timeouts, connection errors,
+        408/409/5xx), "quota_exhausted" (429 for an account out of credit,
+        which waiting won't fix), "invalid_reply" (not JSON), "rejected"
+        (other API errors such as a bad key or request) or "error"
+    """
+    if isinstance(error, json.JSONDecodeError):
+        return "invalid_reply"
+    status = getattr(error, "status_code", None)
+    if status == 429:
+        return "quota_exhausted" if getattr(error, "code", None) == "insufficient_quota" else "rate_limited"
+    if status is not None:
+        return "transient" if status in (408, 409) or status >= 500 else "rejected"
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return "transient"
+    # The SDK is only imported once a client exists, and then it is in sys.modules
+    openai = sys.modules.get("openai")
+    if openai is not None and isinstance(error, openai.APIConnectionError):
+        return "transient"
+    return "error"
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds the API asked to wait (Retry-After / retry-after-ms headers), if any"""
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            when = parsedate_to_datetime(value)
+            return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def retry_delay(attempt: int, wait: Optional[float] = None) -> float:
+    """
+    Jittered exponential backoff before retry number attempt + 1
+
+    Full jitter between 0 and VLM_RETRY_BASE_DELAY x 2^attempt (capped at
+    VLM_RETRY_MAX_DELAY), but never less than the API's Retry-After.
+    """
+    base = float(os.getenv("VLM_RETRY_BASE_DELAY", "0.5"))
+    cap = float(os.getenv("VLM_RETRY_MAX_DELAY", "30"))
+    return max(wait or 0.0, random.uniform(0, min(cap, base * 2 ** attempt)))
+
+def should_retry(kind: str, attempt: int, wait: Optional[float] = None) -> bool:
+    """Whether to try again after attempt number attempt (0-based) failed"""
+    if kind not in RETRYABLE_ERRORS or attempt >= int(os.getenv("VLM_MAX_RETRIES", "3")):
+        return False
+    # A Retry-After longer than we'd ever back off means the quota window is gone for now
+    return wait is None or wait <= float(os.getenv("VLM_RETRY_MAX_DELAY", "30"))
+
+def failure_metadata(report: Dict) -> Dict:
+    """
+    Error fields for extraction metadata when the vision model returned no items
+
+    Throttling and transient errors that outlasted the retries are marked
+    retryable, so callers can tell "try again shortly" from a hard failure
+    or a receipt with nothing on it.
+    """
+    kind = report.get("error_kind")
+    if kind in RETRYABLE_ERRORS:
+        reason = "rate limited" if kind == "rate_limited" else "temporarily unavailable"
+        return {"error": f"VLM {reason} after {report.get('attempts', 1)} attempts - please try again shortly",
+                "error_kind": kind, "retryable": True}
+    if kind:
+        return {"error": f"VLM extraction failed ({kind.replace('_', ' ')}): {report.get('last_error', '')}",
+                "error_kind": kind, "retryable": False}
+    return {"error": "VLM extraction failed - no items found", "error_kind": "no_items", "retryable": False}
+
+def incomplete_result(report: Dict) -> bool:
+    """Whether the items are only part of the receipt (and so mustn't be cached)"""
+    return bool(report.get("truncated") or report.get("stream_interrupted") or report.get("failed_strips"))
+
+def partial_metadata(report: Dict) -> Dict:
+    """
+    Error fields for extraction metadata when the vision model returned only some items
+
+    Empty for a complete reply. The items are still handed back, flagged
+    partial, so the review page can warn that lines may be missing.
+    """
+    if report.get("failed_strips"):
+        kind = report.get("error_kind") or "error"
+        return {"partial": True,
+                "error": f"VLM couldn't read {report['failed_strips']} of {report.get('strips')} parts of the receipt "
+                         "- items from those parts are missing",
+                "error_kind": kind, "retryable": kind in RETRYABLE_ERRORS}
+    if report.get("truncated"):
+        return {"partial": True, "error": "VLM reply was cut off at the token limit - some items may be missing",
+                "error_kind": "truncated", "retryable": False}
+    if report.get("stream_interrupted"):
+        # The connection dropped part way; another attempt is likely to get the whole reply
+        return {"partial": True, "error": "VLM reply broke off - some items may be missing, please try again",
+                "error_kind": report["stream_interrupted"], "retryable": True}
+    return {}
+
+def encode_image_to_base64(image: ImageSource) -> str:
+    """Convert image (path, bytes or file object) to base64 for OpenAI API"""
+    return base64.b64encode(read_image_bytes(image)).decode('utf-8')
+
+def strip_prompt(index: int, count: int) -> str:
+    """Prompt for strip index (0 = top) of a receipt cut into count strips"""
+    if count == 1:
+        return EXTRACTION_PROMPT
+    if index == 0:
+        return EXTRACTION_PROMPT + FIRST_STRIP_NOTE.format(parts=count)
+    return STRIP_PROMPT.format(part=index + 1, parts=count)
+
+def build_messages(base64_image: str, detail: str = "high", prompt: str = EXTRACTION_PROMPT) -> List[Dict]:
+    """Build the chat messages for a receipt image"""
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt},
                 {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}",
-                                "detail": "high"
-                            }
-                        }
-                    ]
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:image/jpeg;base64,{base64_image}",
+                        "detail": detail
+                    }
                 }
-            ],
-            max_tokens=1000,
-            temperature=0.1
-        )
+            ]
+        }
+    ]
+
+def parse_items(content: str) -> List[Dict]:
+    """
+    Parse the model's reply into a list of items
+    
+    Raises:
+        json.JSONDecodeError: If the reply isn't valid JSON
+    """
+    content = content.strip()
+    
+    # Extract JSON from response (remove any markdown formatting)
+    if content.startswith("```json"):
+        content = content[7:-3]
+    elif content.startswith("```"):
+        content = content[3:-3]
+    
+    return json.loads(content)
+
+def _item_key(item: Dict) -> tuple:
+    name = re.sub(r'[^a-z0-9]', '', str(item.get("Ingredient", "")).lower())
+    try:
+        price = f"{float(str(item.get('Price', '')).strip().lstrip('£$€')):.2f}"
+    except ValueError:
+        price = str(item.get("Price", ""))
+    return name, price
+
+def _same_item(a: Dict, b: Dict) -> bool:
+    """Same line read from two strips; names may be cleaned up slightly differently"""
+    (name_a, price_a), (name_b, price_b) = _item_key(a), _item_key(b)
+    return price_a == price_b and bool(name_a) and bool(name_b) and (name_a in name_b or name_b in name_a)
+
+def _overlap_length(previous: List[Dict], following: List[Dict]) -> int:
+    """Longest run at the end of previous that repeats at the start of following"""
+    for length in range(min(len(previous), len(following)), 0, -1):
+        if all(_same_item(a, b) for a, b in zip(previous[-length:], following[:length])):
+            return length
+    return 0
+
+def merge_strip_items(strips: List[List[Dict]]) -> List[Dict]:
+    """
+    Join the item lists of consecutive strips into one receipt
+    
+    Items read twice in the overlap between two strips (the end of one list
+    repeating at the start of the next) are kept once. Items without a date
+    get the date read from the top of the receipt.
+    """
+    merged: List[Dict] = []
+    for items in strips:
+        merged.extend(items[_overlap_length(merged, items):])
+    
+    date = next((item["Date"] for item in merged if item.get("Date")), "")
+    for item in merged:
+        if not item.get("Date"):
+            item["Date"] = date
+    return merged
+
+class ItemStreamParser:
+    """
+    Incremental parser for a JSON array of items arriving in chunks
+    
+    Each top-level object is decoded as soon as its closing brace arrives.
+    Anything before the opening '[' or after the closing ']' (such as a
+    ```json fence) is ignored, so streamed replies need no post-processing.
+    """
+    
+    def __init__(self):
+        self.items: List[Dict] = []
+        self.finished = False
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._current: List[str] = []
+    
+    def feed(self, chunk: str) -> List[Dict]:
+        """
+        Consume the next piece of the reply
+        
+        Returns:
+            Items completed by this chunk
+        """
+        completed = []
+        for char in chunk:
+            if self.finished:
+                break
+            if not self._started:
+                self._started = char == '['
+                continue
+            if self._depth == 0:
+                if char == '{':
+                    self._depth = 1
+                    self._current = [char]
+                elif char == ']':
+                    self.finished = True
+                continue
+            
+            self._current.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    item = self._decode("".join(self._current))
+                    if item is not None:
+                        completed.append(item)
+        
+        self.items.extend(completed)
+        return completed
+    
+    def _decode(self, text: str) -> Optional[Dict]:
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            print(f"Skipping malformed item in streamed reply: {e}")
+            return None
+
+def extract_with_gpt4v(image: ImageSource) -> List[Dict]:
+    """
+    Use GPT-4V to extract ingredient data from receipt image
+    
+    Args:
+        image: Path, bytes or file object of the receipt image
+        
+    Returns:
+        List of dictionaries with ingredient data
+    """
+    if not client:
+        raise Exception("OpenAI client not initialized. Call init_openai_client() first.")
+    
+    try:
+        # Encode image
+        base64_image = encode_image_to_base64(image)
+        
+        # Make API call, retrying throttled and transient failures like the async path
+        attempt = 0
+        while True:
+            try:
+                with stage("vlm"):
+                    response = client.chat.completions.create(
+                        model=VLM_MODEL,
+                        messages=build_messages(base64_image),
+                        max_tokens=1000,
+                        temperature=0.1
+                    )
+                break
+            except Exception as e:
+                kind = classify_error(e)
+                wait = retry_after(e)
+                VLM_REQUESTS.inc(1, kind)
+                if not should_retry(kind, attempt, wait):
+                    raise
+                VLM_RETRIES.inc(1, kind)
+                print(f"GPT-4V call failed ({kind}), retrying: {e}")
+                time.sleep(retry_delay(attempt, wait))
+                attempt += 1
+        record_usage(getattr(response, "usage", None))
+        VLM_REQUESTS.inc(1, "ok")
         
         # Parse response
-        content = response.choices[0].message.content.strip()
+        return parse_items(response.choices[0].message.content)
         
-        # Extract JSON from response (remove any markdown formatting)
-        if content.startswith("```json"):
-            content = content[7:-3]
-        elif content.startswith("```"):
-            content = content[3:-3]
+    except json.JSONDecodeError as e:
+        print(f"GPT-4V returned invalid JSON: {e}")
+        return []
+    except Exception as e:
+        print(f"GPT-4V extraction error: {e}")
+        return []
+
+async def extract_with_gpt4v_async(image: ImageSource, report: Optional[Dict] = None,
+                                   on_item: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    """
+    Async version of extract_with_gpt4v using the shared pooled client
+    
+    Results are cached by image content, prompt, model and preprocessing
+    settings, and concurrent uploads of the same image share one in-flight call.
+    
+    Args:
+        image: Path, bytes/memoryview or file object of the receipt image
+        report: Optional dict filled with payload sizes and cache status
+        on_item: Called with each item as soon as it is complete; the reply
+            is streamed when this is given
         
-        # Parse JSON
-        items = json.loads(content)
+    Returns:
+        List of dictionaries with ingredient data
+    """
+    try:
+        # Reading and hashing the file is blocking work, keep it off the event loop
+        request = await asyncio.to_thread(prepare_request, image, False)
+        return await extract_prepared_async(request, report, on_item)
         
-        return items
+    except Exception as e:
+        print(f"GPT-4V extraction error: {e}")
+        return []
+
+def prepare_request(image: ImageSource, preprocess: bool = True) -> Dict:
+    """
+    Read, hash and (unless already cached) preprocess an image
+    
+    Blocking CPU work, so callers run it in a thread. The result is handed
+    to extract_prepared_async; batch pipelines run the two as separate stages.
+    
+    Args:
+        image: Path, bytes/memoryview or file object of the receipt image
+        preprocess: Build the API payload now instead of on cache miss
+        
+    Returns:
+        Dict with the image bytes, cache key, settings and prepared payloads (or None)
+    """
+    image_bytes = read_image_bytes(image)
+    settings = preprocessing_settings()
+    key = make_cache_key(image_bytes, EXTRACTION_PROMPT, _cache_version(settings))
+    payload = None
+    if preprocess and not get_extraction_cache().contains(key):
+        payload = prepare_payloads(image_bytes, settings)
+    return {"image_bytes": image_bytes, "key": key, "settings": settings, "payload": payload}
+
+async def extract_prepared_async(request: Dict, report: Optional[Dict] = None,
+                                 on_item: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    """
+    Extract items for a request built by prepare_request
+    
+    Args:
+        request: Output of prepare_request
+        report: Optional dict filled with payload sizes and cache status
+        on_item: Called with each item as soon as it is complete; cached and
+            coalesced results are replayed through it
+        
+    Returns:
+        List of dictionaries with ingredient data
+    """
+    report = report if report is not None else {}
+    report["original_bytes"] = len(request["image_bytes"])
+    report["cache"] = "hit"
+    # Cut-off replies are shared with concurrent callers but never cached
+    def complete(items: List[Dict]) -> bool:
+        return not incomplete_result(report)
+    
+    if on_item is None:
+        return await get_extraction_cache().get_or_extract(
+            request["key"], lambda: _request_extraction(request, report), complete, report
+        )
+    
+    streamed = []
+    def emit(item: Dict):
+        streamed.append(item)
+        on_item(item)
+    
+    items = await get_extraction_cache().get_or_extract(
+        request["key"], lambda: _request_extraction(request, report, emit), complete, report
+    )
+    for item in items[len(streamed):]:
+        on_item(item)
+    return items
+
+def _cache_version(settings: Dict) -> str:
+    """Model name plus preprocessing settings, since both change the result"""
+    return VLM_MODEL + "|" + json.dumps(settings, sort_keys=True)
+
+def prepare_payload(image_bytes: Union[bytes, memoryview], settings: Optional[Dict] = None) -> tuple:
+    """
+    Preprocess an image and base64 encode it for the API
+    
+    Falls back to the untouched bytes at high detail if the image can't be decoded.
+    
+    Returns:
+        Tuple of (base64 string, detail level, report dict)
+    """
+    try:
+        encoded, detail, report = prepare_image_for_vlm(image_bytes, settings)
+    except Exception as e:
+        print(f"Image preprocessing error: {e}")
+        encoded, detail = image_bytes, "high"
+        report = {"original_bytes": len(image_bytes), "encoded_bytes": len(image_bytes), "detail": detail}
+    
+    base64_image = base64.b64encode(encoded).decode('utf-8')
+    report["payload_bytes"] = len(base64_image)
+    return base64_image, detail, report
+
+def prepare_payloads(image_bytes: Union[bytes, memoryview], settings: Optional[Dict] = None) -> List[tuple]:
+    """
+    Like prepare_payload, but tall receipts become one payload per strip
+    
+    Returns:
+        List of (base64 string, detail level, report) tuples, top to bottom
+    """
+    with stage("preprocess"):
+        try:
+            strips = prepare_strips_for_vlm(image_bytes, settings)
+        except Exception:
+            # prepare_payload reports the error and falls back to the raw bytes
+            payloads = [prepare_payload(image_bytes, settings)]
+        else:
+            payloads = []
+            for encoded, detail, report in strips:
+                base64_image = base64.b64encode(encoded).decode('utf-8')
+                report["payload_bytes"] = len(base64_image)
+                payloads.append((base64_image, detail, report))
+    for payload in payloads:
+        PAYLOAD_BYTES.observe(payload[2]["payload_bytes"], "vlm_payload")
+    return payloads
+
+async def _get_payloads(request: Dict, report: Dict) -> List[tuple]:
+    payloads = request.get("payload")
+    if payloads is None:
+        # Decoding, resizing and encoding are CPU work, run them in a thread
+        payloads = await asyncio.to_thread(
+            prepare_payloads, request["image_bytes"], request["settings"]
+        )
+    reports = [payload[2] for payload in payloads]
+    report.update(reports[0])
+    if len(reports) > 1:
+        report.pop("strip", None)
+        report.pop("rows", None)
+        report["strips"] = len(reports)
+        for field in ("encoded_bytes", "payload_bytes"):
+            report[field] = sum(strip_report[field] for strip_report in reports)
+    report["cache"] = "miss"
+    return payloads
+
+async def _request_extraction(request: Dict, report: Dict,
+                              on_item: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    """
+    Preprocess one receipt image (if not done yet) and send it to the vision model
+    
+    Tall receipts are sent strip by strip, all strips at once, and the
+    replies merged. When streaming, only the top strip is streamed; the
+    caller replays the rest once the merge is done. Strips that fail are
+    counted in report["failed_strips"], which makes the receipt partial.
+    """
+    try:
+        payloads = await _get_payloads(request, report)
+        if len(payloads) == 1:
+            base64_image, detail, _ = payloads[0]
+            return await _call_model(build_messages(base64_image, detail), report, on_item)
+        
+        async def extract_strip(index: int, payload: tuple) -> List[Dict]:
+            base64_image, detail, _ = payload
+            messages = build_messages(base64_image, detail, strip_prompt(index, len(payloads)))
+            try:
+                return await _call_model(messages, report, on_item if index == 0 else None)
+            except Exception as e:
+                print(f"GPT-4V extraction error in strip {index + 1}/{len(payloads)}: {e}")
+                report["failed_strips"] = report.get("failed_strips", 0) + 1
+                return []
+        
+        strips = await asyncio.gather(*[
+            extract_strip(index, payload) for index, payload in enumerate(payloads)
+        ])
+        return merge_strip_items(strips)
         
     except json.JSONDecodeError as e:
         print(f"GPT-4V returned invalid JSON: {e}")
@@ -107,11 +653,123 @@ def extract_with_gpt4v(image_path: str) -> List[Dict]:
         print(f"GPT-4V extraction error: {e}")
         return []
 
+async def _call_model(messages: List[Dict], report: Dict,
+                      on_item: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    """
+    One vision call, under the adaptive concurrency limit
+
+    Throttled and transient failures are retried (VLM_MAX_RETRIES) after a
+    jittered backoff that honours Retry-After; each outcome feeds the
+    limiter. With on_item the reply is streamed and items are handed over
+    as they complete; a stream that breaks off after the first item can't
+    be retried (its items are already out), so it returns them with
+    report["stream_interrupted"] set. Such a partial result isn't cached
+    and is reported as retryable (see partial_metadata).
+
+    Raises:
+        The last error when it isn't retryable or the retries are used up;
+        report["error_kind"] says which kind it was (see classify_error)
+    """
+    limiter = get_vlm_limiter()
+    attempt = 0
+    while True:
+        report["attempts"] = report.get("attempts", 0) + 1
+        await limiter.acquire()
+        start = time.monotonic()
+        try:
+            items = await _send_messages(messages, report, on_item)
+        except Exception as e:
+            kind = classify_error(e)
+            wait = retry_after(e)
+            limiter.release("throttled" if kind == "rate_limited" else "error", retry_after=wait)
+            VLM_REQUESTS.inc(1, kind)
+            if not should_retry(kind, attempt, wait):
+                report["error_kind"] = kind
+                report["last_error"] = str(e)[:300]
+                raise
+            VLM_RETRIES.inc(1, kind)
+            report["retries"] = report.get("retries", 0) + 1
+            if kind == "rate_limited":
+                report["throttled"] = report.get("throttled", 0) + 1
+            print(f"GPT-4V call failed ({kind}), retrying: {e}")
+            await asyncio.sleep(retry_delay(attempt, wait))
+            attempt += 1
+            continue
+        limiter.release("ok", time.monotonic() - start)
+        return items
+
+async def _send_messages(messages: List[Dict], report: Dict,
+                         on_item: Optional[Callable[[Dict], None]] = None) -> List[Dict]:
+    """
+    Send one request to the vision model
+
+    Raises:
+        API and transport errors unchanged, including a stream that fails
+        before its first item
+        json.JSONDecodeError: If a non-streamed reply isn't valid JSON
+    """
+    async_client = get_async_client()
+    if on_item is None:
+        with stage("vlm"):
+            response = await async_client.chat.completions.create(
+                model=VLM_MODEL,
+                messages=messages,
+                max_tokens=1000,
+                temperature=0.1
+            )
+        record_usage(getattr(response, "usage", None))
+        truncated = response.choices[0].finish_reason == "length"
+        if truncated:
+            report["truncated"] = True
+        items = parse_items(response.choices[0].message.content)
+        VLM_REQUESTS.inc(1, "truncated" if truncated else "ok")
+        return items
+    
+    parser = ItemStreamParser()
+    outcome = "ok"
+    start = asyncio.get_running_loop().time()
+    try:
+        stream = await async_client.chat.completions.create(
+            model=VLM_MODEL,
+            messages=messages,
+            max_tokens=1000,
+            temperature=0.1,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        async for chunk in stream:
+            # With include_usage the last chunk carries the token counts and no choices
+            record_usage(getattr(chunk, "usage", None))
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            for item in parser.feed(choice.delta.content or ""):
+                if "first_item_seconds" not in report:
+                    report["first_item_seconds"] = round(asyncio.get_running_loop().time() - start, 4)
+                on_item(item)
+            if choice.finish_reason == "length":
+                report["truncated"] = True
+                outcome = "truncated"
+                print("GPT-4V reply was cut off at max_tokens; keeping the complete items")
+    except Exception as e:
+        STAGE_ERRORS.inc(1, "vlm")
+        if not parser.items:
+            # Nothing was handed over yet, so the call can safely be retried
+            raise
+        print(f"GPT-4V stream broke off after {len(parser.items)} items: {e}")
+        report["stream_interrupted"] = classify_error(e)
+        outcome = "interrupted"
+    finally:
+        STAGE_SECONDS.observe(asyncio.get_running_loop().time() - start, "vlm")
+    VLM_REQUESTS.inc(1, outcome)
+    return parser.items
+
 def check_api_access(api_key: str) -> Dict:
     """
     Check what models are available with the API key
     """
     try:
+        import openai
         temp_client = openai.OpenAI(api_key=api_key)
         models = temp_client.models.list()
         
@@ -0,0 +1,382 @@
+"""
+Bulk ingest of receipt images from the command line
+
+Walks directories and .zip/.tar archives, runs the receipts through the
+batch pipeline (app.agent.pipeline.process_batch) and keeps the results in
+a local SQLite store, optionally appending them to the spreadsheet too.
+Every finished receipt is checkpointed, so an interrupted run continues
+where it stopped when started again; images are de-duplicated by content.
+
+    python -m app.ingest ~/receipts archive.zip --method auto --concurrency 8 --sheet
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import tarfile
+import threading
+import time
+import zipfile
+from collections import Counter, deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import AsyncIterator, Callable, Dict, List, NamedTuple, Optional, TextIO, Tuple
+
+from dotenv import load_dotenv
+
+from .agent.pipeline import process_batch, warm_worker
+from .agent.vlm import close_async_client
+from .services.ingest_store import IngestStore
+from .services.sheets import append_to_sheet, is_configured
+
+# Load environment variables
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff")
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+class Source(NamedTuple):
+    """One receipt image on disk or inside an archive"""
+    name: str
+    size: int
+    mtime: float
+    read: Callable[[], bytes]
+
+def _is_image(name: str) -> bool:
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+def _read_file(path: str) -> Callable[[], bytes]:
+    def read() -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+    return read
+
+def _zip_sources(path: str) -> List[Source]:
+    archive = zipfile.ZipFile(path)
+    lock = threading.Lock()
+
+    def reader(info: zipfile.ZipInfo) -> Callable[[], bytes]:
+        def read() -> bytes:
+            with lock:
+                return archive.read(info)
+        return read
+
+    return [Source(f"{path}!{info.filename}", info.file_size, time.mktime(info.date_time + (0, 0, -1)), reader(info))
+            for info in archive.infolist() if not info.is_dir() and _is_image(info.filename)]
+
+def _tar_sources(path: str) -> List[Source]:
+    archive = tarfile.open(path)
+    # Members of a compressed tar can only be read one at a time
+    lock = threading.Lock()
+
+    def reader(member: tarfile.TarInfo) -> Callable[[], bytes]:
+        def read() -> bytes:
+            with lock:
+                return archive.extractfile(member).read()
+        return read
+
+    return [Source(f"{path}!{member.name}", member.size, float(member.mtime), reader(member))
+            for member in archive.getmembers() if member.isfile() and _is_image(member.name)]
+
+def discover(path: str) -> List[Source]:
+    """Receipt images in a directory tree, an archive or a single file, in name order"""
+    lowered = path.lower()
+    if os.path.isfile(path) and lowered.endswith(".zip"):
+        return sorted(_zip_sources(path))
+    if os.path.isfile(path) and lowered.endswith(ARCHIVE_EXTENSIONS):
+        return sorted(_tar_sources(path))
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return [Source(path, stat.st_size, stat.st_mtime, _read_file(path))]
+
+    sources = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            if name.lower().endswith(ARCHIVE_EXTENSIONS):
+                sources.extend(discover(file_path))
+            elif _is_image(name):
+                stat = os.stat(file_path)
+                sources.append(Source(file_path, stat.st_size, stat.st_mtime, _read_file(file_path)))
+    return sources
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}" if hours else f"{rest // 60}:{rest % 60:02d}"
+
+class Progress:
+    """
+    One self-updating status line: progress, throughput and ETA
+
+    Throughput counts extracted receipts only; skipped ones (already done
+    or duplicates) are quick and would make the ETA look too good.
+    """
+
+    def __init__(self, total: int, stream: TextIO = sys.stderr, interval: float = 1.0):
+        self.total = total
+        self.stream = stream
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self._started: Optional[float] = None
+        self._last_render = 0.0
+        self._width = 0
+
+    def advance(self, outcome: str):
+        """Count a receipt as "done", "failed" or "skipped" and redraw if due"""
+        if self._started is None and outcome != "skipped":
+            self._started = time.monotonic()
+        self.counts[outcome] += 1
+        self.render()
+
+    def rate(self) -> float:
+        processed = self.counts["done"] + self.counts["failed"]
+        if self._started is None or not processed:
+            return 0.0
+        return processed / max(time.monotonic() - self._started, 1e-6)
+
+    def line(self) -> str:
+        seen = sum(self.counts.values())
+        rate = self.rate()
+        remaining = self.total - seen
+        eta = format_duration(remaining / rate) if rate and remaining else "--:--"
+        return (f"{seen}/{self.total} | {self.counts['done']} ok, {self.counts['failed']} failed, "
+                f"{self.counts['skipped']} skipped | {rate:.2f} receipts/s | ETA {eta}")
+
+    def render(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_render < self.interval:
+            return
+        self._last_render = now
+        line = self.line()
+        self._width = max(self._width, len(line))
+        self.stream.write("\r" + line.ljust(self._width))
+        self.stream.flush()
+
+    def finish(self):
+        self.render(force=True)
+        self.stream.write("\n")
+        self.stream.flush()
+
+def load_source(source: Source, store: IngestStore, retry_failed: bool) -> Tuple[str, Optional[bytes], Optional[str]]:
+    """
+    Hash a source and decide whether it needs extracting
+
+    Unchanged files seen by an earlier run aren't read again unless they
+    have to be extracted.
+
+    Returns:
+        (content hash, image bytes or None, skip reason or None)
+    """
+    digest = store.known_hash(source.name, source.size, source.mtime)
+    if digest is not None:
+        reason = skip_reason(store.status(digest), retry_failed)
+        if reason:
+            return digest, None, reason
+
+    data = source.read()
+    digest = hashlib.sha256(data).hexdigest()
+    store.remember_file(source.name, source.size, source.mtime, digest)
+    reason = skip_reason(store.status(digest), retry_failed)
+    return digest, None if reason else data, reason
+
+def skip_reason(status: Optional[Dict], retry_failed: bool) -> Optional[str]:
+    """Why a stored receipt needn't be extracted again, if it needn't"""
+    if status is None:
+        return None
+    if status["status"] == "done":
+        return "already_done"
+    if not status["retryable"] and not retry_failed:
+        return "failed_before"
+    return None
+
+async def flush_to_sheet(store: IngestStore, append: Callable[[List[Dict], str], Dict], counts: Counter,
+                         batch: int = 100) -> bool:
+    """
+    Append extracted receipts that aren't in the sheet yet, many per call
+
+    Receipts are marked "sending" before each append and "appended" after
+    it. If the run dies in between, they stay "sending": they may or may not
+    be in the sheet, so they aren't sent again unless asked
+    (--resend-unconfirmed), rather than risking duplicate rows.
+
+    Returns:
+        False if an append failed (the rows stay pending for the next flush)
+    """
+    while True:
+        pending = await asyncio.to_thread(store.pending_sheet_rows, batch)
+        if not pending:
+            return True
+        digests = [receipt["hash"] for receipt in pending]
+        items = [item for receipt in pending for item in receipt["items"]]
+        await asyncio.to_thread(store.mark_sheet, digests, "sending")
+        result = await asyncio.to_thread(append, items, f"bulk ingest ({len(pending)} receipts)")
+        if not result.get("success"):
+            await asyncio.to_thread(store.mark_sheet, digests, "pending")
+            print(f"\nSheet append failed, will retry: {result.get('error')}", file=sys.stderr)
+            counts["sheet_errors"] += 1
+            return False
+        await asyncio.to_thread(store.mark_sheet, digests, "appended")
+        counts["sheet_rows"] += len(items)
+
+async def ingest(sources: List[Source], store: IngestStore, method: str = "vlm", concurrency: int = 8,
+                 read_ahead: int = 32, to_sheet: bool = False, retry_failed: bool = False,
+                 resend_unconfirmed: bool = False, ocr_executor: Optional[Executor] = None,
+                 progress: Optional[Progress] = None, process=process_batch,
+                 append: Callable[[List[Dict], str], Dict] = append_to_sheet, sheet_batch: int = 100) -> Counter:
+    """
+    Extract every source not already in the store
+
+    A producer hashes sources up to read_ahead ahead of the pipeline and
+    hands it the ones that need extracting as it takes them, so memory stays
+    bounded while the pipeline keeps `concurrency` extractions in flight.
+    With to_sheet, finished receipts are appended every sheet_batch receipts.
+
+    Returns:
+        Counts of done, failed, already_done, failed_before, duplicates,
+        sheet_rows, sheet_errors and sheet_unconfirmed
+    """
+    counts: Counter = Counter()
+    progress = progress or Progress(len(sources))
+    seen = set()
+    digests: Dict[str, str] = {}
+    if to_sheet:
+        if resend_unconfirmed:
+            await asyncio.to_thread(store.requeue_sheet, "sending")
+        # Rows extracted by an interrupted run that never reached the sheet
+        await flush_to_sheet(store, append, counts, sheet_batch)
+
+    async def receipts() -> AsyncIterator[Tuple[str, bytes]]:
+        window = deque()
+        remaining = iter(sources)
+        try:
+            while True:
+                while len(window) < read_ahead:
+                    source = next(remaining, None)
+                    if source is None:
+                        break
+                    window.append((source, asyncio.create_task(
+                        asyncio.to_thread(load_source, source, store, retry_failed))))
+                if not window:
+                    return
+                source, loading = window.popleft()
+                digest, data, reason = await loading
+                if digest in seen:
+                    reason = "duplicates"
+                seen.add(digest)
+                if reason:
+                    counts[reason] += 1
+                    progress.advance("skipped")
+                    continue
+                digests[source.name] = digest
+                yield source.name, data
+        finally:
+            for _, loading in window:
+                loading.cancel()
+
+    flushing: Optional[asyncio.Task] = None
+    unsent = 0
+
+    def on_result(result: Dict):
+        nonlocal flushing, unsent
+        store.record(digests.pop(result["filename"]), result["filename"], method,
+                     result["items"], result["metadata"])
+        outcome = "done" if result["metadata"].get("success") and result["items"] else "failed"
+        counts[outcome] += 1
+        progress.advance(outcome)
+        if to_sheet and outcome == "done":
+            unsent += 1
+            if unsent >= sheet_batch and (flushing is None or flushing.done()):
+                unsent = 0
+                flushing = asyncio.create_task(flush_to_sheet(store, append, counts, sheet_batch))
+
+    await process(receipts(), method, extract_concurrency=concurrency, ocr_executor=ocr_executor,
+                  on_result=on_result, keep_results=False)
+    if to_sheet:
+        if flushing is not None:
+            await flushing
+        await flush_to_sheet(store, append, counts, sheet_batch)
+        counts["sheet_unconfirmed"] = await asyncio.to_thread(store.count_sheet, "sending")
+
+    progress.finish()
+    return counts
+
+async def run(sources: List[Source], store: IngestStore, **options) -> Counter:
+    try:
+        return await ingest(sources, store, **options)
+    finally:
+        await close_async_client()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.ingest", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("sources", nargs="+", help="Directories, archives (.zip, .tar[.gz]) or image files")
+    parser.add_argument("--method", choices=("vlm", "ocr", "auto"), default="vlm", help="Extraction method")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BATCH_EXTRACT_CONCURRENCY", "8")),
+                        help="Extractions in flight")
+    parser.add_argument("--read-ahead", type=int, default=0,
+                        help="Receipts read and hashed ahead of the pipeline (default 4 x concurrency)")
+    parser.add_argument("--ocr-processes", type=int, default=int(os.getenv("OCR_PROCESSES", "1")),
+                        help="EasyOCR worker processes (ocr/auto)")
+    parser.add_argument("--db", default=os.getenv("INGEST_DB_PATH", "data/ingest.sqlite3"),
+                        help="Result and checkpoint store")
+    parser.add_argument("--sheet", action="store_true", help="Also append the items to the spreadsheet")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Extract receipts that failed in an earlier run again")
+    parser.add_argument("--resend-unconfirmed", action="store_true",
+                        help="Append receipts again whose append an earlier run didn't confirm (may duplicate rows)")
+    args = parser.parse_args(argv)
+
+    if args.method == "vlm" and not os.getenv("OPENAI_API_KEY"):
+        print("OPENAI_API_KEY is not set; use --method ocr or configure the key", file=sys.stderr)
+        return 2
+    if args.sheet and not is_configured():
+        print("SPREADSHEET_ID is not configured; run without --sheet or set it", file=sys.stderr)
+        return 2
+
+    sources = []
+    for path in args.sources:
+        if not os.path.exists(path):
+            print(f"Not found: {path}", file=sys.stderr)
+            return 2
+        sources.extend(discover(path))
+    if not sources:
+        print("No receipt images found", file=sys.stderr)
+        return 1
+
+    store = IngestStore(args.db)
+    executor = None
+    if args.method in ("ocr", "auto"):
+        executor = ProcessPoolExecutor(max_workers=args.ocr_processes, initializer=warm_worker)
+    print(f"Ingesting {len(sources)} images with {args.method}, {args.concurrency} at a time into {args.db}",
+          file=sys.stderr)
+
+    start = time.monotonic()
+    try:
+        counts = asyncio.run(run(
+            sources, store, method=args.method, concurrency=args.concurrency,
+            read_ahead=args.read_ahead or 4 * args.concurrency, to_sheet=args.sheet,
+            retry_failed=args.retry_failed, resend_unconfirmed=args.resend_unconfirmed, ocr_executor=executor
+        ))
+    except KeyboardInterrupt:
+        print("\nInterrupted; finished receipts are saved, run the same command again to resume",
+              file=sys.stderr)
+        return 130
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    stats = store.stats()
+    print(f"Extracted {counts['done']} receipts ({counts['failed']} failed) in "
+          f"{format_duration(time.monotonic() - start)}; skipped {counts['already_done']} already done, "
+          f"{counts['duplicates']} duplicates, {counts['failed_before']} that failed before")
+    if args.sheet:
+        print(f"Appended {counts['sheet_rows']} rows to the sheet ({counts['sheet_errors']} failed appends)")
+        if counts["sheet_unconfirmed"]:
+            print(f"{counts['sheet_unconfirmed']} receipts were being appended when an earlier run stopped; "
+                  f"check the sheet, then use --resend-unconfirmed to send them again")
+    print(f"Store: {stats['done']} receipts, {stats['items']} items, {stats['failed']} failed")
+    return 1 if counts["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
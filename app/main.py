@@ -1,15 +1,30 @@
 from fastapi import FastAPI, File, UploadFile, Request, Form
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 import json
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, Optional
 import os
+import tempfile
+from urllib.parse import quote
 from dotenv import load_dotenv
 
-from .agent.vlm import check_api_access, init_openai_client, extract_with_gpt4v
-from .services.sheets import append_to_sheet
+from .agent.vlm import check_api_access, close_async_client
+from .agent.cache import get_extraction_cache
+from .agent.catalog import get_ingredient_catalog, learned_catalog_path
+from .agent.limiter import get_vlm_limiter
+from .agent.metrics import PAYLOAD_BYTES, get_metrics_registry, stage
+from .agent.routing import get_routing_stats
+from .agent.store_templates import get_template_store, learn_from_submission as learn_store_template
+from .services.sheets import is_configured, SPREADSHEET_ID
+from .services.outbox import get_outbox
+from .services.session_store import get_session_store
+from .services.history import get_history_store
+from .services.jobs import get_job_queue, QueueFullError
+from .services.profiling import get_profiler, instrument, is_admin, profiling_enabled, profiling_middleware
+from .services.warmup import get_warmup
 
 # Load environment variables
 load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
@@ -20,146 +35,427 @@ app = FastAPI(title="Receipt OCR Tool")
 templates = Jinja2Templates(directory="app/templates")
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
-# Store extracted data temporarily (in production, use database/session)
-extracted_data = []
-extraction_metadata = {"method": "unknown", "success": True, "error": None}
-uploaded_filename = "unknown_file"
+# Opt-in request profiling; nothing is wrapped unless PROFILING is set
+if profiling_enabled():
+    instrument()
+    app.middleware("http")(profiling_middleware)
 
-def load_upload_history():
-    """Load upload history from JSON file"""
-    try:
-        if os.path.exists("upload_history.json"):
-            with open("upload_history.json", "r") as f:
-                return json.load(f)
-        return []
-    except Exception as e:
-        print(f"Error loading history: {e}")
-        return []
+# Extraction results live in the session store, keyed by a job id that is
+# passed in the URL/form and remembered in a cookie
+SESSION_COOKIE = "receipt_job"
+EMPTY_SESSION = {
+    "data": [],
+    "metadata": {"method": "unknown", "success": True, "error": None},
+    "filename": "unknown_file"
+}
 
-def save_upload_history(history):
-    """Save upload history to JSON file"""
-    try:
-        with open("upload_history.json", "w") as f:
-            json.dump(history, f, indent=2)
-    except Exception as e:
-        print(f"Error saving history: {e}")
+def resolve_job_id(request: Request, job: Optional[str] = None) -> Optional[str]:
+    """Job id from the query/form, falling back to the session cookie"""
+    return job or request.cookies.get(SESSION_COOKIE)
+
+async def load_session(request: Request, job: Optional[str] = None) -> Dict:
+    """Extraction state for the request's job (empty state if unknown/expired)"""
+    job_id = resolve_job_id(request, job)
+    if not job_id:
+        return EMPTY_SESSION
+    state = await run_in_threadpool(get_session_store().get, job_id)
+    if state is None:
+        return {
+            **EMPTY_SESSION,
+            "metadata": {"method": "unknown", "success": False, "error": "Review session expired or not found"}
+        }
+    return state
 
 def add_to_history(filename, method, items_count):
     """Add a new upload to history"""
-    history = load_upload_history()
-    
-    new_entry = {
-        "filename": filename,
-        "method": method,
-        "timestamp": datetime.now().isoformat(),
-        "items_count": items_count
-    }
-    
-    history.append(new_entry)
-    
-    # Keep only last 50 uploads
-    if len(history) > 50:
-        history = history[-50:]
-    
-    save_upload_history(history)
-    return new_entry
+    return get_history_store().add(filename, method, items_count)
+
+def learn_ingredients(extracted: List[Dict], approved: List[Dict]):
+    """Add reviewed ingredient names to the catalogue and persist them"""
+    catalog = get_ingredient_catalog()
+    if catalog.learn_from_submission(extracted, approved):
+        catalog.save_learned(learned_catalog_path())
+
+def service_metrics() -> List:
+    """Cache, queue, outbox, session, routing and VLM limiter figures for /metrics"""
+    cache = get_extraction_cache().stats()
+    limiter = get_vlm_limiter().stats()
+    jobs = get_job_queue().stats()
+    outbox = get_outbox().stats()
+    sessions = get_session_store().stats()
+    routing = get_routing_stats().stats()
+    return [
+        ("extraction_cache_lookups_total", "counter", "Extraction cache lookups by result",
+         [({"result": result}, cache[result]) for result in ("memory_hits", "disk_hits", "misses", "coalesced")]),
+        ("extraction_cache_entries", "gauge", "Extractions held in memory", [({}, cache["memory_entries"])]),
+        ("extraction_cache_in_flight", "gauge", "Extractions being computed", [({}, cache["in_flight"])]),
+        ("job_queue_length", "gauge", "Receipts waiting for a worker", [({}, jobs["queue_length"])]),
+        ("job_workers_busy", "gauge", "Workers processing a receipt", [({}, jobs["busy_workers"])]),
+        ("job_workers", "gauge", "Worker pool size", [({}, jobs["workers"])]),
+        ("job_queue_rejected_total", "counter", "Uploads refused because the queue was full",
+         [({}, jobs["rejected"])]),
+        ("outbox_depth", "gauge", "Rows waiting to be sent to the sheet", [({}, outbox["depth"])]),
+        ("outbox_dead_letter", "gauge", "Rows that could not be sent", [({}, outbox["dead_letter"])]),
+        ("outbox_oldest_pending_seconds", "gauge", "Age of the oldest unsent row",
+         [({}, outbox["oldest_pending_age"])]),
+        ("session_entries", "gauge", "Review sessions held", [({}, sessions["entries"])]),
+        ("session_bytes", "gauge", "Size of the review sessions held", [({}, sessions["bytes"])]),
+        ("routing_decisions_total", "counter", "Local-first routing decisions",
+         [({"decision": decision}, count) for decision, count in routing["decisions"].items()]),
+        ("vlm_concurrency_limit", "gauge", "Current adaptive limit on concurrent vision calls",
+         [({}, limiter["limit"])]),
+        ("vlm_in_flight", "gauge", "Vision calls in progress", [({}, limiter["in_flight"])]),
+        ("vlm_waiting", "gauge", "Vision calls waiting for a slot", [({}, limiter["waiting"])]),
+    ]
+
+get_metrics_registry().add_collector("services", service_metrics)
+
+def format_timestamp(entry: Dict) -> Dict:
+    """Add a display timestamp to a history entry"""
+    try:
+        dt = datetime.fromisoformat(entry["timestamp"])
+        entry["formatted_timestamp"] = dt.strftime("%Y-%m-%d %H:%M:%S")
+    except (KeyError, TypeError, ValueError):
+        entry["formatted_timestamp"] = entry.get("timestamp")
+    return entry
+
+@app.on_event("startup")
+async def start_warmup():
+    """Optionally load heavy dependencies (WARMUP, OCR_WARMUP) in the background"""
+    get_warmup().start()
+
+@app.on_event("startup")
+async def start_outbox_flusher():
+    """Start sending queued sheet rows in the background"""
+    if is_configured():
+        get_outbox().start()
+
+@app.on_event("startup")
+async def start_job_workers():
+    """Start the receipt-processing worker pool"""
+    get_job_queue().start()
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    """Stop the worker pool and the OCR processes"""
+    await get_job_queue().stop()
+
+@app.on_event("shutdown")
+async def close_vlm_client():
+    """Close the pooled VLM HTTP client"""
+    await close_async_client()
+
+@app.on_event("shutdown")
+async def stop_outbox_flusher():
+    """Stop the outbox flusher; unsent rows stay queued on disk"""
+    await run_in_threadpool(get_outbox().stop)
 
 @app.get("/", response_class=HTMLResponse)
 async def upload_page(request: Request):
     """Upload page for receipt images"""
     return templates.TemplateResponse("upload.html", {"request": request})
 
-@app.post("/upload")
-async def upload_receipt(file: UploadFile = File(...), method: str = Form(...)):
-    """Handle receipt image upload and VLM processing"""
-    global extracted_data, extraction_metadata, uploaded_filename
+async def spool_upload(file: UploadFile, chunk_size: int = 1024 * 1024):
+    """
+    Read an upload into memory, spilling to an anonymous temp file only when
+    it grows past UPLOAD_SPOOL_THRESHOLD bytes
     
+    Returns:
+        memoryview over the bytes, or an open temp file positioned at 0
+    """
+    threshold = int(os.getenv("UPLOAD_SPOOL_THRESHOLD", str(16 * 1024 * 1024)))
+    buffer = bytearray()
+    spool = None
+    
+    with stage("upload"):
+        while chunk := await file.read(chunk_size):
+            if spool is None and len(buffer) + len(chunk) <= threshold:
+                buffer += chunk
+                continue
+            if spool is None:
+                spool = tempfile.TemporaryFile()
+                spool.write(buffer)
+                buffer = bytearray()
+            spool.write(chunk)
+    
+    if spool is not None:
+        PAYLOAD_BYTES.observe(spool.tell(), "upload")
+        spool.seek(0)
+        return spool
+    PAYLOAD_BYTES.observe(len(buffer), "upload")
+    return memoryview(buffer)
+
+def wants_json(request: Request) -> bool:
+    """Whether the client asked for a JSON reply rather than a page"""
+    accept = request.headers.get("accept", "")
+    return "application/json" in accept and "text/html" not in accept
+
+@app.post("/upload")
+async def upload_receipt(request: Request, file: UploadFile = File(...), method: str = Form(...)):
+    """Queue a receipt image for processing and return its job id"""
     # Store the filename for history tracking
     uploaded_filename = file.filename or "unknown"
     
-    # Save uploaded file temporarily
-    temp_path = f"temp_{file.filename}"
-    with open(temp_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+    # Keep the upload in memory; nothing is written next to the app
+    image = await spool_upload(file)
     
     try:
-        # Use GPT-4V for extraction
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            extraction_metadata = {
-                "method": "vlm", 
-                "success": False, 
-                "error": "OpenAI API key not configured"
-            }
-            extracted_data = []
-        else:
-            # Initialize OpenAI client and extract with GPT-4V
-            init_openai_client(api_key)
-            extracted_data = extract_with_gpt4v(temp_path)
-            
-            if not extracted_data:
-                extraction_metadata = {
-                    "method": "vlm", 
-                    "success": False, 
-                    "error": "VLM extraction failed - no items found"
-                }
-            else:
-                extraction_metadata = {
-                    "method": "vlm", 
-                    "success": True, 
-                    "error": None
-                }
-        
-        # Clean up temp file
-        os.remove(temp_path)
-        
-        # Redirect to review page
-        return RedirectResponse(url="/review", status_code=303)
-        
+        # The job owns the image from here on and closes it when done
+        job_id = await get_job_queue().submit(image, uploaded_filename, method)
+    except QueueFullError as e:
+        if not isinstance(image, memoryview):
+            image.close()
+        return JSONResponse({"error": str(e)}, status_code=503, headers={"Retry-After": "5"})
     except Exception as e:
-        os.remove(temp_path) if os.path.exists(temp_path) else None
+        if not isinstance(image, memoryview):
+            image.close()
         return {"error": f"Processing failed: {str(e)}"}
+    
+    if wants_json(request):
+        return JSONResponse({"job_id": job_id, "status_url": f"/jobs/{job_id}"}, status_code=202)
+    
+    # Redirect to review page, which waits for the job to finish
+    response = RedirectResponse(url=f"/review?job={job_id}", status_code=303)
+    response.set_cookie(SESSION_COOKIE, job_id, httponly=True, samesite="lax")
+    return response
+
+@app.post("/upload/batch")
+async def upload_receipts(request: Request, files: List[UploadFile] = File(...), method: str = Form("vlm")):
+    """Process several receipts as one job, reviewed and submitted together"""
+    receipts = []
+    for file in files:
+        receipts.append((file.filename or "unknown", await spool_upload(file)))
+
+    try:
+        # The job owns the images from here on and closes them when done
+        job_id = await get_job_queue().submit_batch(receipts, method)
+    except QueueFullError as e:
+        for _, image in receipts:
+            if not isinstance(image, memoryview):
+                image.close()
+        return JSONResponse({"error": str(e)}, status_code=503, headers={"Retry-After": "5"})
+    except Exception as e:
+        for _, image in receipts:
+            if not isinstance(image, memoryview):
+                image.close()
+        return {"error": f"Processing failed: {str(e)}"}
+
+    if wants_json(request):
+        return JSONResponse({"job_id": job_id, "status_url": f"/jobs/{job_id}"}, status_code=202)
+
+    response = RedirectResponse(url=f"/review?job={job_id}", status_code=303)
+    response.set_cookie(SESSION_COOKIE, job_id, httponly=True, samesite="lax")
+    return response
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """Job status and results; wait=N long-polls up to N seconds for completion"""
+    queue = get_job_queue()
+    if wait > 0:
+        job = await queue.wait(job_id, min(wait, 60))
+    else:
+        job = await queue.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return job
+
+def sse_event(event: str, data) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, after: int = 0):
+    """
+    Server-sent events for a job: one "item" event per extracted item as it
+    arrives (skipping the first `after`), then "done" with the final status
+    """
+    async def stream():
+        sent = max(after, 0)
+        async for job in get_job_queue().follow(job_id):
+            for item in job["data"][sent:]:
+                yield sse_event("item", item)
+            sent = max(sent, len(job["data"]))
+            if job["status"] in ("done", "failed"):
+                yield sse_event("done", {
+                    "status": job["status"],
+                    "count": len(job["data"]),
+                    "metadata": job["metadata"]
+                })
+                return
+            if "progress" in job:
+                yield sse_event("progress", job["progress"])
+        yield sse_event("done", {"status": "failed", "count": 0, "metadata": {"error": "Job not found"}})
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Stage latencies, payload sizes, token usage, errors and queue gauges in Prometheus text format"""
+    body = await run_in_threadpool(get_metrics_registry().render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+@app.get("/ready")
+async def readiness():
+    """Readiness probe: 503 until the startup warmup phases have finished"""
+    warmup = get_warmup()
+    return JSONResponse(warmup.status(), status_code=200 if warmup.ready else 503)
+
+@app.get("/admin/profiles", response_class=HTMLResponse)
+async def profiles_page(request: Request, limit: int = 20):
+    """Slowest recently profiled requests"""
+    if not is_admin(request):
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+    profiler = get_profiler()
+    token = request.query_params.get("token")
+    return templates.TemplateResponse("profiles.html", {
+        "request": request,
+        "profiles": profiler.recent(min(max(limit, 1), 200)),
+        "stats": profiler.stats(),
+        "token_query": f"?token={quote(token)}" if token else ""
+    })
+
+@app.get("/api/profiles")
+async def get_profiles(request: Request, limit: int = 20):
+    """Slowest recently profiled requests as JSON"""
+    if not is_admin(request):
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+    profiler = get_profiler()
+    return {"profiler": profiler.stats(), "profiles": profiler.recent(min(max(limit, 1), 200))}
+
+@app.get("/api/profiles/{profile_id}")
+async def get_profile(request: Request, profile_id: str):
+    """Spans, per-job stage timings and hottest stacks of one profiled request"""
+    if not is_admin(request):
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+    profile = get_profiler().get(profile_id)
+    if profile is None:
+        return JSONResponse({"error": "Profile not found"}, status_code=404)
+    return profile.to_dict()
+
+@app.get("/api/profiles/{profile_id}/flame", response_class=PlainTextResponse)
+async def get_profile_flame(request: Request, profile_id: str):
+    """Folded stacks of one profiled request, for flamegraph.pl or speedscope"""
+    if not is_admin(request):
+        return PlainTextResponse("Forbidden", status_code=403)
+    profile = get_profiler().get(profile_id)
+    if profile is None:
+        return PlainTextResponse("Profile not found", status_code=404)
+    return PlainTextResponse(profile.folded())
+
+@app.get("/api/jobs")
+async def get_job_stats():
+    """Queue length, worker utilisation and per-job timings"""
+    return get_job_queue().stats()
 
 @app.get("/review", response_class=HTMLResponse)
-async def review_page(request: Request):
+async def review_page(request: Request, job: Optional[str] = None):
     """Review page with editable table of extracted data"""
+    session = await load_session(request, job)
     return templates.TemplateResponse("review.html", {
         "request": request, 
-        "data": extracted_data,
-        "metadata": extraction_metadata
+        "data": session["data"],
+        "metadata": session["metadata"],
+        "status": session.get("status", "done"),
+        "job_id": resolve_job_id(request, job) or ""
     })
 
 @app.post("/submit")
-async def submit_to_sheets(items: str = Form(...)):
-    """Submit approved data to Google Sheets"""
+async def submit_to_sheets(request: Request, items: str = Form(...), job: Optional[str] = Form(None)):
+    """Queue approved data for Google Sheets"""
     try:
         # Parse the JSON string from form
         approved_items = json.loads(items)
         
-        # Send to Google Sheets with filename for history tracking
-        result = append_to_sheet(approved_items, uploaded_filename)
+        if not is_configured():
+            return {"error": f"Failed to submit: Spreadsheet ID not configured. Current value: {SPREADSHEET_ID}"}
+        
+        session = await load_session(request, job)
+        uploaded_filename = session["filename"]
+        
+        # Write to the local outbox; the background flusher batches rows into the sheet
+        outbox = get_outbox()
+        await run_in_threadpool(outbox.enqueue, approved_items, uploaded_filename)
+        outbox.start()
+        
+        # Add to history
+        await run_in_threadpool(
+            add_to_history, uploaded_filename, session["metadata"].get("method", "unknown"), len(approved_items)
+        )
+
+        # Names the user approved or corrected extend the ingredient catalogue
+        await run_in_threadpool(learn_ingredients, session["data"], approved_items)
+        # and teach the store's template how its receipts lay out items
+        await run_in_threadpool(learn_store_template, session["metadata"].get("layout"), approved_items)
+        
+        # The review is done, free its state
+        job_id = resolve_job_id(request, job)
+        if job_id:
+            await run_in_threadpool(get_session_store().delete, job_id)
         
-        if result.get('success'):
-            # Add to history
-            add_to_history(uploaded_filename, extraction_metadata.get("method", "unknown"), len(approved_items))
-            
-            # Redirect to history page instead of showing success message
-            return RedirectResponse(url="/history", status_code=303)
-        else:
-            return {"error": f"Failed to submit: {result.get('error', 'Unknown error')}"}
+        # Redirect to history page instead of showing success message
+        response = RedirectResponse(url="/history", status_code=303)
+        response.delete_cookie(SESSION_COOKIE)
+        return response
         
     except Exception as e:
         return {"error": f"Failed to submit: {str(e)}"}
 
 @app.get("/api/data")
-async def get_extracted_data():
-    """API endpoint to get current extracted data"""
+async def get_extracted_data(request: Request, job: Optional[str] = None):
+    """API endpoint to get the extracted data for a job"""
+    session = await load_session(request, job)
     return {
-        "data": extracted_data,
-        "metadata": extraction_metadata
+        "data": session["data"],
+        "metadata": session["metadata"],
+        "status": session.get("status", "done")
     }
 
+@app.get("/api/sessions")
+async def get_session_stats():
+    """Session store size and evictions"""
+    return await run_in_threadpool(get_session_store().stats)
+
+@app.get("/api/cache")
+async def get_cache_stats():
+    """Extraction cache hit/miss/coalescing counters"""
+    return get_extraction_cache().stats()
+
+@app.get("/api/routing")
+async def get_routing_decisions():
+    """Local-first routing decisions, latency and estimated API savings"""
+    return get_routing_stats().stats()
+
+@app.get("/api/vlm")
+async def get_vlm_limiter_stats():
+    """Adaptive concurrency limit, latency and throttling of vision calls"""
+    return get_vlm_limiter().stats()
+
+@app.get("/api/catalog")
+async def get_catalog_stats():
+    """Ingredient catalogue size and match threshold"""
+    return get_ingredient_catalog().stats()
+
+@app.get("/api/stores")
+async def get_store_templates():
+    """Stores with learned receipt templates"""
+    return get_template_store().stats()
+
+@app.get("/api/outbox")
+async def get_outbox_stats():
+    """Sheet outbox queue depth and flusher counters"""
+    return await run_in_threadpool(get_outbox().stats)
+
+@app.post("/api/outbox/requeue")
+async def requeue_outbox_failures(request: Request):
+    """Queue the dead-lettered sheet rows again, e.g. after fixing the sheet (admin only)"""
+    if not is_admin(request):
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+    outbox = get_outbox()
+    requeued = await run_in_threadpool(outbox.requeue_failed)
+    outbox.start()
+    return {"requeued": requeued}
+
 @app.post("/test-openai")
 async def test_openai_key(api_key: str = Form(...)):
     """Test OpenAI API key and check available models"""
@@ -170,27 +466,52 @@ async def test_openai_key(api_key: str = Form(...)):
         return {"success": False, "error": str(e)}
 
 @app.get("/history", response_class=HTMLResponse)
-async def history_page(request: Request):
-    """History page showing upload history"""
-    history = load_upload_history()
-    last_upload = history[-1] if history else None
+async def history_page(request: Request, page: int = 1, per_page: int = 10,
+                       method: Optional[str] = None, filename: Optional[str] = None):
+    """History page showing upload history, newest first"""
+    store = get_history_store()
+    page = max(page, 1)
+    per_page = min(max(per_page, 1), 100)
+    
+    entries = await run_in_threadpool(
+        store.query, per_page, (page - 1) * per_page, filename, method
+    )
+    total = await run_in_threadpool(store.count, filename, method)
+    last_upload = await run_in_threadpool(store.latest)
     
     # Format timestamp for display
-    if last_upload and last_upload.get("timestamp"):
-        try:
-            from datetime import datetime
-            dt = datetime.fromisoformat(last_upload["timestamp"])
-            last_upload["formatted_timestamp"] = dt.strftime("%Y-%m-%d %H:%M:%S")
-        except:
-            last_upload["formatted_timestamp"] = last_upload["timestamp"]
+    if last_upload:
+        format_timestamp(last_upload)
+    for entry in entries:
+        format_timestamp(entry)
     
     return templates.TemplateResponse("history.html", {
         "request": request,
         "last_upload": last_upload,
         "spreadsheet_id": os.getenv("SPREADSHEET_ID"),
-        "all_history": history[-10:]  # Show last 10 uploads
+        "all_history": entries,
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "pages": max(1, -(-total // per_page)),
+        "method": method or "",
+        "filename": filename or ""
     })
 
+@app.get("/api/history")
+async def get_history(page: int = 1, per_page: int = 20, method: Optional[str] = None,
+                      filename: Optional[str] = None, since: Optional[str] = None,
+                      until: Optional[str] = None):
+    """Paginated upload history as JSON"""
+    store = get_history_store()
+    page = max(page, 1)
+    per_page = min(max(per_page, 1), 500)
+    entries = await run_in_threadpool(
+        store.query, per_page, (page - 1) * per_page, filename, method, since, until
+    )
+    total = await run_in_threadpool(store.count, filename, method, since, until)
+    return {"entries": entries, "page": page, "per_page": per_page, "total": total}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,184 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+class HistoryStore:
+    """
+    Upload history in SQLite
+
+    Each submit is a single INSERT; queries by time, filename and method are
+    served from indexes, so neither appends nor page views touch the whole
+    history. There is no size cap.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS uploads (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        filename TEXT NOT NULL,
+        method TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        items_count INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS uploads_timestamp ON uploads (timestamp);
+    CREATE INDEX IF NOT EXISTS uploads_filename ON uploads (filename, timestamp);
+    CREATE INDEX IF NOT EXISTS uploads_method ON uploads (method, timestamp);
+    CREATE TABLE IF NOT EXISTS history_meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections aren't shareable)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def add(self, filename: str, method: str, items_count: int,
+            timestamp: Optional[str] = None) -> Dict:
+        """Record one upload and return the stored entry"""
+        entry = {
+            "filename": filename,
+            "method": method,
+            "timestamp": timestamp or datetime.now().isoformat(),
+            "items_count": items_count
+        }
+        cursor = self._connection().execute(
+            "INSERT INTO uploads (filename, method, timestamp, items_count) VALUES (?, ?, ?, ?)",
+            (entry["filename"], entry["method"], entry["timestamp"], entry["items_count"])
+        )
+        entry["id"] = cursor.lastrowid
+        return entry
+
+    def _where(self, filename: Optional[str], method: Optional[str],
+               since: Optional[str], until: Optional[str]):
+        clauses, params = [], []
+        if filename:
+            clauses.append("filename = ?")
+            params.append(filename)
+        if method:
+            clauses.append("method = ?")
+            params.append(method)
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, limit: int = 20, offset: int = 0, filename: Optional[str] = None,
+              method: Optional[str] = None, since: Optional[str] = None,
+              until: Optional[str] = None) -> List[Dict]:
+        """
+        Newest-first page of uploads
+
+        Args:
+            limit: Page size
+            offset: Number of entries to skip
+            filename: Only uploads of this file
+            method: Only uploads extracted with this method
+            since: ISO timestamp lower bound (inclusive)
+            until: ISO timestamp upper bound (exclusive)
+        """
+        where, params = self._where(filename, method, since, until)
+        rows = self._connection().execute(
+            f"SELECT id, filename, method, timestamp, items_count FROM uploads{where} "
+            f"ORDER BY timestamp DESC, id DESC LIMIT ? OFFSET ?",
+            (*params, limit, offset)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self, filename: Optional[str] = None, method: Optional[str] = None,
+              since: Optional[str] = None, until: Optional[str] = None) -> int:
+        """Number of uploads matching the filters"""
+        where, params = self._where(filename, method, since, until)
+        return self._connection().execute(f"SELECT COUNT(*) FROM uploads{where}", params).fetchone()[0]
+
+    def latest(self) -> Optional[Dict]:
+        """Most recent upload, if any"""
+        entries = self.query(limit=1)
+        return entries[0] if entries else None
+
+    def import_json(self, path: str) -> int:
+        """
+        One-time import of the legacy upload_history.json file
+
+        The import is recorded in history_meta, so calling this again for the
+        same file does nothing.
+
+        Returns:
+            Number of entries imported
+        """
+        if not os.path.exists(path):
+            return 0
+
+        key = f"imported:{os.path.abspath(path)}"
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM history_meta WHERE key = ?", (key,)).fetchone():
+                return 0
+
+            with open(path, "r") as f:
+                entries = json.load(f)
+
+            rows = [
+                (
+                    entry.get("filename", "unknown"),
+                    entry.get("method", "unknown"),
+                    entry.get("timestamp") or datetime.now().isoformat(),
+                    int(entry.get("items_count", 0))
+                )
+                for entry in entries
+            ]
+            conn.executemany(
+                "INSERT INTO uploads (filename, method, timestamp, items_count) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            conn.execute(
+                "INSERT INTO history_meta (key, value) VALUES (?, ?)",
+                (key, datetime.now().isoformat())
+            )
+        return len(rows)
+
+_history_store: Optional[HistoryStore] = None
+_history_store_lock = threading.Lock()
+
+def get_history_store() -> HistoryStore:
+    """
+    Return the process-wide history store
+
+    Lives at HISTORY_DB_PATH. On first use it imports the legacy JSON history
+    from HISTORY_IMPORT_PATH (default upload_history.json) if present.
+    """
+    global _history_store
+    if _history_store is None:
+        with _history_store_lock:
+            if _history_store is None:
+                store = HistoryStore(os.getenv("HISTORY_DB_PATH", "data/history.sqlite3"))
+                try:
+                    imported = store.import_json(os.getenv("HISTORY_IMPORT_PATH", "upload_history.json"))
+                    if imported:
+                        print(f"Imported {imported} entries from legacy upload history")
+                except Exception as e:
+                    print(f"Error importing history: {e}")
+                _history_store = store
+    return _history_store
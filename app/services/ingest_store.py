@@ -0,0 +1,140 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+class IngestStore:
+    """
+    Results and checkpoint of bulk ingest runs, in SQLite
+
+    Receipts are keyed by the sha256 of their bytes, so a photo that turns
+    up twice (copied into another folder, or in an archive and on disk) is
+    only extracted once. Each receipt is written as soon as it finishes,
+    which makes every write a checkpoint: a run that is interrupted picks
+    up where it stopped. Source files are remembered by path, size and
+    mtime so a resumed run doesn't read unchanged files again to hash them.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS receipts (
+        hash TEXT PRIMARY KEY,
+        source TEXT NOT NULL,
+        status TEXT NOT NULL,
+        method TEXT NOT NULL,
+        items_count INTEGER NOT NULL DEFAULT 0,
+        items TEXT NOT NULL DEFAULT '[]',
+        error TEXT,
+        retryable INTEGER NOT NULL DEFAULT 0,
+        sheet_status TEXT,
+        finished REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS receipts_status ON receipts (status);
+    CREATE INDEX IF NOT EXISTS receipts_sheet ON receipts (sheet_status);
+    CREATE TABLE IF NOT EXISTS files (
+        source TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime REAL NOT NULL,
+        hash TEXT NOT NULL
+    );
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections aren't shareable)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def known_hash(self, source: str, size: int, mtime: float) -> Optional[str]:
+        """Content hash of an unchanged source file seen before"""
+        row = self._connection().execute(
+            "SELECT hash FROM files WHERE source = ? AND size = ? AND mtime = ?", (source, size, mtime)
+        ).fetchone()
+        return row["hash"] if row else None
+
+    def remember_file(self, source: str, size: int, mtime: float, digest: str):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO files (source, size, mtime, hash) VALUES (?, ?, ?, ?)",
+            (source, size, mtime, digest)
+        )
+
+    def status(self, digest: str) -> Optional[Dict]:
+        """Stored outcome for a receipt (status, retryable, sheet_status), if any"""
+        row = self._connection().execute(
+            "SELECT status, retryable, sheet_status FROM receipts WHERE hash = ?", (digest,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def record(self, digest: str, source: str, method: str, items: List[Dict], metadata: Dict):
+        """Store one finished receipt (replacing an earlier failed attempt)"""
+        success = bool(metadata.get("success")) and bool(items)
+        self._connection().execute(
+            "INSERT OR REPLACE INTO receipts "
+            "(hash, source, status, method, items_count, items, error, retryable, sheet_status, finished) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (digest, source, "done" if success else "failed", method, len(items), json.dumps(items),
+             None if success else metadata.get("error"), int(bool(metadata.get("retryable"))),
+             "pending" if success else None, time.time())
+        )
+
+    def pending_sheet_rows(self, limit: int = 500) -> List[Dict]:
+        """Extracted receipts not yet appended to the sheet, oldest first"""
+        rows = self._connection().execute(
+            "SELECT hash, source, items FROM receipts WHERE sheet_status = 'pending' "
+            "ORDER BY finished LIMIT ?", (limit,)
+        ).fetchall()
+        return [{"hash": row["hash"], "source": row["source"], "items": json.loads(row["items"])}
+                for row in rows]
+
+    def requeue_sheet(self, status: str = "sending") -> int:
+        """Put receipts with a sheet status back in the pending state; returns how many"""
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            return conn.execute("UPDATE receipts SET sheet_status = 'pending' WHERE sheet_status = ?",
+                                (status,)).rowcount
+
+    def count_sheet(self, status: str) -> int:
+        """Number of receipts with a sheet status"""
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM receipts WHERE sheet_status = ?", (status,)
+        ).fetchone()[0]
+
+    def mark_sheet(self, digests: List[str], status: str):
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("UPDATE receipts SET sheet_status = ? WHERE hash = ?",
+                             [(status, digest) for digest in digests])
+
+    def items(self, status: str = "done") -> List[Dict]:
+        """All stored receipts with a status, with their items"""
+        rows = self._connection().execute(
+            "SELECT hash, source, items_count, items, error FROM receipts WHERE status = ? ORDER BY finished",
+            (status,)
+        ).fetchall()
+        return [{**dict(row), "items": json.loads(row["items"])} for row in rows]
+
+    def stats(self) -> Dict:
+        conn = self._connection()
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM receipts GROUP BY status").fetchall())
+        items = conn.execute("SELECT COALESCE(SUM(items_count), 0) FROM receipts").fetchone()[0]
+        sheet = dict(conn.execute(
+            "SELECT sheet_status, COUNT(*) FROM receipts WHERE sheet_status IS NOT NULL GROUP BY sheet_status"
+        ).fetchall())
+        return {"done": counts.get("done", 0), "failed": counts.get("failed", 0), "items": items, "sheet": sheet}
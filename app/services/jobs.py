@@ -0,0 +1,492 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from ..agent.imaging import ImageSource, read_image_bytes
+from ..agent.metrics import JOBS, STAGE_SECONDS, observe_timings
+from ..agent.pipeline import (
+    extract_receipt_auto, extract_receipt_local, extract_receipt_vlm, process_batch, warm_ocr_worker,
+    warm_worker
+)
+from .session_store import get_session_store
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no room for another receipt"""
+
+class JobQueue:
+    """
+    Bounded queue of receipt-processing jobs
+
+    /upload enqueues a job and returns its id straight away. A fixed pool of
+    asyncio workers drains the queue: VLM jobs run on the event loop (the
+    vision call is async I/O and image preprocessing already runs in
+    threads), OCR jobs are shipped to a process pool because EasyOCR is CPU
+    bound and holds the GIL. "auto" jobs run OCR first and only call the
+    vision model when the local result scores low. Job state is kept in the session store, so any
+    worker process sharing that store can answer status requests.
+
+    While a job runs, its record lives in memory: streamed items and batch
+    progress wake followers at once, and are written to the store at most
+    every progress_interval seconds (for other processes) and once at the end.
+    """
+
+    def __init__(self, workers: int = 4, max_queue: int = 100, ocr_processes: int = 1,
+                 history_size: int = 200, progress_interval: float = 1.0):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.ocr_processes = ocr_processes
+        self.progress_interval = progress_interval
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._done_events: Dict[str, asyncio.Event] = {}
+        self._change_events: Dict[str, asyncio.Event] = {}
+        self._batch_tasks = set()
+        self._live: Dict[str, Dict] = {}
+        self._batch_pending = 0
+        self._saves: Dict[str, asyncio.Task] = {}
+        self._saved_at: Dict[str, float] = {}
+
+        self._busy = 0
+        self._busy_seconds = 0.0
+        self._started_at = None
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0}
+        self._recent = deque(maxlen=history_size)
+
+    @property
+    def store(self):
+        return get_session_store()
+
+    def start(self):
+        """Start the worker tasks on the running event loop"""
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._started_at = time.monotonic()
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"receipt-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self):
+        """Cancel the workers and shut the OCR process pool down"""
+        for task in [*self._tasks, *self._batch_tasks]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._batch_tasks, return_exceptions=True)
+        self._batch_tasks = set()
+        self._batch_pending = 0
+        self._tasks = []
+        self._queue = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+
+    def _ocr_pool(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.ocr_processes, initializer=warm_worker
+            )
+        return self._process_pool
+
+    async def warm_ocr_pool(self, rounds: int = 100) -> int:
+        """
+        Start the OCR worker processes now and load the models in each
+
+        One warm task goes to each worker; a worker that finished early can
+        take a slower one's task, so rounds repeat until every worker has
+        answered (or rounds run out).
+
+        Returns:
+            Number of workers warmed
+        """
+        loop = asyncio.get_running_loop()
+        pool = self._ocr_pool()
+        pids = set()
+        for _ in range(rounds):
+            pids.update(await asyncio.gather(*(
+                loop.run_in_executor(pool, warm_ocr_worker) for _ in range(self.ocr_processes)
+            )))
+            if len(pids) >= self.ocr_processes:
+                break
+        return len(pids)
+
+    async def submit(self, image: ImageSource, filename: str, method: str = "vlm") -> str:
+        """
+        Queue a receipt for processing
+
+        The job takes ownership of image; file objects are closed once the
+        job has finished with them.
+
+        Returns:
+            The new job id
+
+        Raises:
+            QueueFullError: If max_queue jobs are already waiting
+        """
+        self.start()
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "status": "queued",
+            "method": method,
+            "filename": filename,
+            "created": time.time(),
+            "data": [],
+            "metadata": {"method": method, "success": True, "error": None}
+        }
+
+        self._check_capacity(1)
+
+        await asyncio.to_thread(self.store.put, job_id, job)
+        try:
+            if self._waiting() >= self.max_queue:
+                raise asyncio.QueueFull
+            self._queue.put_nowait((job_id, image, time.monotonic()))
+        except asyncio.QueueFull:
+            # Filled up while the job record was being written
+            await asyncio.to_thread(self.store.delete, job_id)
+            self._counters["rejected"] += 1
+            raise QueueFullError(f"Job queue is full ({self.max_queue} waiting)")
+        self._done_events[job_id] = asyncio.Event()
+        self._change_events[job_id] = asyncio.Event()
+        self._counters["submitted"] += 1
+        return job_id
+
+    async def submit_batch(self, receipts: List[Tuple[str, ImageSource]], method: str = "vlm") -> str:
+        """
+        Process several receipts as one job
+
+        The receipts run through process_batch, which overlaps decoding,
+        extraction and parsing across them, instead of taking one worker slot
+        each. The job's data is the combined item list and
+        metadata["receipts"] has the per-receipt outcome; progress is updated
+        as receipts finish. Takes ownership of the images like submit().
+
+        Every receipt of a batch counts against max_queue until it has
+        finished, like a queued single upload.
+
+        Returns:
+            The new job id
+
+        Raises:
+            QueueFullError: If the batch doesn't fit in the queue
+        """
+        self.start()
+        self._check_capacity(len(receipts))
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "status": "running",
+            "method": method,
+            "filename": ", ".join(name for name, _ in receipts),
+            "created": time.time(),
+            "data": [],
+            "metadata": {"method": method, "success": True, "error": None},
+            "progress": {"done": 0, "total": len(receipts)}
+        }
+        # Claim the room before the first await so concurrent submissions see it
+        self._batch_pending += len(receipts)
+        try:
+            await asyncio.to_thread(self.store.put, job_id, job)
+        except BaseException:
+            self._batch_pending -= len(receipts)
+            raise
+        self._done_events[job_id] = asyncio.Event()
+        self._change_events[job_id] = asyncio.Event()
+        self._counters["submitted"] += 1
+
+        task = asyncio.create_task(self._run_batch(job_id, job, receipts), name=f"receipt-batch-{job_id}")
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+        return job_id
+
+    async def _run_batch(self, job_id: str, job: Dict, receipts: List[Tuple[str, ImageSource]]):
+        start = time.monotonic()
+        ocr_executor = self._ocr_pool() if job["method"] in ("ocr", "auto") else None
+
+        def on_result(result: Dict):
+            observe_timings(result["metadata"].get("timings", {}))
+            job["progress"]["done"] += 1
+            self._batch_pending -= 1
+            self._publish(job_id, job)
+
+        self._live[job_id] = job
+
+        try:
+            results = await process_batch(receipts, job["method"], ocr_executor=ocr_executor, on_result=on_result)
+            succeeded = [result for result in results if result["metadata"].get("success")]
+            data = [item for result in results for item in result["items"]]
+            metadata = {
+                "method": job["method"],
+                "success": bool(succeeded),
+                "error": None if succeeded else "No items found in any receipt",
+                "receipts": [
+                    {
+                        "filename": result["filename"],
+                        "items_count": len(result["items"]),
+                        "success": result["metadata"].get("success", False),
+                        "error": result["metadata"].get("error"),
+                        "retryable": result["metadata"].get("retryable", False),
+                        "timings": result["metadata"].get("timings", {})
+                    }
+                    for result in results
+                ]
+            }
+            status = "done"
+            self._counters["completed"] += 1
+        except Exception as e:
+            data = []
+            metadata = {"method": job["method"], "success": False, "error": f"Processing failed: {e}"}
+            status = "failed"
+            self._counters["failed"] += 1
+        finally:
+            # Receipts that never reported (the batch failed or was cancelled) free their room too
+            self._batch_pending -= len(receipts) - job["progress"]["done"]
+            for _, image in receipts:
+                if hasattr(image, "close"):
+                    image.close()
+
+        elapsed = time.monotonic() - start
+        metadata["timings"] = {
+            "run": round(elapsed, 4),
+            "receipts_per_minute": round(len(receipts) * 60 / elapsed, 2) if elapsed else 0.0
+        }
+        job = {**job, "status": status, "data": data, "metadata": metadata, "finished": time.time()}
+        await self._save_final(job_id, job)
+        JOBS.inc(1, job["method"], job["status"])
+        self._recent.append({"id": job_id, "method": job["method"], "status": job["status"],
+                             "queued": 0.0, "run": round(elapsed, 4)})
+        self._finished(job_id)
+
+    def _waiting(self) -> int:
+        """Queued single receipts plus unfinished batch receipts"""
+        return (self._queue.qsize() if self._queue is not None else 0) + self._batch_pending
+
+    def _check_capacity(self, receipts: int):
+        if self._waiting() + receipts > self.max_queue:
+            self._counters["rejected"] += 1
+            raise QueueFullError(
+                f"Job queue is full ({self._waiting()} of {self.max_queue} waiting, {receipts} more requested)"
+            )
+
+    async def _worker(self):
+        while True:
+            job_id, image, enqueued_at = await self._queue.get()
+            started_at = time.monotonic()
+            self._busy += 1
+            try:
+                await self._run(job_id, image, started_at - enqueued_at)
+            except Exception as e:
+                print(f"Job {job_id} crashed: {e}")
+            finally:
+                self._busy -= 1
+                self._busy_seconds += time.monotonic() - started_at
+                self._queue.task_done()
+                if hasattr(image, "close"):
+                    image.close()
+                self._finished(job_id)
+
+    async def _run(self, job_id: str, image: ImageSource, queued_seconds: float):
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None:
+            return
+        job["status"] = "running"
+        await asyncio.to_thread(self.store.put, job_id, job)
+        self._changed(job_id)
+
+        def on_item(item: Dict):
+            # Publish streamed items so the review page can show them straight away
+            job["data"].append(item)
+            self._publish(job_id, job)
+
+        self._live[job_id] = job
+
+        start = time.monotonic()
+        try:
+            if job["method"] == "auto":
+                items, metadata = await extract_receipt_auto(image, self._ocr_pool(), job["filename"])
+            elif job["method"] == "ocr":
+                image_bytes = bytes(await asyncio.to_thread(read_image_bytes, image))
+                loop = asyncio.get_running_loop()
+                items, metadata = await loop.run_in_executor(
+                    self._ocr_pool(), extract_receipt_local, image_bytes
+                )
+            else:
+                items, metadata = await extract_receipt_vlm(image, on_item)
+            status = "done"
+            self._counters["completed"] += 1
+        except Exception as e:
+            items, metadata = [], {"method": job["method"], "success": False, "error": f"Processing failed: {e}"}
+            status = "failed"
+            self._counters["failed"] += 1
+
+        timings = dict(metadata.get("timings", {}))
+        timings["queued"] = round(queued_seconds, 4)
+        timings["run"] = round(time.monotonic() - start, 4)
+        metadata["timings"] = timings
+        # OCR stages ran in a worker process; record them from their timings
+        observe_timings(timings)
+        STAGE_SECONDS.observe(queued_seconds, "queue_wait")
+        JOBS.inc(1, job["method"], status)
+        job = {**job, "status": status, "data": items, "metadata": metadata, "finished": time.time()}
+        await self._save_final(job_id, job)
+        self._recent.append({"id": job_id, "method": job["method"], "status": job["status"], **timings})
+
+    def _publish(self, job_id: str, job: Dict):
+        """
+        Wake followers of a running job and, at most every progress_interval,
+        write it to the store in the background
+
+        Runs on the event loop for every streamed item, so the store write
+        (a blocking serialisation of the whole job) happens off it, one at a time.
+        """
+        self._changed(job_id)
+        if job_id in self._saves or time.monotonic() - self._saved_at.get(job_id, 0.0) < self.progress_interval:
+            return
+        self._saved_at[job_id] = time.monotonic()
+        snapshot = {**job, "data": list(job["data"])}
+        task = asyncio.create_task(asyncio.to_thread(self.store.put, job_id, snapshot))
+        self._saves[job_id] = task
+        task.add_done_callback(lambda _: self._saves.pop(job_id, None))
+
+    async def _save_final(self, job_id: str, job: Dict):
+        """
+        Write a finished job, after any progress write still in flight
+
+        Takes a new record rather than the live one, so readers keep seeing
+        the job running until its final state is in the store.
+        """
+        pending = self._saves.get(job_id)
+        if pending is not None:
+            await asyncio.gather(pending, return_exceptions=True)
+        try:
+            await asyncio.to_thread(self.store.put, job_id, job)
+        finally:
+            self._live.pop(job_id, None)
+            self._saved_at.pop(job_id, None)
+
+    def _changed(self, job_id: str):
+        """Wake everyone following a job; followers pick up a fresh event"""
+        event = self._change_events.get(job_id)
+        if event is not None:
+            self._change_events[job_id] = asyncio.Event()
+            event.set()
+
+    def _finished(self, job_id: str):
+        self._changed(job_id)
+        self._change_events.pop(job_id, None)
+        event = self._done_events.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    async def follow(self, job_id: str, poll: float = 0.25) -> AsyncIterator[Dict]:
+        """
+        Yield the job record every time it changes, until it finishes
+
+        Jobs running in this process wake followers directly; jobs owned by
+        another worker process are polled through the shared store.
+        """
+        last = None
+        while True:
+            event = self._change_events.get(job_id)
+            job = await self.get(job_id)
+            if job is None:
+                return
+            marker = (job["status"], len(job["data"]), json.dumps(job.get("progress")))
+            if marker != last:
+                last = marker
+                yield job
+            if job["status"] in ("done", "failed"):
+                return
+            if event is not None:
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=15)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(poll)
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        """Current state of a job (from memory while it runs in this process)"""
+        live = self._live.get(job_id)
+        if live is not None:
+            return {**live, "data": list(live["data"])}
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict]:
+        """
+        Wait up to timeout seconds for a job to finish
+
+        Jobs queued in this process are awaited directly; jobs owned by
+        another worker process are polled through the shared store.
+        """
+        deadline = time.monotonic() + timeout
+        event = self._done_events.get(job_id)
+        if event is not None:
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return await self.get(job_id)
+
+        while True:
+            job = await self.get(job_id)
+            if job is None or job["status"] in ("done", "failed") or time.monotonic() >= deadline:
+                return job
+            await asyncio.sleep(min(0.25, max(0.0, deadline - time.monotonic())))
+
+    def stats(self) -> Dict:
+        """Queue length, worker utilisation and recent per-job timings"""
+        uptime = time.monotonic() - self._started_at if self._started_at else 0.0
+        recent = list(self._recent)
+        runs = sorted(entry["run"] for entry in recent)
+        waits = sorted(entry["queued"] for entry in recent)
+        return {
+            "queue_length": self._queue.qsize() if self._queue is not None else 0,
+            "batch_receipts": self._batch_pending,
+            "max_queue": self.max_queue,
+            "workers": self.workers,
+            "busy_workers": self._busy,
+            "utilisation": round(self._busy_seconds / (uptime * self.workers), 4) if uptime and self.workers else 0.0,
+            "ocr_processes": self.ocr_processes,
+            **self._counters,
+            "run_seconds": _summary(runs),
+            "queued_seconds": _summary(waits),
+            "recent": recent[-20:]
+        }
+
+def _summary(values: list) -> Dict:
+    """p50/p95/max of a sorted list"""
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "max": 0.0}
+    return {
+        "p50": values[len(values) // 2],
+        "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+        "max": values[-1]
+    }
+
+_job_queue: Optional[JobQueue] = None
+
+def get_job_queue() -> JobQueue:
+    """
+    Return the process-wide job queue
+
+    Sized through JOB_WORKERS, JOB_MAX_QUEUE and OCR_PROCESSES;
+    JOB_PROGRESS_INTERVAL is how often (seconds) a running job's progress
+    is written to the session store.
+    """
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(
+            workers=int(os.getenv("JOB_WORKERS", "4")),
+            max_queue=int(os.getenv("JOB_MAX_QUEUE", "100")),
+            ocr_processes=int(os.getenv("OCR_PROCESSES", "1")),
+            progress_interval=float(os.getenv("JOB_PROGRESS_INTERVAL", "1.0"))
+        )
+    return _job_queue
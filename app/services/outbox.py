@@ -0,0 +1,313 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from .sheets import append_rows, is_retryable_error, is_row_error, rows_from_items
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending_rows (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    row TEXT NOT NULL,
+    source TEXT,
+    created REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS pending_rows_available ON pending_rows (available_at, id);
+CREATE TABLE IF NOT EXISTS failed_rows (
+    id INTEGER PRIMARY KEY,
+    row TEXT NOT NULL,
+    source TEXT,
+    created REAL NOT NULL,
+    failed REAL NOT NULL,
+    error TEXT
+);
+"""
+
+class SheetsOutbox:
+    """
+    Durable write-behind queue for sheet appends
+
+    /submit writes rows to a local SQLite database and returns. A background
+    flusher claims pending rows in id order, sends them to Sheets as one
+    values().append call, and deletes them on success. Claims are leases
+    stored in the database (available_at), so several worker processes can
+    share one outbox file without sending a row twice while a lease is held.
+    Transient errors push the lease out with jittered exponential backoff.
+    A batch refused for its values is bisected so only the bad rows are
+    moved to failed_rows (requeue_failed sends them again once fixed). Errors
+    that would fail every row (credentials, permissions, a missing
+    spreadsheet) pause the flusher with backoff and keep the rows pending.
+    """
+
+    def __init__(self, db_path: str, append: Callable[[List[List[str]]], int] = append_rows,
+                 batch_size: int = 500, flush_interval: float = 2.0, lease_seconds: float = 120,
+                 base_delay: float = 1.0, max_delay: float = 300.0):
+        self.db_path = db_path
+        self.append = append
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lease_seconds = lease_seconds
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._paused_until = 0.0
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "enqueued": 0,
+            "sent_rows": 0,
+            "api_calls": 0,
+            "retries": 0,
+            "pauses": 0,
+            "failed_rows": 0,
+            "last_error": None,
+            "last_flush": None,
+        }
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections aren't shareable)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str, amount: int = 1, **latest):
+        """Add to a counter and record any latest-value fields alongside it"""
+        with self._stats_lock:
+            self._stats[name] += amount
+            self._stats.update(latest)
+
+    def enqueue(self, items: List[Dict], source_filename: str = "unknown") -> int:
+        """
+        Durably queue items for the sheet
+
+        Returns:
+            Number of rows queued
+        """
+        now = time.time()
+        rows = [(json.dumps(row), source_filename, now) for row in rows_from_items(items)]
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("INSERT INTO pending_rows (row, source, created) VALUES (?, ?, ?)", rows)
+        self._count("enqueued", len(rows))
+        self._wakeup.set()
+        return len(rows)
+
+    def _claim(self) -> List[tuple]:
+        """Lease the next batch of rows that are due"""
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            claimed = conn.execute(
+                "SELECT id, row, attempts FROM pending_rows WHERE available_at <= ? ORDER BY id LIMIT ?",
+                (now, self.batch_size)
+            ).fetchall()
+            if claimed:
+                conn.executemany(
+                    "UPDATE pending_rows SET available_at = ? WHERE id = ?",
+                    [(now + self.lease_seconds, row_id) for row_id, _, _ in claimed]
+                )
+        return claimed
+
+    def backoff_delay(self, attempts: int) -> float:
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempts)))
+
+    def flush_once(self) -> int:
+        """
+        Send one batch of due rows
+
+        A batch the API refuses for its values is split in half and each
+        half resent, so only the rows it refuses end up in failed_rows.
+        Nothing is sent while the outbox is paused after an error that no
+        row could get past.
+
+        Returns:
+            Number of rows written to the sheet
+        """
+        if time.time() < self._paused_until:
+            return 0
+        claimed = self._claim()
+        if not claimed:
+            return 0
+
+        sent = 0
+        batches = [claimed]
+        while batches:
+            batch = batches.pop()
+            try:
+                self.append([json.loads(row) for _, row, _ in batch])
+            except Exception as e:
+                print(f"Outbox flush error: {e}")
+                if not is_row_error(e):
+                    retry_at = self._retry(batch + [row for rest in batches for row in rest], e)
+                    if not is_retryable_error(e):
+                        # Credentials, permissions or config: every row would fail the same way
+                        self._paused_until = retry_at
+                        self._count("pauses")
+                    return sent
+                if len(batch) > 1:
+                    middle = len(batch) // 2
+                    batches += [batch[middle:], batch[:middle]]
+                else:
+                    self._dead_letter(batch, e)
+                continue
+
+            self._delete(batch)
+            sent += len(batch)
+            self._count("sent_rows", len(batch), last_flush=time.time())
+            self._count("api_calls")
+        return sent
+
+    def _retry(self, claimed: List[tuple], error: Exception) -> float:
+        """Push the lease on rows out with backoff; returns when they are due again"""
+        attempts = max(a for _, _, a in claimed) + 1
+        retry_at = time.time() + self.backoff_delay(attempts)
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "UPDATE pending_rows SET attempts = ?, available_at = ? WHERE id = ?",
+                [(attempts, retry_at, row_id) for row_id, _, _ in claimed]
+            )
+        self._count("retries", last_error=str(error))
+        return retry_at
+
+    def _dead_letter(self, claimed: List[tuple], error: Exception):
+        """Move rows the API rejected to failed_rows"""
+        ids = [row_id for row_id, _, _ in claimed]
+        placeholders = ",".join("?" * len(ids))
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                f"INSERT INTO failed_rows (id, row, source, created, failed, error) "
+                f"SELECT id, row, source, created, ?, ? FROM pending_rows WHERE id IN ({placeholders})",
+                [time.time(), str(error), *ids]
+            )
+            conn.execute(f"DELETE FROM pending_rows WHERE id IN ({placeholders})", ids)
+        self._count("failed_rows", len(ids), last_error=str(error))
+
+    def _delete(self, claimed: List[tuple]):
+        """Remove rows that reached the sheet"""
+        ids = [row_id for row_id, _, _ in claimed]
+        placeholders = ",".join("?" * len(ids))
+        self._connection().execute(f"DELETE FROM pending_rows WHERE id IN ({placeholders})", ids)
+
+    def requeue_failed(self, ids: Optional[List[int]] = None) -> int:
+        """
+        Move dead-lettered rows back to the queue (all of them, or those ids)
+
+        Returns:
+            Number of rows requeued
+        """
+        where, params = "", []
+        if ids is not None:
+            if not ids:
+                return 0
+            where, params = f" WHERE id IN ({','.join('?' * len(ids))})", list(ids)
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                f"INSERT INTO pending_rows (id, row, source, created) SELECT id, row, source, created FROM failed_rows{where}",
+                params
+            )
+            requeued = conn.execute(f"DELETE FROM failed_rows{where}", params).rowcount
+        self._paused_until = 0.0
+        self._wakeup.set()
+        return requeued
+
+    def flush(self) -> int:
+        """Send batches until nothing is due"""
+        total = 0
+        while True:
+            sent = self.flush_once()
+            if not sent:
+                return total
+            total += sent
+
+    def depth(self) -> int:
+        """Number of rows waiting to be sent"""
+        return self._connection().execute("SELECT COUNT(*) FROM pending_rows").fetchone()[0]
+
+    def stats(self) -> Dict:
+        """Queue depth and flusher counters"""
+        conn = self._connection()
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["depth"] = self.depth()
+        stats["dead_letter"] = conn.execute("SELECT COUNT(*) FROM failed_rows").fetchone()[0]
+        oldest = conn.execute("SELECT MIN(created) FROM pending_rows").fetchone()[0]
+        stats["oldest_pending_age"] = round(time.time() - oldest, 3) if oldest else 0.0
+        stats["running"] = self._thread is not None and self._thread.is_alive()
+        stats["paused_for"] = round(max(0.0, self._paused_until - time.time()), 3)
+        return stats
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Outbox flusher error: {e}")
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+
+    def start(self):
+        """Start the background flusher thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sheets-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """Stop the flusher, giving it a chance to send what is due"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is None:
+            return
+        self._thread.join(timeout)
+        self._thread = None
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Outbox flusher error: {e}")
+
+_outbox: Optional[SheetsOutbox] = None
+_outbox_lock = threading.Lock()
+
+def get_outbox() -> SheetsOutbox:
+    """
+    Return the process-wide outbox
+
+    Configured through OUTBOX_DB_PATH, OUTBOX_BATCH_SIZE and OUTBOX_FLUSH_INTERVAL.
+    """
+    global _outbox
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                _outbox = SheetsOutbox(
+                    os.getenv("OUTBOX_DB_PATH", "data/outbox.sqlite3"),
+                    batch_size=int(os.getenv("OUTBOX_BATCH_SIZE", "500")),
+                    flush_interval=float(os.getenv("OUTBOX_FLUSH_INTERVAL", "2"))
+                )
+    return _outbox
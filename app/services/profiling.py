@@ -0,0 +1,474 @@
+import contextvars
+import functools
+import hmac
+import importlib
+import inspect
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+# Functions that record a span while a profiled request (or the job it
+# queued) runs. They are wrapped in place, signatures unchanged; OCR
+# functions run in worker processes and report their own timings instead.
+PROFILED_FUNCTIONS = [
+    "app.agent.vlm:prepare_request",
+    "app.agent.vlm:prepare_payloads",
+    "app.agent.vlm:extract_prepared_async",
+    "app.agent.vlm:_call_model",
+    "app.agent.cache:ExtractionCache.get_or_extract",
+    "app.agent.pipeline:extract_receipt_vlm",
+    "app.agent.pipeline:extract_receipt_auto",
+    "app.agent.pipeline:parse_receipt_items",
+    "app.agent.pipeline:process_batch",
+    "app.agent.catalog:canonicalize_items",
+    "app.agent.catalog:IngredientCatalog.learn_from_submission",
+    "app.agent.store_templates:learn_from_submission",
+    "app.services.session_store:InMemorySessionStore.get",
+    "app.services.session_store:InMemorySessionStore.put",
+    "app.services.session_store:SQLiteSessionStore.get",
+    "app.services.session_store:SQLiteSessionStore.put",
+    "app.services.outbox:SheetsOutbox.enqueue",
+    "app.services.history:HistoryStore.add",
+    "app.services.sheets:append_rows",
+]
+# Queue hand-offs: submitting links the job to the request's profile and
+# running the job carries that profile into the worker
+JOB_SUBMIT_FUNCTIONS = ["app.services.jobs:JobQueue.submit", "app.services.jobs:JobQueue.submit_batch"]
+JOB_RUN_FUNCTIONS = ["app.services.jobs:JobQueue._run", "app.services.jobs:JobQueue._run_batch"]
+
+PROFILED_PATHS = ("/upload", "/submit")
+MAX_SPANS = 2000
+MAX_LABEL_LENGTH = 128
+MAX_STACK_DEPTH = 64
+
+_current_profile: contextvars.ContextVar = contextvars.ContextVar("current_profile", default=None)
+
+def collapse_stack(frame, limit: int = MAX_STACK_DEPTH) -> str:
+    """Frame chain as one folded-stack line, outermost call first"""
+    names = []
+    while frame is not None and len(names) < limit:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class Profile:
+    """
+    Spans and stack samples for one request and the jobs it queued
+
+    A thread is sampled while it has a span of this profile open. Async
+    spans keep the event loop thread open while they wait, so concurrent
+    work on the loop can show up in the samples too.
+    """
+
+    def __init__(self, profile_id: str, method: str, path: str, label: Optional[str] = None):
+        self.profile_id = profile_id
+        self.label = label
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.seconds: Optional[float] = None
+        self.status: Optional[int] = None
+        self.spans: List[Dict] = []
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.jobs: List[str] = []
+        self.timings: Dict[str, Dict] = {}
+        self._start = time.perf_counter()
+        self._threads: Counter = Counter()
+        self._pending = 1
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str):
+        thread = threading.get_ident()
+        with self._lock:
+            self._threads[thread] += 1
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self._threads[thread] -= 1
+                if self._threads[thread] <= 0:
+                    del self._threads[thread]
+                if len(self.spans) < MAX_SPANS:
+                    span = {"name": name, "start": round(start - self._start, 6),
+                            "seconds": round(end - start, 6), "thread": thread}
+                    if error:
+                        span["error"] = error
+                    self.spans.append(span)
+
+    def sample(self, frames: Dict):
+        """Add one sample of every thread with an open span"""
+        with self._lock:
+            threads = list(self._threads)
+        for thread in threads:
+            frame = frames.get(thread)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+                self.samples += 1
+
+    def folded(self) -> str:
+        """Flame graph data in folded-stack format (flamegraph.pl, speedscope)"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def span_totals(self) -> Dict[str, float]:
+        """Seconds per span name, largest first"""
+        totals: Counter = Counter()
+        for span in self.spans:
+            totals[span["name"]] += span["seconds"]
+        return {name: round(seconds, 4) for name, seconds in totals.most_common()}
+
+    def elapsed(self) -> float:
+        return self.seconds if self.seconds is not None else time.perf_counter() - self._start
+
+    def summary(self) -> Dict:
+        return {
+            "profile_id": self.profile_id,
+            "label": self.label,
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at,
+            "seconds": round(self.elapsed(), 4),
+            "finished": self.seconds is not None,
+            "status": self.status,
+            "jobs": list(self.jobs),
+            "spans": len(self.spans),
+            "samples": self.samples,
+            "top_spans": dict(list(self.span_totals().items())[:5])
+        }
+
+    def to_dict(self, stacks: int = 50) -> Dict:
+        return {
+            **self.summary(),
+            "span_totals": self.span_totals(),
+            "span_list": list(self.spans),
+            "job_timings": dict(self.timings),
+            "top_stacks": [{"stack": stack, "samples": count} for stack, count in self.stacks.most_common(stacks)]
+        }
+
+class Profiler:
+    """
+    Opt-in request profiler
+
+    A sample_rate share of /upload and /submit requests is profiled, plus
+    any admin request sent with an "X-Profile: 1" header or ?profile=1. A
+    profile stays open until the request and every job it queued have
+    finished; the last `history` profiles are kept, keyed by a generated
+    profile id.
+    """
+
+    def __init__(self, enabled: bool = False, sample_rate: float = 0.0, interval: float = 0.005,
+                 history: int = 50, max_seconds: float = 300, output_dir: Optional[str] = None):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.output_dir = output_dir
+        self._active: Dict[str, Profile] = {}
+        self._finished: "OrderedDict[str, Profile]" = OrderedDict()
+        self._history = history
+        self._jobs: Dict[str, Profile] = {}
+        self._done_jobs: deque = deque(maxlen=1000)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def wants(self, path: str, forced: bool) -> bool:
+        """Whether to profile a request to path"""
+        if not self.enabled or not path.startswith(PROFILED_PATHS):
+            return False
+        return forced or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    def start(self, method: str, path: str, label: Optional[str] = None) -> Profile:
+        """Open a profile under a new id (label is free text, e.g. the client's request id)"""
+        profile = Profile(uuid.uuid4().hex, method, path, label[:MAX_LABEL_LENGTH] if label else None)
+        with self._lock:
+            self._active[profile.profile_id] = profile
+        self._ensure_sampler()
+        return profile
+
+    def end_request(self, profile: Profile, status: int):
+        profile.status = status
+        self._release(profile)
+
+    def attach_job(self, job_id: str, profile: Profile):
+        """Keep the profile open until the job has run"""
+        with self._lock:
+            profile.jobs.append(job_id)
+            if job_id in self._done_jobs:
+                # The job finished before submit returned
+                return
+            self._jobs[job_id] = profile
+            profile._pending += 1
+
+    def job_profile(self, job_id: str) -> Optional[Profile]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def job_finished(self, job_id: str, timings: Optional[Dict] = None):
+        with self._lock:
+            profile = self._jobs.pop(job_id, None)
+            if profile is None:
+                self._done_jobs.append(job_id)
+                return
+        if timings:
+            profile.timings[job_id] = timings
+        self._release(profile)
+
+    def _release(self, profile: Profile):
+        with self._lock:
+            profile._pending -= 1
+            if profile._pending > 0:
+                return
+            self._finish(profile)
+
+    def _finish(self, profile: Profile):
+        """Move a profile to the finished list (caller holds the lock)"""
+        profile.seconds = time.perf_counter() - profile._start
+        self._active.pop(profile.profile_id, None)
+        self._finished[profile.profile_id] = profile
+        while len(self._finished) > self._history:
+            self._finished.popitem(last=False)
+        if self.output_dir:
+            threading.Thread(target=self._write, args=(profile,), daemon=True).start()
+
+    def _write(self, profile: Profile):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            base = os.path.join(self.output_dir, profile.profile_id)
+            with open(f"{base}.json", "w") as f:
+                json.dump(profile.to_dict(), f, indent=2)
+            with open(f"{base}.folded", "w") as f:
+                f.write(profile.folded())
+        except OSError as e:
+            print(f"Profile write error: {e}")
+
+    def _expire(self):
+        """Close profiles whose jobs never reported back"""
+        with self._lock:
+            for profile in list(self._active.values()):
+                if profile.elapsed() > self.max_seconds:
+                    for job_id in [job for job, owner in self._jobs.items() if owner is profile]:
+                        self._jobs.pop(job_id)
+                    self._finish(profile)
+
+    def _ensure_sampler(self):
+        self._wakeup.set()
+        if self._sampler is None or not self._sampler.is_alive():
+            self._sampler = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+            self._sampler.start()
+
+    def _sample_loop(self):
+        while True:
+            with self._lock:
+                active = list(self._active.values())
+            if not active:
+                # Idle until the next profiled request
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            frames = sys._current_frames()
+            for profile in active:
+                profile.sample(frames)
+            del frames
+            self._expire()
+            time.sleep(self.interval)
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        with self._lock:
+            return self._finished.get(profile_id) or self._active.get(profile_id)
+
+    def recent(self, limit: int = 20) -> List[Dict]:
+        """Summaries of the slowest recent profiles, running ones included"""
+        with self._lock:
+            profiles = list(self._finished.values()) + list(self._active.values())
+        summaries = [profile.summary() for profile in profiles]
+        summaries.sort(key=lambda summary: summary["seconds"], reverse=True)
+        return summaries[:limit]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "sample_rate": self.sample_rate,
+                "interval": self.interval,
+                "active": len(self._active),
+                "kept": len(self._finished)
+            }
+
+def current_profile() -> Optional[Profile]:
+    """Profile of the request (or job) running in this context, if any"""
+    return _current_profile.get()
+
+def _span_wrapper(func: Callable, name: str) -> Callable:
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            profile = _current_profile.get()
+            if profile is None:
+                return await func(*args, **kwargs)
+            with profile.span(name):
+                return await func(*args, **kwargs)
+    else:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = _current_profile.get()
+            if profile is None:
+                return func(*args, **kwargs)
+            with profile.span(name):
+                return func(*args, **kwargs)
+    return wrapper
+
+def _submit_wrapper(func: Callable, name: str) -> Callable:
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        profile = _current_profile.get()
+        if profile is None:
+            return await func(*args, **kwargs)
+        with profile.span(name):
+            job_id = await func(*args, **kwargs)
+        get_profiler().attach_job(job_id, profile)
+        return job_id
+    return wrapper
+
+def _run_wrapper(func: Callable, name: str) -> Callable:
+    @functools.wraps(func)
+    async def wrapper(queue, job_id, *args, **kwargs):
+        profiler = get_profiler()
+        profile = profiler.job_profile(job_id)
+        if profile is None:
+            try:
+                return await func(queue, job_id, *args, **kwargs)
+            finally:
+                profiler.job_finished(job_id)
+
+        token = _current_profile.set(profile)
+        try:
+            with profile.span(name):
+                return await func(queue, job_id, *args, **kwargs)
+        finally:
+            _current_profile.reset(token)
+            try:
+                job = await queue.get(job_id)
+                timings = job.get("metadata", {}).get("timings") if job else None
+            except Exception as e:
+                print(f"Profile timings error for job {job_id}: {e}")
+                timings = None
+            profiler.job_finished(job_id, timings)
+    return wrapper
+
+_instrumented: List[tuple] = []
+
+def _resolve(target: str):
+    module_name, _, path = target.partition(":")
+    owner = importlib.import_module(module_name)
+    *parents, attribute = path.split(".")
+    for parent in parents:
+        owner = getattr(owner, parent)
+    return owner, attribute
+
+def instrument():
+    """
+    Wrap the profiled functions in place (idempotent)
+
+    Module-level functions are also replaced wherever another app module
+    imported them by name.
+    """
+    if _instrumented:
+        return
+    groups = [(PROFILED_FUNCTIONS, _span_wrapper), (JOB_SUBMIT_FUNCTIONS, _submit_wrapper),
+              (JOB_RUN_FUNCTIONS, _run_wrapper)]
+    for targets, make_wrapper in groups:
+        for target in targets:
+            owner, attribute = _resolve(target)
+            original = getattr(owner, attribute)
+            wrapper = make_wrapper(original, target.partition(":")[2])
+            owners = [owner]
+            if inspect.ismodule(owner):
+                owners += [module for name, module in list(sys.modules.items())
+                           if module is not owner and (name == "app" or name.startswith("app."))
+                           and getattr(module, attribute, None) is original]
+            for holder in owners:
+                setattr(holder, attribute, wrapper)
+                _instrumented.append((holder, attribute, original))
+
+def uninstrument():
+    """Put the original functions back"""
+    while _instrumented:
+        holder, attribute, original = _instrumented.pop()
+        setattr(holder, attribute, original)
+
+def is_admin(request) -> bool:
+    """Whether the request carries ADMIN_TOKEN (admin access is off while it is unset)"""
+    token = os.getenv("ADMIN_TOKEN")
+    if not token:
+        return False
+    expected = token.encode()
+    return any(hmac.compare_digest(expected, candidate.encode())
+               for candidate in (request.headers.get("x-admin-token"), request.query_params.get("token"))
+               if candidate)
+
+async def profiling_middleware(request, call_next):
+    """
+    Profile sampled /upload and /submit requests, and flagged admin ones
+
+    Profiles are stored under a generated id, returned in X-Profile-ID. A
+    client X-Request-ID is only kept as the profile's label.
+    """
+    profiler = get_profiler()
+    flagged = request.headers.get("x-profile") == "1" or request.query_params.get("profile") == "1"
+    if not profiler.wants(request.url.path, flagged and is_admin(request)):
+        return await call_next(request)
+
+    profile = profiler.start(request.method, request.url.path, request.headers.get("x-request-id"))
+    token = _current_profile.set(profile)
+    status = 500
+    try:
+        with profile.span("request"):
+            response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Profile-ID"] = profile.profile_id
+        return response
+    finally:
+        _current_profile.reset(token)
+        profiler.end_request(profile, status)
+
+def profiling_enabled() -> bool:
+    """Profiling is opt-in through PROFILING=true"""
+    return os.getenv("PROFILING", "false").lower() in ("1", "true", "yes")
+
+_profiler: Optional[Profiler] = None
+
+def get_profiler() -> Profiler:
+    """
+    Return the process-wide profiler
+
+    Configured through PROFILING, PROFILE_SAMPLE_RATE (0-1, default 0: only
+    flagged requests), PROFILE_INTERVAL_MS (stack sampling period),
+    PROFILE_HISTORY (profiles kept) and PROFILE_DIR (also write each
+    profile there as JSON and folded stacks).
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler(
+            enabled=profiling_enabled(),
+            sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+            interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+            history=int(os.getenv("PROFILE_HISTORY", "50")),
+            output_dir=os.getenv("PROFILE_DIR") or None
+        )
+    return _profiler
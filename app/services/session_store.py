@@ -0,0 +1,225 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+class InMemorySessionStore:
+    """
+    Per-session extraction state kept in this process
+
+    Entries expire ttl_seconds after their last write. When max_entries or
+    max_bytes (approximate JSON size) is exceeded the least recently used
+    sessions are evicted. Only suitable for a single worker.
+    """
+
+    def __init__(self, ttl_seconds: float = 3600, max_entries: int = 1000,
+                 max_bytes: int = 64 * 1024 * 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._entries: "OrderedDict[str, Tuple[float, int, Dict]]" = OrderedDict()
+        self._total_bytes = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def create(self, state: Dict) -> str:
+        """Store state under a new session id and return the id"""
+        session_id = uuid.uuid4().hex
+        self.put(session_id, state)
+        return session_id
+
+    def put(self, session_id: str, state: Dict):
+        """Store (or replace) the state for a session"""
+        size = len(json.dumps(state))
+        with self._lock:
+            self._discard(session_id)
+            self._entries[session_id] = (time.time() + self.ttl_seconds, size, state)
+            self._total_bytes += size
+            self._evict()
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        """State for a session, or None if unknown or expired"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                self._discard(session_id)
+                return None
+            self._entries.move_to_end(session_id)
+            return entry[2]
+
+    def delete(self, session_id: str):
+        """Forget a session"""
+        with self._lock:
+            self._discard(session_id)
+
+    def _discard(self, session_id: str):
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._total_bytes -= entry[1]
+
+    def _evict(self):
+        now = time.time()
+        for session_id in [key for key, entry in self._entries.items() if entry[0] < now]:
+            self._discard(session_id)
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or self._total_bytes > self.max_bytes):
+            session_id, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry[1]
+            self._evictions += 1
+
+    def stats(self) -> Dict:
+        """Entry count, size and eviction counter"""
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "evictions": self._evictions,
+            }
+
+class SQLiteSessionStore:
+    """
+    Per-session extraction state in a SQLite file shared by all workers
+
+    Same interface and limits as InMemorySessionStore, so any worker behind
+    the load balancer can serve /review or /submit for any session.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        state TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        expires REAL NOT NULL,
+        accessed REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires);
+    CREATE INDEX IF NOT EXISTS sessions_accessed ON sessions (accessed);
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: float = 3600, max_entries: int = 1000,
+                 max_bytes: int = 64 * 1024 * 1024):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._local = threading.local()
+        self._evictions = 0
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().executescript(self.SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread (sqlite3 connections aren't shareable)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, state: Dict) -> str:
+        """Store state under a new session id and return the id"""
+        session_id = uuid.uuid4().hex
+        self.put(session_id, state)
+        return session_id
+
+    def put(self, session_id: str, state: Dict):
+        """Store (or replace) the state for a session"""
+        payload = json.dumps(state)
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, state, size, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+                (session_id, payload, len(payload), now + self.ttl_seconds, now)
+            )
+            self._evict(conn, now)
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        """State for a session, or None if unknown or expired"""
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT state FROM sessions WHERE id = ? AND expires >= ?", (session_id, now)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE sessions SET accessed = ? WHERE id = ?", (now, session_id))
+        return json.loads(row[0])
+
+    def delete(self, session_id: str):
+        """Forget a session"""
+        self._connection().execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        conn.execute("DELETE FROM sessions WHERE expires < ?", (now,))
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        # Walk sessions from least recently used until both limits hold
+        doomed = []
+        for session_id, size in conn.execute("SELECT id, size FROM sessions ORDER BY accessed"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            doomed.append((session_id,))
+            count -= 1
+            total -= size
+        conn.executemany("DELETE FROM sessions WHERE id = ?", doomed)
+        self._evictions += len(doomed)
+
+    def stats(self) -> Dict:
+        """Entry count, size and eviction counter"""
+        count, total = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions WHERE expires >= ?", (time.time(),)
+        ).fetchone()
+        return {
+            "backend": "sqlite",
+            "entries": count,
+            "bytes": total,
+            "evictions": self._evictions,
+        }
+
+_session_store = None
+_session_store_lock = threading.Lock()
+
+def get_session_store():
+    """
+    Return the process-wide session store
+
+    SESSION_STORE selects the backend: "memory" (default, single worker) or
+    "sqlite" (shared through SESSION_DB_PATH, for several workers). Limits come
+    from SESSION_TTL, SESSION_MAX_ENTRIES and SESSION_MAX_BYTES.
+    """
+    global _session_store
+    if _session_store is None:
+        with _session_store_lock:
+            if _session_store is None:
+                limits = {
+                    "ttl_seconds": float(os.getenv("SESSION_TTL", "3600")),
+                    "max_entries": int(os.getenv("SESSION_MAX_ENTRIES", "1000")),
+                    "max_bytes": int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024))),
+                }
+                backend = os.getenv("SESSION_STORE", "memory").lower()
+                if backend == "sqlite":
+                    _session_store = SQLiteSessionStore(
+                        os.getenv("SESSION_DB_PATH", "data/sessions.sqlite3"), **limits
+                    )
+                elif backend == "memory":
+                    _session_store = InMemorySessionStore(**limits)
+                else:
+                    raise ValueError(f"Unknown SESSION_STORE backend: {backend}")
+    return _session_store
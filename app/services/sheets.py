@@ -1,17 +1,238 @@
-from google.oauth2.credentials import Credentials
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
 import json
 import os
-from typing import List, Dict
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, List, Dict, Optional
 from dotenv import load_dotenv
 
+from ..agent.metrics import SHEET_ROWS, stage
+
+# The Google client libraries are only needed once rows are written, so
+# they are imported there rather than when the app starts
+if TYPE_CHECKING:
+    import httplib2
+
 # Load environment variables
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
 
 # Google Sheets configuration
 SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")
 RANGE_NAME = "Sheet1!A:F"  # Matches existing format: Date, Ingredient, Meal, Shelf Life, Price, Quantity
+SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+
+class SheetsClient:
+    """
+    Shared holder for Sheets credentials, discovery document and HTTP transport
+    
+    Credentials are loaded once and refreshed proactively before they expire.
+    The Sheets discovery document is read once from the copy bundled with
+    google-api-python-client (no network fetch). httplib2 connections aren't
+    thread-safe, so each thread gets its own service object with its own
+    persistent transport, all sharing the same credentials.
+    """
+    
+    _discovery_document = None
+    _discovery_lock = threading.Lock()
+    
+    def __init__(self, credentials=None, credentials_path: Optional[str] = None,
+                 api_endpoint: Optional[str] = None, timeout: float = 30,
+                 refresh_margin: float = 300):
+        self._credentials = credentials
+        self.credentials_path = credentials_path
+        self.api_endpoint = api_endpoint
+        self.timeout = timeout
+        self.refresh_margin = timedelta(seconds=refresh_margin)
+        
+        self._lock = threading.Lock()
+        self._local = threading.local()
+    
+    @classmethod
+    def discovery_document(cls) -> str:
+        """Sheets v4 discovery document, loaded once per process"""
+        if cls._discovery_document is None:
+            with cls._discovery_lock:
+                if cls._discovery_document is None:
+                    from googleapiclient.discovery_cache import get_static_doc
+                    cls._discovery_document = get_static_doc('sheets', 'v4')
+        return cls._discovery_document
+    
+    @property
+    def credentials(self):
+        """Credentials, loaded from the service-account file on first use"""
+        if self._credentials is None:
+            with self._lock:
+                if self._credentials is None:
+                    self._credentials = load_credentials(self.credentials_path)
+        return self._credentials
+    
+    def _refresh_if_needed(self):
+        """Refresh the access token shortly before it expires, once for all threads"""
+        from google.auth.credentials import AnonymousCredentials
+        import google_auth_httplib2
+        
+        creds = self.credentials
+        if not hasattr(creds, 'refresh') or isinstance(creds, AnonymousCredentials):
+            return
+        
+        if self._token_is_fresh(creds):
+            return
+        with self._lock:
+            if self._token_is_fresh(creds):
+                return
+            creds.refresh(google_auth_httplib2.Request(self._http()))
+    
+    def _token_is_fresh(self, creds) -> bool:
+        if not creds.token:
+            return False
+        if creds.expiry is None:
+            return True
+        # google-auth stores expiry as a naive UTC datetime
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        return creds.expiry - now > self.refresh_margin
+    
+    def _http(self) -> "httplib2.Http":
+        """Per-thread raw transport, kept alive between requests"""
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            import httplib2
+            http = httplib2.Http(timeout=self.timeout)
+            self._local.http = http
+        return http
+    
+    def service(self):
+        """Sheets API service object for the calling thread"""
+        self._refresh_if_needed()
+        
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            from googleapiclient.discovery import build_from_document
+            import google_auth_httplib2
+            
+            authed_http = google_auth_httplib2.AuthorizedHttp(self.credentials, http=self._http())
+            client_options = {'api_endpoint': self.api_endpoint} if self.api_endpoint else None
+            service = build_from_document(
+                self.discovery_document(),
+                http=authed_http,
+                client_options=client_options
+            )
+            self._local.service = service
+        return service
+    
+    def spreadsheets(self):
+        """Shortcut for service().spreadsheets()"""
+        return self.service().spreadsheets()
+
+def load_client_libraries():
+    """Import the Google client libraries and read the discovery document now
+    rather than on the first sheet write"""
+    from google.oauth2 import service_account
+    import google_auth_httplib2
+    SheetsClient.discovery_document()
+
+_sheets_client: Optional[SheetsClient] = None
+_sheets_client_lock = threading.Lock()
+
+def get_sheets_client() -> SheetsClient:
+    """
+    Return the process-wide Sheets client
+    
+    SHEETS_API_ENDPOINT points it at another server (e.g. a local stand-in),
+    and SHEETS_ANONYMOUS=true skips service-account credentials for such servers.
+    """
+    global _sheets_client
+    if _sheets_client is None:
+        with _sheets_client_lock:
+            if _sheets_client is None:
+                from google.auth.credentials import AnonymousCredentials
+                anonymous = os.getenv("SHEETS_ANONYMOUS", "false").lower() in ("1", "true", "yes")
+                _sheets_client = SheetsClient(
+                    credentials=AnonymousCredentials() if anonymous else None,
+                    api_endpoint=os.getenv("SHEETS_API_ENDPOINT") or None,
+                    timeout=float(os.getenv("SHEETS_TIMEOUT", "30"))
+                )
+    return _sheets_client
+
+def set_sheets_client(client: Optional[SheetsClient]):
+    """Replace the shared client (None resets it to the environment defaults)"""
+    global _sheets_client
+    with _sheets_client_lock:
+        _sheets_client = client
+
+def rows_from_items(items: List[Dict]) -> List[List[str]]:
+    """
+    Convert item dicts to sheet rows
+    
+    Columns: Date, Ingredient, Meal, Shelf Life, Price, Quantity
+    """
+    values = []
+    for item in items:
+        row = [
+            item.get('Date', ''),
+            item.get('Ingredient', ''),
+            '',  # Meal column - blank
+            '',  # Shelf Life column - blank  
+            item.get('Price', ''),
+            item.get('Quantity', '')
+        ]
+        values.append(row)
+    return values
+
+def is_configured() -> bool:
+    """Whether a real spreadsheet ID is set"""
+    return bool(SPREADSHEET_ID) and SPREADSHEET_ID != "your_google_sheets_id_here"
+
+def append_rows(values: List[List[str]]) -> int:
+    """
+    Append prepared rows in a single values().append call
+    
+    Returns:
+        Number of rows the API reports as updated
+        
+    Raises:
+        googleapiclient.errors.HttpError and transport errors unchanged
+    """
+    with stage("sheets_append"):
+        sheet = get_sheets_client().spreadsheets()
+        result = sheet.values().append(
+            spreadsheetId=SPREADSHEET_ID,
+            range=RANGE_NAME,
+            valueInputOption='RAW',
+            body={'values': values}
+        ).execute()
+    updated_rows = result.get('updates', {}).get('updatedRows', 0)
+    SHEET_ROWS.inc(updated_rows)
+    return updated_rows
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Whether a failed append is worth retrying later
+    
+    Quota/rate-limit responses (429, 403 rate limit reasons), server errors
+    and network failures are transient; other API errors are not.
+    """
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    if status is None:
+        # No HTTP response at all: timeouts, connection resets, DNS, ...
+        import httplib2
+        return isinstance(error, (OSError, httplib2.HttpLib2Error))
+    status = int(status)
+    if status == 429 or status >= 500:
+        return True
+    if status == 403:
+        return 'ratelimitexceeded' in str(error).lower()
+    return False
+
+def is_row_error(error: Exception) -> bool:
+    """
+    Whether an append was refused because of the rows it carried
+
+    Only a 400 about the values qualifies, so the other rows of a batch may
+    still go through on their own. Auth (401), permission (403), missing
+    spreadsheet (404), a bad range and credentials that can't be loaded
+    fail every row alike.
+    """
+    status = getattr(getattr(error, 'resp', None), 'status', None)
+    return status is not None and int(status) == 400 and 'range' not in str(error).lower()
 
 def append_to_sheet(items: List[Dict], source_filename: str = "unknown") -> dict:
     """
@@ -24,87 +245,46 @@ def append_to_sheet(items: List[Dict], source_filename: str = "unknown") -> dict
         Result dictionary with success/error info
     """
     try:
-        print(f"DEBUG: Attempting to append {len(items)} items to sheet")
-        print(f"DEBUG: Spreadsheet ID from env: {SPREADSHEET_ID}")
-        print(f"DEBUG: Source filename: {source_filename}")
-        print(f"DEBUG: Items data: {items}")
-        
         # Check if spreadsheet ID is configured
-        if not SPREADSHEET_ID or SPREADSHEET_ID == "your_google_sheets_id_here":
+        if not is_configured():
             return {
                 'success': False,
                 'error': f'Spreadsheet ID not configured. Current value: {SPREADSHEET_ID}'
             }
         
-        # Load credentials
-        creds = load_credentials()
-        
-        # Build the service
-        service = build('sheets', 'v4', credentials=creds)
-        sheet = service.spreadsheets()
-        
         # Prepare data for sheets (convert dict to rows)
-        from datetime import datetime
-        upload_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        values = []
-        for item in items:
-            row = [
-                item.get('Date', ''),
-                item.get('Ingredient', ''),
-                '',  # Meal column - blank
-                '',  # Shelf Life column - blank  
-                item.get('Price', ''),
-                item.get('Quantity', '')
-            ]
-            values.append(row)
-        
-        print(f"DEBUG: Prepared values: {values}")
-        
-        # Prepare the request body
-        body = {
-            'values': values
-        }
-        
-        # Execute the request
-        result = sheet.values().append(
-            spreadsheetId=SPREADSHEET_ID,
-            range=RANGE_NAME,
-            valueInputOption='RAW',
-            body=body
-        ).execute()
+        values = rows_from_items(items)
         
-        print(f"DEBUG: Sheets API result: {result}")
+        # Execute the request through the shared client
+        updated_rows = append_rows(values)
         
         return {
             'success': True,
-            'updated_rows': result.get('updates', {}).get('updatedRows', 0)
+            'updated_rows': updated_rows
         }
         
     except Exception as e:
-        print(f"DEBUG: Sheets error: {e}")
+        print(f"Sheets append error for {source_filename}: {e}")
         return {
             'success': False,
             'error': str(e)
         }
 
-def load_credentials():
+def load_credentials(creds_path: Optional[str] = None):
     """
     Load Google Sheets API credentials
     """
     try:
         # Try to load service account credentials from app directory
-        creds_path = os.getenv("GOOGLE_CREDENTIALS_PATH", "app/credentials.json")
-        print(f"DEBUG: Looking for credentials at: {creds_path}")
+        creds_path = creds_path or os.getenv("GOOGLE_CREDENTIALS_PATH", "app/credentials.json")
         
+        from google.oauth2 import service_account
         creds = service_account.Credentials.from_service_account_file(
             creds_path,
-            scopes=['https://www.googleapis.com/auth/spreadsheets']
+            scopes=SCOPES
         )
-        print("DEBUG: Credentials loaded successfully")
         return creds
     except Exception as e:
-        print(f"DEBUG: Failed to load credentials: {e}")
         raise Exception(f"Failed to load credentials: {e}")
 
 def create_headers_if_needed():
@@ -112,11 +292,10 @@ def create_headers_if_needed():
     Create header row if the sheet is empty
     """
     try:
-        creds = load_credentials()
-        service = build('sheets', 'v4', credentials=creds)
+        sheet = get_sheets_client().spreadsheets()
         
         # Check if first row has headers
-        result = service.spreadsheets().values().get(
+        result = sheet.values().get(
             spreadsheetId=SPREADSHEET_ID,
             range="Sheet1!A1:F1"  # Updated range
         ).execute()
@@ -128,7 +307,7 @@ def create_headers_if_needed():
             headers = [['Date', 'Ingredient', 'Quantity', 'Price', 'Notes', 'Upload History']]
             body = {'values': headers}
             
-            service.spreadsheets().values().update(
+            sheet.values().update(
                 spreadsheetId=SPREADSHEET_ID,
                 range="Sheet1!A1:F1",  # Updated range for new column
                 valueInputOption='RAW',
@@ -0,0 +1,96 @@
+import asyncio
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+def _warm_vlm():
+    from ..agent.vlm import load_client_libraries
+    load_client_libraries()
+
+def _warm_sheets():
+    from .sheets import load_client_libraries
+    load_client_libraries()
+
+async def _warm_ocr():
+    # OCR runs in the job queue's worker processes, so the models are loaded
+    # there; the web process never needs torch
+    from .jobs import get_job_queue
+    await get_job_queue().warm_ocr_pool()
+
+# Heavy dependencies are imported on first use; each phase loads one group
+# ahead of time instead (plain phases run in a thread, async ones on the loop)
+PHASES: Dict[str, Callable] = {
+    "vlm": _warm_vlm,
+    "sheets": _warm_sheets,
+    "ocr": _warm_ocr,
+}
+
+def warmup_phases() -> List[str]:
+    """
+    Phases to run at startup: WARMUP (comma separated, e.g. "vlm,sheets"),
+    plus "ocr" when OCR_WARMUP is set
+    """
+    phases = [name.strip() for name in os.getenv("WARMUP", "").split(",") if name.strip()]
+    if os.getenv("OCR_WARMUP", "false").lower() in ("1", "true", "yes") and "ocr" not in phases:
+        phases.append("ocr")
+    return phases
+
+class Warmup:
+    """
+    Optional startup phase that loads dependencies before traffic arrives
+
+    Runs in the background so the server starts listening at once; /ready
+    answers 503 until every phase has finished, so a load balancer only
+    sends requests to warm instances.
+    """
+
+    def __init__(self, phases: Optional[List[str]] = None):
+        self.phases = warmup_phases() if phases is None else phases
+        self.timings: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return len(self.timings) + len(self.errors) == len(self.phases)
+
+    def start(self):
+        """Start the phases in the background (no-op if there are none)"""
+        if self.phases and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self):
+        """Run each phase, recording how long it took"""
+        for name in self.phases:
+            phase = PHASES.get(name)
+            if phase is None:
+                self.errors[name] = "unknown phase"
+                continue
+            start = time.perf_counter()
+            try:
+                if asyncio.iscoroutinefunction(phase):
+                    await phase()
+                else:
+                    await asyncio.to_thread(phase)
+                self.timings[name] = round(time.perf_counter() - start, 4)
+            except Exception as e:
+                print(f"Warmup {name} failed: {e}")
+                self.errors[name] = str(e)
+
+    def status(self) -> Dict:
+        """Readiness and per-phase timings"""
+        return {
+            "ready": self.ready,
+            "phases": self.phases,
+            "seconds": dict(self.timings),
+            "errors": dict(self.errors)
+        }
+
+_warmup: Optional[Warmup] = None
+
+def get_warmup() -> Warmup:
+    """Return the process-wide warmup state"""
+    global _warmup
+    if _warmup is None:
+        _warmup = Warmup()
+    return _warmup
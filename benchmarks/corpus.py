@@ -0,0 +1,75 @@
+"""
+Synthetic receipt corpus
+
+The bundled test.jpg plus generated receipts of a given number of lines.
+Long receipts are taller than the vision model's tile limit, so they go
+through the strip-splitting path.
+"""
+import io
+import os
+import random
+from typing import List, Tuple
+
+from PIL import Image, ImageDraw
+
+from .fakes import INGREDIENTS
+
+SAMPLE_RECEIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test.jpg")
+LINE_HEIGHT = 22
+WIDTH = 576
+
+def generate_receipt(lines: int, seed: int = 0, store: str = "BENCH MARKET") -> bytes:
+    """JPEG of a till receipt with `lines` item lines"""
+    rng = random.Random(seed)
+    height = (lines + 12) * LINE_HEIGHT
+    image = Image.new("L", (WIDTH, height), 255)
+    draw = ImageDraw.Draw(image)
+    y = LINE_HEIGHT
+
+    def line(left: str, right: str = ""):
+        nonlocal y
+        draw.text((24, y), left, fill=0)
+        if right:
+            draw.text((WIDTH - 24 - 8 * len(right), y), right, fill=0)
+        y += LINE_HEIGHT
+
+    line(store)
+    line("12 HIGH STREET")
+    line("29/06/2025 14:32")
+    y += LINE_HEIGHT
+    total = 0.0
+    for _ in range(lines):
+        name, quantity, price = rng.choice(INGREDIENTS)
+        total += price
+        line(f"{name.upper()} {quantity.upper()}", f"{price:.2f}")
+    y += LINE_HEIGHT
+    line("TOTAL", f"{total:.2f}")
+    line("CARD", f"{total:.2f}")
+    line("THANK YOU FOR SHOPPING")
+
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=80)
+    return buffer.getvalue()
+
+def build_corpus(short: int = 4, long: int = 2, short_lines: int = 15, long_lines: int = 120,
+                 include_sample: bool = True) -> List[Tuple[str, bytes]]:
+    """(filename, JPEG bytes) pairs: test.jpg, short and long receipts"""
+    corpus = []
+    if include_sample and os.path.exists(SAMPLE_RECEIPT):
+        with open(SAMPLE_RECEIPT, "rb") as f:
+            corpus.append(("test.jpg", f.read()))
+    for index in range(short):
+        corpus.append((f"short-{index}.jpg", generate_receipt(short_lines, seed=index)))
+    for index in range(long):
+        corpus.append((f"long-{index}.jpg", generate_receipt(long_lines, seed=1000 + index)))
+    return corpus
+
+def unique_copy(image: bytes, nonce: int) -> bytes:
+    """
+    The same image with different bytes
+
+    JPEG decoders stop at the end-of-image marker, so trailing bytes change
+    the content hash (and so miss the extraction cache) without changing
+    what is decoded.
+    """
+    return image + b"bench" + nonce.to_bytes(8, "big")
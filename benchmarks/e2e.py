@@ -0,0 +1,414 @@
+"""
+End-to-end load benchmark against fake OpenAI and Sheets servers
+
+Boots the app under uvicorn with OPENAI_BASE_URL and SHEETS_API_ENDPOINT
+pointed at local fakes (benchmarks.fakes), then drives upload -> review ->
+submit sessions with a synthetic receipt corpus (benchmarks.corpus) at
+several concurrency levels. Each level reports throughput, p50/p95/p99
+latency per endpoint, the server's memory high-water mark and the
+per-stage breakdown scraped from /metrics. Results are saved as JSON and
+can be checked against an earlier run.
+
+    python -m benchmarks.e2e --concurrency 1,4,16 --sessions 40 --output e2e.json
+    python -m benchmarks.e2e --baseline e2e.json --max-regression 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from .corpus import build_corpus, unique_copy
+from .fakes import start_fake_openai, start_fake_sheets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ("upload", "processing", "review", "submit", "session")
+STAGE_LINE = re.compile(r'^receipt_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$')
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """q-th percentile (0-100) with linear interpolation"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+def latency_summary(values: List[float]) -> Dict:
+    """Count, mean, p50/p95/p99 and max in seconds"""
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 4),
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+        "max": round(max(values), 4)
+    }
+
+def parse_stage_metrics(text: str) -> Dict[str, Tuple[float, float]]:
+    """{stage: (seconds, count)} from the receipt_stage_seconds histogram"""
+    stages: Dict[str, List[float]] = defaultdict(lambda: [0.0, 0.0])
+    for line in text.splitlines():
+        match = STAGE_LINE.match(line)
+        if match:
+            field, name, value = match.groups()
+            stages[name][0 if field == "sum" else 1] = float(value)
+    return {name: (seconds, count) for name, (seconds, count) in stages.items()}
+
+def stage_breakdown(before: Dict[str, Tuple[float, float]], after: Dict[str, Tuple[float, float]]) -> Dict:
+    """Per-stage count, total and mean seconds between two scrapes"""
+    breakdown = {}
+    for name, (seconds, count) in sorted(after.items()):
+        start_seconds, start_count = before.get(name, (0.0, 0.0))
+        count -= start_count
+        if count <= 0:
+            continue
+        seconds -= start_seconds
+        breakdown[name] = {"count": int(count), "total_seconds": round(seconds, 4),
+                           "mean_seconds": round(seconds / count, 4)}
+    return breakdown
+
+def process_tree(pid: int) -> List[int]:
+    """pid and its descendants (uvicorn --workers runs the app in children)"""
+    pids = [pid]
+    for parent in pids:
+        try:
+            with open(f"/proc/{parent}/task/{parent}/children") as f:
+                pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+def read_memory(pid: int) -> Dict[str, int]:
+    """
+    Resident and peak resident bytes of a process and its children
+
+    Read from Linux /proc; empty elsewhere.
+    """
+    memory: Dict[str, int] = {}
+    for process in process_tree(pid):
+        try:
+            with open(f"/proc/{process}/status") as f:
+                for line in f:
+                    key, _, value = line.partition(":")
+                    if key in ("VmRSS", "VmHWM"):
+                        memory[key] = memory.get(key, 0) + int(value.split()[0]) * 1024
+        except OSError:
+            pass
+    return memory
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class AppServer:
+    """The app under uvicorn in a child process, with its state in a temp directory"""
+
+    def __init__(self, env: Dict[str, str], workers: int = 1):
+        self.env = env
+        self.workers = workers
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self, timeout: float = 60):
+        command = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                   "--port", str(self.port), "--log-level", "warning", "--workers", str(self.workers)]
+        self.process = subprocess.Popen(command, cwd=ROOT, env=self.env)
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"App exited during startup with code {self.process.returncode}")
+            try:
+                if httpx.get(f"{self.url}/ready", timeout=1).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"App wasn't ready after {timeout}s")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+class LevelResults:
+    """Latencies and failures collected while one concurrency level runs"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.failed_jobs = 0
+        self.completed = 0
+
+    async def timed(self, name: str, request) -> Optional[httpx.Response]:
+        """Await a request, recording its latency, or an error for non-2xx/3xx replies"""
+        start = time.perf_counter()
+        try:
+            response = await request
+        except httpx.HTTPError as e:
+            self.errors[name] += 1
+            print(f"{name} failed: {e!r}")
+            return None
+        self.latencies[name].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[name] += 1
+            return None
+        return response
+
+async def run_session(client: httpx.AsyncClient, filename: str, image: bytes, method: str,
+                      results: LevelResults, job_timeout: float):
+    """Upload a receipt, wait for its job, load the review page and submit the items"""
+    start = time.perf_counter()
+    response = await results.timed("upload", client.post(
+        "/upload", files={"file": (filename, image, "image/jpeg")}, data={"method": method},
+        headers={"Accept": "application/json"}
+    ))
+    if response is None:
+        return
+    job_id = response.json()["job_id"]
+
+    uploaded = time.perf_counter()
+    job = None
+    while time.perf_counter() - uploaded < job_timeout:
+        reply = await client.get(f"/jobs/{job_id}", params={"wait": 30})
+        job = reply.json() if reply.status_code == 200 else None
+        if job is None or job["status"] in ("done", "failed"):
+            break
+    if job is None or job["status"] != "done" or not job["metadata"].get("success", True):
+        results.failed_jobs += 1
+        results.errors["processing"] += 1
+        return
+    results.latencies["processing"].append(time.perf_counter() - uploaded)
+
+    await results.timed("review", client.get("/review", params={"job": job_id}))
+
+    response = await results.timed("submit", client.post(
+        "/submit", data={"items": json.dumps(job["data"]), "job": job_id}
+    ))
+    if response is None:
+        return
+    if response.status_code == 200 and "error" in response.json():
+        # /submit reports failures in a 200 JSON body
+        results.errors["submit"] += 1
+        return
+    results.latencies["session"].append(time.perf_counter() - start)
+    results.completed += 1
+
+async def track_memory(pid: int, peak: Dict[str, int], interval: float = 0.05):
+    while True:
+        rss = read_memory(pid).get("VmRSS", 0)
+        peak["rss"] = max(peak.get("rss", 0), rss)
+        await asyncio.sleep(interval)
+
+async def run_level(app: AppServer, corpus: List[Tuple[str, bytes]], concurrency: int, sessions: int,
+                    method: str, unique: bool, nonce: int, job_timeout: float = 120) -> Dict:
+    """Run `sessions` sessions with at most `concurrency` in flight"""
+    results = LevelResults()
+    limits = httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency * 2)
+    async with httpx.AsyncClient(base_url=app.url, limits=limits, timeout=job_timeout) as client:
+        before = parse_stage_metrics((await client.get("/metrics")).text)
+        peak: Dict[str, int] = {}
+        memory_task = asyncio.create_task(track_memory(app.process.pid, peak))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(index: int):
+            filename, image = corpus[index % len(corpus)]
+            if unique:
+                image = unique_copy(image, nonce + index)
+            async with semaphore:
+                await run_session(client, filename, image, method, results, job_timeout)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(index) for index in range(sessions)))
+        wall = time.perf_counter() - start
+        memory_task.cancel()
+        after = parse_stage_metrics((await client.get("/metrics")).text)
+
+    return {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "completed": results.completed,
+        "failed_jobs": results.failed_jobs,
+        "wall_seconds": round(wall, 4),
+        "throughput_per_second": round(results.completed / wall, 4) if wall else 0.0,
+        "latency_seconds": {name: latency_summary(results.latencies[name]) for name in ENDPOINTS},
+        "errors": {name: results.errors[name] for name in ENDPOINTS if results.errors[name]},
+        "peak_rss_bytes": peak.get("rss"),
+        "stages": stage_breakdown(before, after)
+    }
+
+def compare(current: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    """
+    Regressions of current against baseline
+
+    A level regresses when its throughput drops, or an endpoint's p95
+    latency grows, by more than max_regression (a fraction), or when it
+    has errors the baseline didn't.
+    """
+    regressions = []
+    baseline_levels = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    for level in current["levels"]:
+        old = baseline_levels.get(level["concurrency"])
+        if old is None:
+            continue
+        label = f"concurrency {level['concurrency']}"
+        if old["throughput_per_second"] and \
+                level["throughput_per_second"] < old["throughput_per_second"] * (1 - max_regression):
+            regressions.append(f"{label}: throughput {old['throughput_per_second']:.2f}/s -> "
+                               f"{level['throughput_per_second']:.2f}/s")
+        for name in ENDPOINTS:
+            new_p95 = level["latency_seconds"].get(name, {}).get("p95")
+            old_p95 = old["latency_seconds"].get(name, {}).get("p95")
+            if new_p95 is not None and old_p95 and new_p95 > old_p95 * (1 + max_regression):
+                regressions.append(f"{label}: {name} p95 {old_p95:.3f}s -> {new_p95:.3f}s")
+        for name, count in level["errors"].items():
+            if count > old["errors"].get(name, 0):
+                regressions.append(f"{label}: {name} errors {old['errors'].get(name, 0)} -> {count}")
+    return regressions
+
+def print_report(summary: Dict):
+    config = summary["config"]
+    print(f"method={config['method']} vlm latency={config['vlm_latency']}s "
+          f"error rate={config['vlm_error_rate']} corpus={config['corpus']}")
+    for level in summary["levels"]:
+        print(f"\nconcurrency {level['concurrency']}: {level['completed']}/{level['sessions']} sessions "
+              f"in {level['wall_seconds']:.2f}s, {level['throughput_per_second']:.2f}/s, "
+              f"peak RSS {(level['peak_rss_bytes'] or 0) / 2**20:.1f} MiB")
+        print(f"  {'endpoint':<12} {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7}")
+        for name in ENDPOINTS:
+            latency = level["latency_seconds"][name]
+            if not latency["count"] and not level["errors"].get(name):
+                continue
+            print(f"  {name:<12} {latency['count']:>6} {latency.get('p50') or 0:>8.3f} "
+                  f"{latency.get('p95') or 0:>8.3f} {latency.get('p99') or 0:>8.3f} "
+                  f"{level['errors'].get(name, 0):>7}")
+        for name, stage in level["stages"].items():
+            print(f"  stage {name:<14} {stage['count']:>6} x {stage['mean_seconds']:.4f}s")
+    memory = summary["server_memory_bytes"]
+    if memory:
+        print(f"\nserver memory high-water mark: {memory / 2**20:.1f} MiB")
+    for regression in summary.get("regressions", []):
+        print(f"REGRESSION {regression}")
+
+def app_environment(state_dir: str, openai_url: str, sheets_url: str) -> Dict[str, str]:
+    """Environment pointing the app at the fakes, with its state kept in state_dir"""
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "sk-bench",
+        "OPENAI_BASE_URL": f"{openai_url}/v1",
+        "SPREADSHEET_ID": "bench-sheet",
+        "SHEETS_API_ENDPOINT": f"{sheets_url}/",
+        "SHEETS_ANONYMOUS": "true",
+        "HISTORY_DB_PATH": os.path.join(state_dir, "history.sqlite3"),
+        "HISTORY_IMPORT_PATH": os.path.join(state_dir, "no-history.json"),
+        "OUTBOX_DB_PATH": os.path.join(state_dir, "outbox.sqlite3"),
+        "SESSION_DB_PATH": os.path.join(state_dir, "sessions.sqlite3"),
+        "CATALOG_LEARNED_PATH": os.path.join(state_dir, "ingredients_learned.json"),
+        "STORE_TEMPLATES_PATH": os.path.join(state_dir, "store_templates.json"),
+        "EXTRACTION_CACHE_DIR": "",
+        "WARMUP": "vlm",
+    })
+    return env
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--sessions", type=int, default=40, help="Upload/review/submit sessions per level")
+    parser.add_argument("--method", default="vlm", help="Extraction method to upload with")
+    parser.add_argument("--short", type=int, default=4, help="Generated short receipts in the corpus")
+    parser.add_argument("--long", type=int, default=2, help="Generated long receipts in the corpus")
+    parser.add_argument("--long-lines", type=int, default=120, help="Item lines on a long receipt")
+    parser.add_argument("--reuse-images", action="store_true",
+                        help="Upload identical bytes each round (exercises the extraction cache)")
+    parser.add_argument("--vlm-latency", type=float, default=0.5, help="Fake OpenAI mean latency (s)")
+    parser.add_argument("--vlm-jitter", type=float, default=0.1, help="Fake OpenAI latency spread (s)")
+    parser.add_argument("--vlm-error-rate", type=float, default=0.0, help="Share of failed OpenAI calls")
+    parser.add_argument("--vlm-error-status", type=int, default=500, help="Status of injected OpenAI errors")
+    parser.add_argument("--vlm-items", type=int, default=12, help="Items in each fake OpenAI reply")
+    parser.add_argument("--sheets-latency", type=float, default=0.2, help="Fake Sheets mean latency (s)")
+    parser.add_argument("--sheets-error-rate", type=float, default=0.0, help="Share of failed Sheets calls")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for fake latencies and errors")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed throughput drop / p95 growth against the baseline (fraction)")
+    args = parser.parse_args(argv)
+
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+    corpus = build_corpus(args.short, args.long, long_lines=args.long_lines)
+    openai_server = start_fake_openai(latency=args.vlm_latency, jitter=args.vlm_jitter,
+                                      error_rate=args.vlm_error_rate, error_status=args.vlm_error_status,
+                                      seed=args.seed, items=args.vlm_items)
+    sheets_server = start_fake_sheets(latency=args.sheets_latency, jitter=args.sheets_latency / 4,
+                                      error_rate=args.sheets_error_rate, seed=args.seed)
+
+    with tempfile.TemporaryDirectory(prefix="receipt-bench-") as state_dir:
+        app = AppServer(app_environment(state_dir, openai_server.url, sheets_server.url), args.workers)
+        app.start()
+        try:
+            results = []
+            nonce = int(time.time() * 1000)
+            for concurrency in levels:
+                results.append(asyncio.run(run_level(app, corpus, concurrency, args.sessions, args.method,
+                                                     not args.reuse_images, nonce)))
+                nonce += args.sessions
+            memory = read_memory(app.process.pid).get("VmHWM")
+        finally:
+            app.stop()
+            openai_server.stop()
+            sheets_server.stop()
+
+    summary = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "method": args.method,
+            "sessions": args.sessions,
+            "corpus": [name for name, _ in corpus],
+            "unique_images": not args.reuse_images,
+            "vlm_latency": args.vlm_latency,
+            "vlm_jitter": args.vlm_jitter,
+            "vlm_error_rate": args.vlm_error_rate,
+            "vlm_items": args.vlm_items,
+            "sheets_latency": args.sheets_latency,
+            "sheets_error_rate": args.sheets_error_rate,
+            "workers": args.workers
+        },
+        "levels": results,
+        "server_memory_bytes": memory,
+        "fake_openai": openai_server.stats(),
+        "fake_sheets": sheets_server.stats()
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            summary["regressions"] = compare(summary, json.load(f), args.max_regression)
+
+    print_report(summary)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 1 if summary.get("regressions") else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
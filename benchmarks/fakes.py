@@ -0,0 +1,221 @@
+"""
+Local stand-ins for the OpenAI and Google Sheets APIs
+
+Both answer like the real services (enough for the openai SDK and
+googleapiclient) after a configurable delay, and fail a configurable share
+of requests so retry and error paths are exercised too.
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple, Type
+from urllib.parse import unquote, urlparse
+
+INGREDIENTS = [
+    ("Whole Milk", "2 PT", 1.45), ("Free Range Eggs", "12 pack", 3.10), ("Cheddar", "400g", 3.75),
+    ("Bananas", "1 kg", 0.98), ("Chicken Breast", "650g", 5.20), ("Basmati Rice", "1 kg", 2.35),
+    ("Tinned Tomatoes", "400g", 0.55), ("Greek Yoghurt", "500g", 1.90), ("Spinach", "250g", 1.20),
+    ("Red Onions", "1 kg", 0.89), ("Butter", "250g", 2.15), ("Spaghetti", "500g", 0.75),
+    ("Carrots", "1 kg", 0.55), ("Garlic", "3 pack", 0.85), ("Olive Oil", "500ml", 4.50),
+    ("Apples", "6 pack", 1.60), ("Porridge Oats", "1 kg", 1.15), ("Sourdough Bread", "800g", 2.40),
+]
+
+def fake_items(count: int, rng: random.Random) -> List[Dict]:
+    """Plausible extracted items"""
+    items = []
+    for _ in range(count):
+        name, quantity, price = rng.choice(INGREDIENTS)
+        items.append({"Date": "2025-06-29", "Ingredient": name, "Quantity": quantity,
+                      "Price": f"{price:.2f}", "Notes": ""})
+    return items
+
+class FakeServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server with latency and error injection
+
+    latency is the mean delay in seconds and jitter the +/- spread around
+    it; error_rate of the requests get error_status instead of a reply.
+    Tests can also script the next errors exactly through `failures`, and
+    with record=True every request is kept in `received` as (path, body).
+    """
+
+    daemon_threads = True
+
+    def __init__(self, handler: Type[BaseHTTPRequestHandler], latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 500, seed: Optional[int] = None,
+                 retry_after: float = 1.0, record: bool = False, **settings):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.record = record
+        self.settings = settings
+        self.rng = random.Random(seed)
+        self.counts = {"requests": 0, "errors": 0}
+        # (status, error code) sent to the next requests, in order
+        self.failures: List[Tuple[int, str]] = []
+        self.received: List[Tuple[str, Dict]] = []
+        self.clients = set()
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def start(self) -> "FakeServer":
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def count(self, key: str, amount: int = 1):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + amount
+
+    def stats(self) -> Dict:
+        with self.lock:
+            return dict(self.counts)
+
+class FakeHandler(BaseHTTPRequestHandler):
+    """Shared delay, error injection and JSON replies"""
+
+    protocol_version = "HTTP/1.1"
+    server: FakeServer
+
+    def read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        request = json.loads(body or b"{}")
+        if self.server.record:
+            with self.server.lock:
+                self.server.received.append((unquote(urlparse(self.path).path), request))
+        return request
+
+    def delay_or_fail(self) -> bool:
+        """
+        Wait out the simulated latency
+
+        Returns:
+            True if an injected error was sent instead of a reply
+        """
+        server = self.server
+        server.count("requests")
+        with server.lock:
+            server.clients.add(self.client_address)
+            delay = max(0.0, server.latency + server.rng.uniform(-server.jitter, server.jitter))
+            scripted = server.failures.pop(0) if server.failures else None
+            failed = scripted is not None or server.rng.random() < server.error_rate
+        time.sleep(delay)
+        if not failed:
+            return False
+        server.count("errors")
+        retry_after = {"Retry-After": f"{server.retry_after:g}"}
+        if scripted is not None:
+            status, code = scripted
+            self.reply({"error": {"code": code, "type": code, "message": code}}, status, retry_after)
+        else:
+            self.reply({"error": {"code": server.error_status, "message": "Injected error"}},
+                       server.error_status, retry_after if server.error_status == 429 else {})
+        return True
+
+    def reply(self, payload: Dict, status: int = 200, headers: Optional[Dict] = None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class FakeOpenAIHandler(FakeHandler):
+    """
+    OpenAI-compatible POST /v1/chat/completions
+
+    Replies with `items` receipt items (settings; a count of random items or
+    a fixed list), streamed as SSE chunks of `chunk_size` characters when
+    the request asks for a stream.
+    """
+
+    def do_POST(self):
+        request = self.read_json()
+        if self.delay_or_fail():
+            return
+        items = self.server.settings.get("items", 12)
+        if isinstance(items, int):
+            with self.server.lock:
+                items = fake_items(items, self.server.rng)
+        content = "```json\n" + json.dumps(items) + "\n```"
+        usage = {"prompt_tokens": 850, "completion_tokens": len(content) // 4,
+                 "total_tokens": 850 + len(content) // 4}
+        if request.get("stream"):
+            return self.stream_reply(content, usage)
+
+        self.reply({
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "gpt-4o"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": content}
+            }],
+            "usage": usage
+        })
+
+    def stream_reply(self, content: str, usage: Dict):
+        size = self.server.settings.get("chunk_size", 16)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        chunks = [{"index": 0, "delta": {"content": content[start:start + size]}, "finish_reason": None}
+                  for start in range(0, len(content), size)]
+        chunks.append({"index": 0, "delta": {}, "finish_reason": "stop"})
+        for choice in chunks:
+            self.send_event({"choices": [choice]})
+        self.send_event({"choices": [], "usage": usage})
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+    def send_event(self, fields: Dict):
+        chunk = {"id": "chatcmpl-bench", "object": "chat.completion.chunk",
+                 "created": int(time.time()), "model": "gpt-4o", **fields}
+        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+
+class FakeSheetsHandler(FakeHandler):
+    """Sheets v4 values endpoints (append, get, update)"""
+
+    def do_POST(self):
+        body = self.read_json()
+        if self.delay_or_fail():
+            return
+        rows = len(body.get("values", []))
+        self.server.count("rows", rows)
+        self.reply({"updates": {"updatedRows": rows}})
+
+    do_PUT = do_POST
+
+    def do_GET(self):
+        if self.delay_or_fail():
+            return
+        self.reply({"values": []})
+
+def start_fake_openai(**options) -> FakeServer:
+    return FakeServer(FakeOpenAIHandler, **options).start()
+
+def start_fake_sheets(**options) -> FakeServer:
+    return FakeServer(FakeSheetsHandler, **options).start()
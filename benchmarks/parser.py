@@ -0,0 +1,160 @@
+"""
+Receipt parser throughput benchmark
+
+Times parse_receipts on two synthetic OCR archives: one where every line
+is distinct (the worst case for its line memo) and one of receipts drawn
+from a small pool of lines, like a real archive of regular purchases.
+Next to each figure it reports the output floor, the time just to build
+the returned item dicts, which no parser can go below. With --reference
+a parser module from another revision is timed on the same archives and
+its output compared.
+
+    git show 5615644:app/agent/parser.py > /tmp/parser_before.py
+    python -m benchmarks.parser --reference /tmp/parser_before.py --output parser.json
+"""
+import argparse
+import importlib.util
+import json
+import platform
+import random
+import sys
+import time
+from typing import Dict, List, Optional
+
+from app.agent import parser as current_parser
+
+from .fakes import INGREDIENTS
+
+def generate_lines(count: int, seed: int = 0) -> List[str]:
+    """count distinct OCR lines: items in assorted layouts, headers, footers and references"""
+    rng = random.Random(seed)
+    lines: Dict[str, None] = {}
+    while len(lines) < count:
+        kind = rng.random()
+        price = f"{rng.randint(0, 40)}.{rng.randint(0, 99):02d}"
+        if kind < 0.08:
+            line = f"{rng.choice(['TOTAL', 'SUBTOTAL', 'VISA CARD', 'CASH', 'VAT 20%'])} {price}"
+        elif kind < 0.12:
+            line = f"{rng.choice(['REF', 'TILL', 'AUTH CODE'])} {rng.randint(0, 10 ** 6)}"
+        elif kind < 0.14:
+            line = f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2025 {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}"
+        else:
+            name, quantity, _ = rng.choice(INGREDIENTS)
+            name = rng.choice([name, name.upper(), f"Organic {name}", f"{name} each"])
+            layout = rng.random()
+            if layout < 0.5:
+                text = f"{name} {quantity}"
+            elif layout < 0.7:
+                text = f"{rng.randint(2, 6)} x {name}"
+            elif layout < 0.8:
+                text = f"{name} {rng.randint(2, 6)} @ {rng.randint(0, 9)}.{rng.randint(0, 99):02d}"
+            else:
+                text = name
+            line = f"{text} {rng.choice(['', '', '£', '$'])}{price}"
+        lines[line] = None
+    return list(lines)
+
+def split_receipts(lines: List[str], per_receipt: int) -> List[List[str]]:
+    return [lines[start:start + per_receipt] for start in range(0, len(lines), per_receipt)]
+
+def sample_receipts(pool: List[str], receipts: int, per_receipt: int, seed: int = 0) -> List[List[str]]:
+    """Receipts of lines drawn from pool, so lines repeat across the archive"""
+    rng = random.Random(seed)
+    return [rng.sample(pool, per_receipt) for _ in range(receipts)]
+
+def load_parser(path: str):
+    """Parser module from a file, e.g. app/agent/parser.py of an earlier revision"""
+    spec = importlib.util.spec_from_file_location("reference_parser", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def parse_archive(module, receipts: List[List[str]]) -> List[List[Dict]]:
+    """parse_receipts, or parse_receipt_lines per receipt where there is no batch API
+
+    Items are stamped with today's date, the one default every revision shares.
+    """
+    cache = getattr(module, "_parse_item_text", None)
+    if cache is not None:
+        cache.cache_clear()
+    if hasattr(module, "parse_receipts"):
+        return module.parse_receipts(receipts)
+    return [module.parse_receipt_lines(lines) for lines in receipts]
+
+def build_output(parsed: List[List[Dict]]) -> List[List[Dict]]:
+    """The item dicts of a parsed archive built afresh, with no parsing"""
+    return [[{"Date": item["Date"], "Ingredient": item["Ingredient"], "Quantity": item["Quantity"],
+              "Price": item["Price"], "Notes": ""} for item in items] for items in parsed]
+
+def best_time(function, *args, runs: int = 3) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def measure(receipts: List[List[str]], reference=None, runs: int = 3) -> Dict:
+    """Microseconds per line for the archive, its output floor and the reference parser"""
+    line_count = sum(len(lines) for lines in receipts)
+    parsed = parse_archive(current_parser, receipts)
+    result = {
+        "receipts": len(receipts),
+        "lines": line_count,
+        "distinct_lines": len(set().union(*receipts)),
+        "items": sum(len(items) for items in parsed),
+        "us_per_line": best_time(parse_archive, current_parser, receipts, runs=runs) / line_count * 1e6,
+        "floor_us_per_line": best_time(build_output, parsed, runs=runs) / line_count * 1e6
+    }
+    if reference is not None:
+        result["reference_us_per_line"] = best_time(parse_archive, reference, receipts, runs=runs) / line_count * 1e6
+        result["speedup"] = result["reference_us_per_line"] / result["us_per_line"]
+        result["floor_speedup"] = result["reference_us_per_line"] / result["floor_us_per_line"]
+        result["identical"] = parse_archive(reference, receipts) == parsed
+    return result
+
+def print_report(summary: Dict):
+    for name, result in summary["archives"].items():
+        print(f"{name}: {result['lines']} lines ({result['distinct_lines']} distinct) "
+              f"in {result['receipts']} receipts, {result['items']} items")
+        print(f"  parse_receipts {result['us_per_line']:.2f} us/line, "
+              f"output floor {result['floor_us_per_line']:.2f} us/line")
+        if "reference_us_per_line" in result:
+            print(f"  reference {result['reference_us_per_line']:.2f} us/line: {result['speedup']:.1f}x faster "
+                  f"(at most {result['floor_speedup']:.1f}x), identical output: {result['identical']}")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lines", type=int, default=100_000, help="Lines in the distinct-line archive")
+    parser.add_argument("--pool", type=int, default=3000, help="Distinct lines the repeating archive draws from")
+    parser.add_argument("--receipts", type=int, default=5000, help="Receipts in the repeating archive")
+    parser.add_argument("--per-receipt", type=int, default=30, help="Lines per receipt")
+    parser.add_argument("--runs", type=int, default=3, help="Timed runs, the best is kept")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the generated lines")
+    parser.add_argument("--reference", help="Parser module file to compare against")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    reference: Optional[object] = load_parser(args.reference) if args.reference else None
+    distinct = generate_lines(args.lines, args.seed)
+    archives = {
+        "distinct": split_receipts(distinct, args.per_receipt),
+        "repeating": sample_receipts(distinct[:args.pool], args.receipts, args.per_receipt, args.seed)
+    }
+    summary = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "reference": args.reference,
+        "archives": {name: measure(receipts, reference, args.runs) for name, receipts in archives.items()}
+    }
+
+    print_report(summary)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+    identical = [result.get("identical", True) for result in summary["archives"].values()]
+    return 0 if all(identical) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
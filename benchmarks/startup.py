@@ -0,0 +1,116 @@
+"""
+Cold-start import benchmark
+
+Imports a module (app.main by default) in fresh interpreters with
+`python -X importtime` and reports wall time and per-module import time,
+failing when the median wall time is over budget or a dependency that
+should load lazily is imported at startup.
+
+    python -m benchmarks.startup --runs 5 --budget 1.5 --output startup.json
+"""
+import argparse
+import json
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+# Only needed on the code paths that use them, never at startup
+DEFERRED_MODULES = ["openai", "easyocr", "torch", "googleapiclient", "httplib2", "google_auth_httplib2", "PIL"]
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+def parse_importtime(stderr: str) -> Dict[str, Dict]:
+    """
+    Per-module timings from -X importtime output
+
+    Returns:
+        {module: {'self': seconds, 'cumulative': seconds, 'depth': nesting level}}
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = {
+                "self": int(self_us) / 1e6,
+                "cumulative": int(cumulative_us) / 1e6,
+                "depth": len(indent) // 2
+            }
+    return modules
+
+def measure(module: str) -> Dict:
+    """Import module once in a fresh interpreter"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return {"wall": wall, "modules": parse_importtime(result.stderr)}
+
+def summarize(runs: List[Dict], module: str, top: int, budget: float) -> Dict:
+    """Median timings across runs"""
+    names = set().union(*(run["modules"] for run in runs))
+
+    def median_of(name: str, field: str) -> float:
+        values = [run["modules"][name][field] for run in runs if name in run["modules"]]
+        return round(statistics.median(values), 4)
+
+    timings = {name: {"self": median_of(name, "self"), "cumulative": median_of(name, "cumulative")}
+               for name in names}
+    wall = round(statistics.median(run["wall"] for run in runs), 4)
+    app_modules = sorted((name for name in names if name == "app" or name.startswith("app.")),
+                         key=lambda name: -timings[name]["cumulative"])
+    heaviest = sorted(names, key=lambda name: -timings[name]["self"])[:top]
+    eager = [name for name in DEFERRED_MODULES if name in names]
+
+    return {
+        "module": module,
+        "runs": len(runs),
+        "wall_seconds": wall,
+        "import_seconds": timings.get(module, {}).get("cumulative"),
+        "budget_seconds": budget,
+        "within_budget": wall <= budget,
+        "eager_deferred_modules": eager,
+        "app_modules": {name: timings[name] for name in app_modules},
+        "heaviest_modules": {name: timings[name] for name in heaviest}
+    }
+
+def print_report(summary: Dict):
+    print(f"{summary['module']}: {summary['wall_seconds']:.3f}s wall "
+          f"(median of {summary['runs']}, budget {summary['budget_seconds']:.3f}s)")
+    print(f"\n{'app module':<40} {'cumulative':>10} {'self':>10}")
+    for name, timing in summary["app_modules"].items():
+        print(f"{name:<40} {timing['cumulative']:>10.4f} {timing['self']:>10.4f}")
+    print(f"\n{'heaviest modules (self time)':<40} {'cumulative':>10} {'self':>10}")
+    for name, timing in summary["heaviest_modules"].items():
+        print(f"{name:<40} {timing['cumulative']:>10.4f} {timing['self']:>10.4f}")
+    if summary["eager_deferred_modules"]:
+        print(f"\nImported at startup but should load lazily: {', '.join(summary['eager_deferred_modules'])}")
+    print(f"\n{'OK' if summary['within_budget'] and not summary['eager_deferred_modules'] else 'FAIL'}")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="app.main", help="Module to import")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to time")
+    parser.add_argument("--budget", type=float, default=2.0, help="Maximum median wall time in seconds")
+    parser.add_argument("--top", type=int, default=15, help="Heaviest modules to list")
+    parser.add_argument("--output", help="Write the summary as JSON to this file")
+    args = parser.parse_args(argv)
+
+    runs = [measure(args.module) for _ in range(args.runs)]
+    summary = summarize(runs, args.module, args.top, args.budget)
+    print_report(summary)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    return 0 if summary["within_budget"] and not summary["eager_deferred_modules"] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
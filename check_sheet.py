@@ -1,27 +1,21 @@
 import os
 from dotenv import load_dotenv
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
 
 # Load environment variables
 load_dotenv("app/.env")
 
+from app.services.sheets import get_sheets_client
+
 def check_spreadsheet():
     try:
         spreadsheet_id = os.getenv("SPREADSHEET_ID")
         print(f"Spreadsheet ID: {spreadsheet_id}")
         
-        # Load credentials
-        creds = service_account.Credentials.from_service_account_file(
-            'app/credentials.json',
-            scopes=['https://www.googleapis.com/auth/spreadsheets']
-        )
-        
-        # Build service
-        service = build('sheets', 'v4', credentials=creds)
+        # Shared client (cached credentials and discovery document)
+        sheet = get_sheets_client().spreadsheets()
         
         # Get sheet data
-        result = service.spreadsheets().values().get(
+        result = sheet.values().get(
             spreadsheetId=spreadsheet_id,
             range="Sheet1!A:F"
         ).execute()
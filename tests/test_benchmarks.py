@@ -0,0 +1,83 @@
+import io
+import unittest
+
+import httpx
+from PIL import Image
+
+from app.agent import parser
+from benchmarks.corpus import generate_receipt, unique_copy
+from benchmarks.e2e import compare, latency_summary, parse_stage_metrics, percentile, stage_breakdown
+from benchmarks.fakes import start_fake_openai, start_fake_sheets
+from benchmarks.parser import generate_lines, measure, split_receipts
+
+def level(throughput: float, p95: float, errors: dict = None) -> dict:
+    return {"concurrency": 4, "throughput_per_second": throughput,
+            "latency_seconds": {"upload": {"count": 10, "p95": p95}}, "errors": errors or {}}
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_percentiles(self):
+        """Test interpolated percentiles and the latency summary"""
+        values = [0.1, 0.2, 0.3, 0.4, 0.5]
+        self.assertAlmostEqual(percentile(values, 50), 0.3)
+        self.assertAlmostEqual(percentile(values, 95), 0.48)
+        self.assertIsNone(percentile([], 50))
+        self.assertEqual(latency_summary([0.25])["p99"], 0.25)
+        self.assertEqual(latency_summary([]), {"count": 0})
+
+    def test_stage_breakdown(self):
+        """Test per-stage figures from two /metrics scrapes"""
+        before = parse_stage_metrics('receipt_stage_seconds_sum{stage="vlm"} 1.0\n'
+                                     'receipt_stage_seconds_count{stage="vlm"} 2\n')
+        after = parse_stage_metrics('receipt_stage_seconds_bucket{stage="vlm",le="+Inf"} 6\n'
+                                    'receipt_stage_seconds_sum{stage="vlm"} 3.0\n'
+                                    'receipt_stage_seconds_count{stage="vlm"} 6\n'
+                                    'receipt_stage_seconds_sum{stage="ocr"} 0\n'
+                                    'receipt_stage_seconds_count{stage="ocr"} 0\n')
+        self.assertEqual(stage_breakdown(before, after),
+                         {"vlm": {"count": 4, "total_seconds": 2.0, "mean_seconds": 0.5}})
+
+    def test_compare(self):
+        """Test regressions against a baseline run"""
+        baseline = {"levels": [level(10.0, 0.10)]}
+        self.assertEqual(compare({"levels": [level(9.0, 0.11)]}, baseline, 0.2), [])
+        regressions = compare({"levels": [level(7.0, 0.15, {"submit": 1})]}, baseline, 0.2)
+        self.assertEqual(len(regressions), 3)
+
+    def test_fake_servers(self):
+        """Test the fakes answer like the APIs and inject errors"""
+        openai_server = start_fake_openai(items=3, seed=1)
+        sheets_server = start_fake_sheets(error_rate=1.0, error_status=429)
+        try:
+            reply = httpx.post(f"{openai_server.url}/v1/chat/completions", json={"model": "gpt-4o"})
+            content = reply.json()["choices"][0]["message"]["content"]
+            self.assertEqual(content.count('"Ingredient"'), 3)
+
+            reply = httpx.post(f"{sheets_server.url}/v4/spreadsheets/x/values/A:F:append", json={"values": [[1]]})
+            self.assertEqual(reply.status_code, 429)
+            self.assertEqual(reply.headers["Retry-After"], "1")
+            self.assertEqual(sheets_server.stats(), {"requests": 1, "errors": 1})
+        finally:
+            openai_server.stop()
+            sheets_server.stop()
+
+    def test_corpus(self):
+        """Test generated receipts decode, and unique copies still decode"""
+        image = generate_receipt(120, seed=3)
+        copy = unique_copy(image, 7)
+        self.assertNotEqual(image, copy)
+        decoded = Image.open(io.BytesIO(copy))
+        decoded.load()
+        self.assertGreater(decoded.height, 2500)
+
+    def test_parser_benchmark(self):
+        """Test the generated lines are distinct and a reference run is compared"""
+        lines = generate_lines(300, seed=1)
+        self.assertEqual(len(set(lines)), 300)
+        result = measure(split_receipts(lines, 30), reference=parser, runs=1)
+        self.assertEqual(result["lines"], 300)
+        self.assertTrue(result["identical"])
+        self.assertGreater(result["items"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+from app.agent.cache import ExtractionCache, make_cache_key
+
+ITEMS = [{"Ingredient": "Bread", "Price": "1.20"}]
+
+class TestExtractionCache(unittest.TestCase):
+
+    def test_key_covers_prompt_and_model(self):
+        """Test that the key changes with image, prompt and model"""
+        base = make_cache_key(b"image", "prompt", "gpt-4o")
+        self.assertEqual(base, make_cache_key(b"image", "prompt", "gpt-4o"))
+        self.assertNotEqual(base, make_cache_key(b"image2", "prompt", "gpt-4o"))
+        self.assertNotEqual(base, make_cache_key(b"image", "prompt2", "gpt-4o"))
+        self.assertNotEqual(base, make_cache_key(b"image", "prompt", "gpt-4o-mini"))
+
+    def test_lru_eviction(self):
+        """Test that the memory tier drops the least recently used entry"""
+        cache = ExtractionCache(max_entries=2)
+        cache.set("a", ITEMS)
+        cache.set("b", ITEMS)
+        cache.get("a")
+        cache.set("c", ITEMS)
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_disk_tier_and_ttl(self):
+        """Test disk persistence across instances and TTL expiry"""
+        with tempfile.TemporaryDirectory() as disk_dir:
+            ExtractionCache(disk_dir=disk_dir).set("abcd", ITEMS)
+
+            cache = ExtractionCache(disk_dir=disk_dir)
+            self.assertEqual(cache.get("abcd"), ITEMS)
+            self.assertEqual(cache.stats()["disk_hits"], 1)
+
+            expired = ExtractionCache(max_entries=0, disk_dir=disk_dir, ttl_seconds=60)
+            path = expired._disk_path("abcd")
+            old = time.time() - 120
+            os.utime(path, (old, old))
+            self.assertIsNone(expired.get("abcd"))
+            self.assertFalse(os.path.exists(path))
+
+    def test_results_are_copies(self):
+        """Test that editing a returned or stored result doesn't change the cache"""
+        with tempfile.TemporaryDirectory() as disk_dir:
+            cache = ExtractionCache(disk_dir=disk_dir)
+            items = [dict(item) for item in ITEMS]
+            cache.set("abcd", items)
+            items[0]["Ingredient"] = "Edited"
+            cache.get("abcd")[0]["Price"] = "9.99"
+            self.assertEqual(cache.get("abcd"), ITEMS)
+
+            cache.clear()
+            cache.get("abcd").append({"Ingredient": "Extra"})
+            self.assertEqual(cache.get("abcd"), ITEMS)
+
+    def test_empty_results_not_cached(self):
+        """Test that failed (empty) extractions are retried next time"""
+        cache = ExtractionCache()
+        cache.set("empty", [])
+        self.assertIsNone(cache.get("empty"))
+
+    def test_in_flight_coalescing(self):
+        """Test that concurrent misses on one key run a single extraction"""
+        cache = ExtractionCache()
+        calls = []
+
+        async def extract():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return ITEMS
+
+        async def run():
+            return await asyncio.gather(*[cache.get_or_extract("k", extract) for _ in range(5)])
+
+        results = asyncio.run(run())
+        self.assertEqual(results, [ITEMS] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache.stats()["coalesced"], 4)
+        # Each caller can edit its result without affecting the others
+        self.assertEqual(len({id(items[0]) for items in results}), 5)
+
+    def test_incomplete_results_shared_not_stored(self):
+        """Test that an uncacheable result reaches concurrent callers but isn't stored"""
+        cache = ExtractionCache()
+
+        async def extract():
+            await asyncio.sleep(0.05)
+            return ITEMS
+
+        async def run():
+            return await asyncio.gather(*[
+                cache.get_or_extract("k", extract, lambda items: False) for _ in range(3)
+            ])
+
+        self.assertEqual(asyncio.run(run()), [ITEMS] * 3)
+        self.assertIsNone(cache.get("k"))
+        self.assertEqual(cache.stats()["stores"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import unittest
+
+from app.agent import catalog
+from app.agent.catalog import IngredientCatalog, canonicalize_items, normalize_name
+from app.agent.infer import improve_ingredient_name
+
+class TestIngredientCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.learned_path = os.path.join(self.temp_dir.name, "learned.json")
+        os.environ["CATALOG_LEARNED_PATH"] = self.learned_path
+        catalog._catalog = None
+
+    def tearDown(self):
+        catalog._catalog = None
+        os.environ.pop("CATALOG_LEARNED_PATH", None)
+        self.temp_dir.cleanup()
+
+    def test_normalize(self):
+        """Test that case, accents and punctuation don't affect keys"""
+        self.assertEqual(normalize_name("  Crème-Fraîche! "), "creme fraiche")
+
+    def test_exact_and_alias(self):
+        """Test that names and aliases map to the canonical entry with score 1"""
+        entries = catalog.get_ingredient_catalog()
+        self.assertEqual(entries.match("WHOLE MILK")["score"], 1.0)
+        self.assertEqual(entries.match("s/skim milk")["name"], "Semi Skimmed Milk")
+
+    def test_substrings_are_not_merged(self):
+        """Test that a name containing another ingredient keeps its own identity"""
+        self.assertEqual(improve_ingredient_name("buttermilk"), "Buttermilk")
+        self.assertEqual(improve_ingredient_name("Whole Milk"), "Whole Milk")
+        self.assertEqual(improve_ingredient_name("dragon fruit"), "Dragon Fruit")
+        self.assertEqual(improve_ingredient_name(""), "Unknown Item")
+
+    def test_longer_product_not_merged(self):
+        """Test that a product whose name contains a shorter entry keeps its own identity"""
+        entries = catalog.get_ingredient_catalog()
+        self.assertIsNone(entries.match("Skimmed Milk Powder"))
+        self.assertIsNone(entries.match("Chicken Breast Fillets"))
+        self.assertEqual(improve_ingredient_name("skimmed milk powder"), "Skimmed Milk Powder")
+        # Sizes and split words don't count as leftovers
+        self.assertEqual(entries.match("Free Range Eggs 12")["name"], "Eggs")
+        self.assertEqual(entries.match("Butter Milk")["name"], "Buttermilk")
+
+    def test_ocr_mangled_names(self):
+        """Test that misspelt OCR output still finds the right entry"""
+        entries = catalog.get_ingredient_catalog()
+        for raw, expected in [("BUTTRMILK", "Buttermilk"), ("Brocoli", "Broccoli"),
+                              ("semi skimmed mlk", "Semi Skimmed Milk"), ("Tomatos", "Tomatoes")]:
+            match = entries.match(raw)
+            self.assertIsNotNone(match, raw)
+            self.assertEqual(match["name"], expected)
+            self.assertLess(match["score"], 1.0)
+        self.assertIsNone(entries.match("Xyzzy"))
+
+    def test_canonicalize_copies(self):
+        """Test that canonicalising leaves the original items untouched"""
+        items = [{"Ingredient": "brocoli", "Price": "0.60"}, {"Ingredient": "Gizmo", "Price": "1.00"}]
+        result = canonicalize_items(items)
+        self.assertEqual([item["Ingredient"] for item in result], ["Broccoli", "Gizmo"])
+        self.assertEqual(items[0]["Ingredient"], "brocoli")
+
+    def test_learn_from_submission(self):
+        """Test that corrections become aliases and survive a reload"""
+        entries = catalog.get_ingredient_catalog()
+        extracted = [{"Ingredient": "Tsc Frsh Crm"}, {"Ingredient": "White Bread"}]
+        approved = [{"Ingredient": "Single Cream"}, {"Ingredient": "White Bread"}]
+        self.assertEqual(entries.learn_from_submission(extracted, approved), 1)
+        self.assertEqual(entries.match("tsc frsh crm")["name"], "Single Cream")
+
+        # Nothing new the second time
+        self.assertEqual(entries.learn_from_submission(extracted, approved), 0)
+
+        entries.save_learned(self.learned_path)
+        with open(self.learned_path) as f:
+            self.assertEqual(json.load(f), {"Single Cream": ["Tsc Frsh Crm"]})
+
+        catalog._catalog = None
+        self.assertEqual(catalog.get_ingredient_catalog().match("TSC FRSH CRM")["name"], "Single Cream")
+
+    def test_replaced_rows_not_learned_as_aliases(self):
+        """Test that a row the reviewer replaced, or one shifted by a deletion, isn't an alias"""
+        entries = catalog.get_ingredient_catalog()
+        extracted = [{"Ingredient": "Milk", "Price": "1.20"}, {"Ingredient": "Tsc Frsh Crm", "Price": "0.95"}]
+        approved = [{"Ingredient": "Bread", "Price": "1.20"}, {"Ingredient": "Single Cream", "Price": "0.95"}]
+        entries.learn_from_submission(extracted, approved)
+        self.assertIsNone(entries.match("milk"))
+        self.assertEqual(entries.match("tsc frsh crm")["name"], "Single Cream")
+
+        # The first row was deleted: "Brocoli" pairs with "Broccoli" by price, not "Tomatoes" by position
+        extracted = [{"Ingredient": "Tomatos", "Price": "0.80"}, {"Ingredient": "Brocoli", "Price": "£0.60"}]
+        approved = [{"Ingredient": "Broccoli", "Price": "0.60"}]
+        entries.learn_from_submission(extracted, approved)
+        self.assertEqual(entries.match("brocoli")["score"], 1.0)
+        self.assertNotEqual(entries.match("tomatos")["name"], "Broccoli")
+
+    def test_learned_typo_becomes_alias(self):
+        """Test that an approved name close to an entry is added as its alias"""
+        entries = catalog.get_ingredient_catalog()
+        names = len(entries)
+        self.assertEqual(entries.learn_from_submission([], [{"Ingredient": "Semi Skimmed Mlik"},
+                                                            {"Ingredient": "Skimmed Milk Powder"}]), 2)
+        self.assertEqual(len(entries), names + 1)
+        self.assertEqual(entries.match("semi skimmed mlik"), {"name": "Semi Skimmed Milk", "score": 1.0,
+                                                             "matched": "semi skimmed mlik"})
+        self.assertEqual(entries.match("skimmed milk powder")["name"], "Skimmed Milk Powder")
+
+        entries.save_learned(self.learned_path)
+        with open(self.learned_path) as f:
+            self.assertEqual(json.load(f), {"Semi Skimmed Milk": ["Semi Skimmed Mlik"], "Skimmed Milk Powder": []})
+
+    def test_large_catalog(self):
+        """Test lookups stay under a millisecond with 30,000 entries sharing common words"""
+        words = ["organic", "free", "range", "semi", "skimmed", "whole", "milk", "cheese", "chicken",
+                 "breast", "tomato", "sauce", "pasta", "bread", "white", "rice", "olive", "oil",
+                 "butter", "salted", "greek", "yoghurt", "smoked", "salmon", "beef", "mince",
+                 "apple", "juice", "frozen", "peas", "red", "pepper", "onion", "garlic"]
+        rng = random.Random(7)
+        entries = IngredientCatalog()
+        for i in range(30000):
+            entries.add(f"{' '.join(rng.sample(words, rng.randint(2, 4)))} {i}")
+        entries.add("Semi Skimmed Milk", ["s skim milk"])
+        entries.add("Olive Oil Extra Virgin")
+
+        queries = ["semi skimmed mlk", "olve oil extra virgn", "chiken brest", "smoked salmn", "xyzzy"]
+        timings = []
+        for _ in range(20):
+            for query in queries:
+                start = time.perf_counter()
+                entries.match(query)
+                timings.append(time.perf_counter() - start)
+
+        self.assertEqual(entries.match("semi skimmed mlk")["name"], "Semi Skimmed Milk")
+        self.assertEqual(entries.match("olve oil extra virgn")["name"], "Olive Oil Extra Virgin")
+        self.assertLess(statistics.median(timings), 0.001)
+
+if __name__ == '__main__':
+    unittest.main()
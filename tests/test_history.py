@@ -0,0 +1,50 @@
+import json
+import os
+import tempfile
+import unittest
+
+from app.services.history import HistoryStore
+
+class TestHistoryStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = HistoryStore(os.path.join(self.tmp.name, "history.sqlite3"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_no_size_cap(self):
+        """Test that old entries are kept past the previous 50-entry limit"""
+        for i in range(60):
+            self.store.add(f"receipt{i}.jpg", "vlm", i, timestamp=f"2025-07-01T10:{i:02d}:00")
+
+        self.assertEqual(self.store.count(), 60)
+        self.assertEqual(self.store.latest()["filename"], "receipt59.jpg")
+
+    def test_pagination_and_filters(self):
+        """Test newest-first paging and filtering by method and file"""
+        for i in range(5):
+            self.store.add("a.jpg" if i % 2 else "b.jpg", "ocr" if i == 4 else "vlm", i,
+                           timestamp=f"2025-07-0{i + 1}T12:00:00")
+
+        page = self.store.query(limit=2, offset=2)
+        self.assertEqual([entry["items_count"] for entry in page], [2, 1])
+        self.assertEqual(self.store.count(method="vlm"), 4)
+        self.assertEqual([e["items_count"] for e in self.store.query(filename="a.jpg")], [3, 1])
+        self.assertEqual(self.store.count(since="2025-07-03"), 3)
+
+    def test_import_json_once(self):
+        """Test that the legacy JSON history is imported exactly once"""
+        path = os.path.join(self.tmp.name, "upload_history.json")
+        with open(path, "w") as f:
+            json.dump([{"filename": "test.jpg", "method": "vlm",
+                        "timestamp": "2025-06-29T18:48:19.349451", "items_count": 11}], f)
+
+        self.assertEqual(self.store.import_json(path), 1)
+        self.assertEqual(self.store.import_json(path), 0)
+        self.assertEqual(self.store.count(), 1)
+        self.assertEqual(self.store.latest()["items_count"], 11)
+
+if __name__ == '__main__':
+    unittest.main()
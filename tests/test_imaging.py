@@ -0,0 +1,75 @@
+import io
+import unittest
+
+from PIL import Image, ImageDraw
+
+from app.agent.imaging import crop_to_paper, prepare_image_for_vlm, prepare_strips_for_vlm, strip_bounds
+
+def make_photo(size=(3000, 4000), paper=(900, 300, 2100, 3700)) -> bytes:
+    """Dark background with a white receipt and some 'text' lines"""
+    img = Image.new('RGB', size, (60, 50, 40))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle(paper, fill=(245, 245, 240))
+    for y in range(paper[1] + 100, paper[3] - 100, 80):
+        draw.rectangle((paper[0] + 60, y, paper[2] - 60, y + 20), fill=(20, 20, 20))
+    buffer = io.BytesIO()
+    img.save(buffer, format='JPEG', quality=95)
+    return buffer.getvalue()
+
+class TestImaging(unittest.TestCase):
+
+    def test_crop_to_paper(self):
+        """Test that the background around the receipt is removed"""
+        img = Image.open(io.BytesIO(make_photo()))
+        cropped = crop_to_paper(img)
+
+        self.assertLess(cropped.width, 1400)
+        self.assertGreaterEqual(cropped.width, 1200)
+        self.assertGreaterEqual(cropped.height, 3400)
+
+    def test_prepare_shrinks_payload(self):
+        """Test downscaling, re-encoding and the before/after report"""
+        data = make_photo()
+        encoded, detail, report = prepare_image_for_vlm(data, {
+            "target_width": 768, "max_side": 2048, "quality": 80,
+            "grayscale": True, "crop": True
+        })
+
+        self.assertEqual(detail, "high")
+        self.assertEqual(report["original_bytes"], len(data))
+        self.assertEqual(report["encoded_bytes"], len(encoded))
+        self.assertLess(len(encoded), len(data))
+        self.assertLessEqual(max(report["final_size"]), 2048)
+        self.assertEqual(Image.open(io.BytesIO(encoded)).mode, 'L')
+
+    def test_small_image_uses_low_detail(self):
+        """Test that tiny images are sent at low detail"""
+        img = Image.new('RGB', (300, 400), (255, 255, 255))
+        buffer = io.BytesIO()
+        img.save(buffer, format='PNG')
+
+        _, detail, _ = prepare_image_for_vlm(buffer.getvalue())
+        self.assertEqual(detail, "low")
+
+    def test_strip_bounds(self):
+        """Test that strips cover the whole height with the requested overlap"""
+        bounds = strip_bounds(5000, 1500, 200)
+        self.assertEqual(bounds[0][0], 0)
+        self.assertEqual(bounds[-1][1], 5000)
+        for (_, bottom), (top, _) in zip(bounds, bounds[1:]):
+            self.assertGreaterEqual(bottom - top, 200)
+        self.assertEqual(strip_bounds(1000, 1500, 200), [(0, 1000)])
+
+    def test_tall_receipt_is_tiled(self):
+        """Test that only receipts much taller than wide are split"""
+        settings = {"target_width": 512, "max_side": 2048, "quality": 80, "grayscale": True,
+                    "crop": False, "tile_aspect": 2.0, "tile_overlap": 0.15}
+        tall = make_photo(size=(600, 4000), paper=(0, 0, 600, 4000))
+        strips = prepare_strips_for_vlm(tall, settings)
+        self.assertGreater(len(strips), 1)
+        self.assertEqual([report["strip"] for _, _, report in strips], list(range(len(strips))))
+
+        self.assertEqual(len(prepare_strips_for_vlm(make_photo(), settings)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
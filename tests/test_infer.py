@@ -0,0 +1,39 @@
+import unittest
+
+from app.agent.infer import clean_quantity_and_price, normalize_quantity, standardize_quantity, unit_price
+
+class TestQuantity(unittest.TestCase):
+
+    def test_display(self):
+        """Test standardized display text; words containing unit letters are left alone"""
+        self.assertEqual(standardize_quantity("500G"), "500g")
+        self.assertEqual(standardize_quantity("2 pt"), "2 PT")
+        self.assertEqual(standardize_quantity("1.5l"), "1.5L")
+        self.assertEqual(standardize_quantity("2 Bottles"), "2 bottles")
+        self.assertEqual(standardize_quantity("1 pack"), "1 pack")
+        self.assertEqual(standardize_quantity(""), "1")
+
+    def test_structured_amounts(self):
+        """Test value, unit and base-unit totals"""
+        info = normalize_quantity("2 x 500g")
+        self.assertEqual((info["value"], info["unit"], info["count"]), (500.0, "g", 2.0))
+        self.assertEqual((info["base_amount"], info["base_unit"]), (1000.0, "g"))
+
+        self.assertEqual(normalize_quantity("1.5L")["base_amount"], 1500.0)
+        self.assertEqual(normalize_quantity("6 pack")["base_unit"], "each")
+        self.assertEqual(normalize_quantity("1 dozen")["base_amount"], 12.0)
+        self.assertIsNone(normalize_quantity("loose")["base_amount"])
+
+    def test_unit_price(self):
+        """Test price per kg / L / item"""
+        self.assertEqual(unit_price("2 x 500g", "3.00"), {"amount": 3.0, "per": "kg"})
+        self.assertEqual(unit_price("6 pack", "£1.20"), {"amount": 0.2, "per": "each"})
+        self.assertIsNone(unit_price("loose", "1.00"))
+
+    def test_clean_item(self):
+        """Test cleaning a parsed item"""
+        item = clean_quantity_and_price({"Ingredient": "bread", "Quantity": "2 X", "Price": "$3.2"})
+        self.assertEqual((item["Quantity"], item["Price"], item["Ingredient"]), ("2 x", "3.20", "Bread"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,168 @@
+import asyncio
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from app import ingest as ingest_module
+from app.ingest import Progress, discover, ingest
+from app.services.ingest_store import IngestStore
+
+ITEM = {"Date": "2025-06-29", "Ingredient": "Whole Milk", "Quantity": "2 PT", "Price": "1.45", "Notes": ""}
+
+class FakePipeline:
+    """Stands in for process_batch; images whose bytes start with b"fail" fail"""
+
+    def __init__(self, retryable: bool = False):
+        self.seen = []
+        self.retryable = retryable
+
+    async def __call__(self, receipts, method, extract_concurrency=None, ocr_executor=None, on_result=None,
+                       keep_results=True):
+        async for filename, data in receipts:
+            self.seen.append(filename)
+            if data.startswith(b"fail"):
+                result = {"filename": filename, "items": [], "metadata": {
+                    "success": False, "error": "rate limited", "retryable": self.retryable}}
+            else:
+                result = {"filename": filename, "items": [ITEM], "metadata": {"success": True}}
+            on_result(result)
+
+class TestIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.images = os.path.join(self.dir, "images")
+        os.makedirs(os.path.join(self.images, "2024"))
+        for path, data in [("a.jpg", b"receipt a"), ("2024/b.png", b"receipt b"),
+                           ("2024/copy-of-a.jpg", b"receipt a"), ("c.jpg", b"fail c"), ("notes.txt", b"x")]:
+            with open(os.path.join(self.images, path), "wb") as f:
+                f.write(data)
+        self.store = IngestStore(os.path.join(self.dir, "ingest.sqlite3"))
+        self.progress = Progress(0, io.StringIO())
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_ingest(self, pipeline, **options):
+        sources = discover(self.images)
+        self.progress.total = len(sources)
+        return asyncio.run(ingest(sources, self.store, process=pipeline, progress=self.progress,
+                                  read_ahead=2, **options))
+
+    def test_dedup_and_resume(self):
+        """Test that duplicates are skipped and a second run only redoes nothing"""
+        first = FakePipeline()
+        counts = self.run_ingest(first)
+        self.assertEqual((counts["done"], counts["failed"], counts["duplicates"]), (2, 1, 1))
+        self.assertEqual(len(first.seen), 3)
+
+        second = FakePipeline()
+        counts = self.run_ingest(second)
+        self.assertEqual(second.seen, [])
+        self.assertEqual((counts["already_done"], counts["failed_before"]), (2, 1))
+        self.assertEqual(self.store.stats()["items"], 2)
+
+        counts = self.run_ingest(FakePipeline(), retry_failed=True)
+        self.assertEqual(counts["failed"], 1)
+
+    def test_retryable_failures_are_retried(self):
+        """Test that a receipt that was throttled is extracted on the next run"""
+        self.run_ingest(FakePipeline(retryable=True))
+        second = FakePipeline()
+        self.run_ingest(second)
+        self.assertEqual([os.path.basename(name) for name in second.seen], ["c.jpg"])
+
+    def test_sheet_rows_survive_failed_appends(self):
+        """Test that rows a failed append didn't send go out on the next run"""
+        calls = []
+
+        def broken(items, source):
+            return {"success": False, "error": "quota"}
+
+        def working(items, source):
+            calls.append(len(items))
+            return {"success": True}
+
+        counts = self.run_ingest(FakePipeline(), to_sheet=True, append=broken)
+        self.assertGreater(counts["sheet_errors"], 0)
+        counts = self.run_ingest(FakePipeline(), to_sheet=True, append=working)
+        self.assertEqual(counts["sheet_rows"], 2)
+        self.assertEqual(self.store.stats()["sheet"], {"appended": 2})
+
+    def test_interrupted_append_not_resent(self):
+        """Test that rows whose append never returned aren't sent twice unless asked"""
+        calls = []
+
+        def crashing(items, source):
+            raise ConnectionError("connection reset")
+
+        def working(items, source):
+            calls.append(len(items))
+            return {"success": True}
+
+        with self.assertRaises(ConnectionError):
+            self.run_ingest(FakePipeline(), to_sheet=True, append=crashing)
+        self.assertEqual(self.store.stats()["sheet"], {"sending": 2})
+
+        counts = self.run_ingest(FakePipeline(), to_sheet=True, append=working)
+        self.assertEqual((counts["sheet_rows"], counts["sheet_unconfirmed"]), (0, 2))
+        self.assertEqual(calls, [])
+
+        counts = self.run_ingest(FakePipeline(), to_sheet=True, append=working, resend_unconfirmed=True)
+        self.assertEqual((counts["sheet_rows"], counts["sheet_unconfirmed"]), (2, 0))
+        self.assertEqual(self.store.stats()["sheet"], {"appended": 2})
+
+    def test_sources_read_as_pipeline_takes_them(self):
+        """Test that the producer only reads a bounded window ahead of the pipeline"""
+        for index in range(10):
+            with open(os.path.join(self.images, f"more-{index}.jpg"), "wb") as f:
+                f.write(b"receipt %d" % index)
+        loads = []
+        load_source = ingest_module.load_source
+        taken = []
+
+        def counting_load(*args):
+            loads.append(1)
+            return load_source(*args)
+
+        class Recording(FakePipeline):
+            def __call__(self, receipts, method, **options):
+                async def record():
+                    async for receipt in receipts:
+                        taken.append(len(loads))
+                        yield receipt
+                return super().__call__(record(), method, **options)
+
+        with mock.patch.object(ingest_module, "load_source", counting_load):
+            counts = self.run_ingest(Recording())
+        self.assertEqual(counts["done"], 12)
+        self.assertLessEqual(taken[0], 3)
+        self.assertTrue(all(loaded - index <= 4 for index, loaded in enumerate(taken)))
+
+    def test_discover_archives(self):
+        """Test that images inside zip archives are found"""
+        archive = os.path.join(self.images, "old.zip")
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("scans/d.jpg", b"receipt d")
+            zf.writestr("readme.md", b"no")
+        sources = {os.path.relpath(source.name, self.images): source for source in discover(self.images)}
+        self.assertIn("old.zip!scans/d.jpg", sources)
+        self.assertEqual(sources["old.zip!scans/d.jpg"].read(), b"receipt d")
+        self.assertEqual(len(sources), 5)
+
+    def test_progress_line(self):
+        """Test the throughput and ETA line"""
+        progress = Progress(10, io.StringIO())
+        progress.advance("skipped")
+        progress.advance("done")
+        progress.advance("failed")
+        line = progress.line()
+        self.assertTrue(line.startswith("3/10 | 1 ok, 1 failed, 1 skipped"))
+        self.assertIn("ETA", line)
+
+if __name__ == '__main__':
+    unittest.main()
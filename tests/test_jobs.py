@@ -0,0 +1,180 @@
+import asyncio
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+from app.services import jobs, session_store
+from app.services.jobs import JobQueue, QueueFullError
+
+def report_pid(hold: float = 0.05) -> int:
+    """Stands in for the OCR warm task (EasyOCR isn't needed to start the pool)"""
+    time.sleep(hold)
+    return os.getpid()
+
+class TestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.old_key = os.environ.pop("OPENAI_API_KEY", None)
+        session_store._session_store = session_store.InMemorySessionStore()
+
+    def tearDown(self):
+        session_store._session_store = None
+        if self.old_key is not None:
+            os.environ["OPENAI_API_KEY"] = self.old_key
+
+    def test_submit_and_wait(self):
+        """Test that a job is queued, processed and reported with timings"""
+        async def run():
+            queue = JobQueue(workers=2)
+            try:
+                job_id = await queue.submit(memoryview(b"image"), "a.jpg", "vlm")
+                job = await queue.wait(job_id, timeout=5)
+                return job, queue.stats()
+            finally:
+                await queue.stop()
+
+        job, stats = asyncio.run(run())
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(job["filename"], "a.jpg")
+        self.assertEqual(job["metadata"]["error"], "OpenAI API key not configured")
+        self.assertIn("queued", job["metadata"]["timings"])
+        self.assertEqual(stats["completed"], 1)
+        self.assertEqual(stats["queue_length"], 0)
+
+    def test_follow(self):
+        """Test that following a job ends with its final state"""
+        async def run():
+            queue = JobQueue(workers=1)
+            try:
+                job_id = await queue.submit(memoryview(b"image"), "a.jpg", "vlm")
+                return [job["status"] async for job in queue.follow(job_id)]
+            finally:
+                await queue.stop()
+
+        statuses = asyncio.run(run())
+        self.assertEqual(statuses[-1], "done")
+
+    def test_streamed_items_not_written_per_item(self):
+        """Test that streamed items reach followers without a store write each"""
+        store = session_store.get_session_store()
+        puts = []
+        original_put = store.put
+
+        def counting_put(job_id, job):
+            puts.append(len(job["data"]))
+            original_put(job_id, job)
+
+        async def streaming_extract(image, on_item):
+            for index in range(50):
+                on_item({"Ingredient": f"Item {index}"})
+                await asyncio.sleep(0)
+            return [{"Ingredient": f"Item {index}"} for index in range(50)], {"success": True, "error": None}
+
+        async def run():
+            queue = JobQueue(workers=1, progress_interval=60)
+            try:
+                job_id = await queue.submit(memoryview(b"image"), "a.jpg", "vlm")
+                seen = [len(job["data"]) async for job in queue.follow(job_id)]
+                return seen, await queue.get(job_id)
+            finally:
+                await queue.stop()
+
+        with mock.patch.object(store, "put", counting_put), \
+                mock.patch.object(jobs, "extract_receipt_vlm", streaming_extract):
+            seen, job = asyncio.run(run())
+
+        self.assertEqual(len(job["data"]), 50)
+        self.assertGreater(len(seen), 2)
+        self.assertEqual(seen[-1], 50)
+        # queued, running, one throttled progress write and the final one
+        self.assertLessEqual(len(puts), 4)
+        self.assertEqual(puts[-1], 50, puts)
+
+    def test_submit_batch(self):
+        """Test that a batch is one job with per-receipt results"""
+        async def run():
+            queue = JobQueue(workers=1)
+            try:
+                job_id = await queue.submit_batch([("a.jpg", b"one"), ("b.jpg", b"two")], "vlm")
+                return await queue.wait(job_id, timeout=5)
+            finally:
+                await queue.stop()
+
+        job = asyncio.run(run())
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(job["filename"], "a.jpg, b.jpg")
+        self.assertEqual(job["progress"], {"done": 2, "total": 2})
+        self.assertEqual([r["filename"] for r in job["metadata"]["receipts"]], ["a.jpg", "b.jpg"])
+        self.assertFalse(job["metadata"]["success"])
+
+    def test_queue_full(self):
+        """Test that submissions beyond max_queue are rejected"""
+        async def run():
+            queue = JobQueue(workers=0, max_queue=1)
+            try:
+                # No workers, so the first job stays queued
+                await queue.submit(b"one", "1.jpg")
+                with self.assertRaises(QueueFullError):
+                    await queue.submit(b"two", "2.jpg")
+                return queue.stats()
+            finally:
+                await queue.stop()
+
+        stats = asyncio.run(run())
+        self.assertEqual(stats["rejected"], 1)
+
+    def test_batch_counts_against_queue(self):
+        """Test that a running batch's receipts take room in the queue"""
+        release = None
+
+        async def slow_batch(receipts, method, ocr_executor=None, on_result=None):
+            await release.wait()
+            results = [{"filename": name, "items": [], "metadata": {"success": False}} for name, _ in receipts]
+            for result in results:
+                on_result(result)
+            return results
+
+        async def run():
+            nonlocal release
+            release = asyncio.Event()
+            queue = JobQueue(workers=0, max_queue=3)
+            try:
+                batch_id = await queue.submit_batch([("a.jpg", b"one"), ("b.jpg", b"two")])
+                with self.assertRaises(QueueFullError):
+                    await queue.submit_batch([("c.jpg", b"three"), ("d.jpg", b"four")])
+                await queue.submit(b"five", "e.jpg")
+                with self.assertRaises(QueueFullError):
+                    await queue.submit(b"six", "f.jpg")
+                busy = queue.stats()
+
+                release.set()
+                await queue.wait(batch_id, timeout=5)
+                await queue.submit_batch([("g.jpg", b"seven")])
+                return busy, queue.stats()
+            finally:
+                await queue.stop()
+
+        with mock.patch.object(jobs, "process_batch", slow_batch):
+            busy, stats = asyncio.run(run())
+        self.assertEqual((busy["batch_receipts"], busy["queue_length"], busy["rejected"]), (2, 1, 2))
+        self.assertEqual(stats["rejected"], 2)
+
+    def test_warm_ocr_pool(self):
+        """Test that warming starts every OCR worker process, outside this process"""
+        async def run():
+            queue = JobQueue(ocr_processes=2)
+            try:
+                with mock.patch.object(jobs, "warm_ocr_worker", report_pid):
+                    return await queue.warm_ocr_pool(), queue._process_pool
+            finally:
+                await queue.stop()
+
+        warmed, pool = asyncio.run(run())
+        self.assertEqual(warmed, 2)
+        self.assertIsNotNone(pool)
+        self.assertNotIn("easyocr", sys.modules)
+
+if __name__ == '__main__':
+    unittest.main()
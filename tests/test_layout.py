@@ -0,0 +1,67 @@
+import time
+import unittest
+
+from app.agent.layout import group_rows, single_rows
+from app.agent.parser import parse_receipt_lines
+
+def box(text, left, top, right, bottom, confidence=0.9):
+    return {
+        "text": text,
+        "confidence": confidence,
+        "bbox": [[left, top], [right, top], [right, bottom], [left, bottom]]
+    }
+
+class TestLayout(unittest.TestCase):
+
+    def test_name_and_price_share_a_row(self):
+        """Test that boxes on one printed row are joined left to right"""
+        detections = [
+            box("1.20", 400, 102, 460, 122, confidence=0.8),
+            box("WHOLE MILK 2PT", 20, 100, 250, 120),
+            box("0.85", 402, 141, 460, 160),
+            box("BREAD", 20, 140, 110, 160),
+        ]
+        rows = group_rows(detections)
+
+        self.assertEqual([row["text"] for row in rows], ["WHOLE MILK 2PT 1.20", "BREAD 0.85"])
+        self.assertAlmostEqual(rows[0]["confidence"], 0.85)
+        self.assertEqual(rows[0]["min_confidence"], 0.8)
+        self.assertEqual(rows[0]["bbox"], [20.0, 100.0, 460.0, 122.0])
+        self.assertEqual(rows[0]["boxes"], 2)
+        self.assertEqual(rows[0]["spans"], [["WHOLE MILK 2PT", 20.0, 250.0], ["1.20", 400.0, 460.0]])
+
+        # The joined rows now parse as items
+        items = parse_receipt_lines([row["text"] for row in rows])
+        self.assertEqual([item["Price"] for item in items], ["1.20", "0.85"])
+
+    def test_empty(self):
+        """Test that no detections give no rows"""
+        self.assertEqual(group_rows([]), [])
+        self.assertEqual(single_rows([]), [])
+
+    def test_single_rows(self):
+        """Test that unmerged boxes come out top to bottom in the row format"""
+        rows = single_rows([box("1.20", 400, 102, 460, 122, confidence=0.8), box("WHOLE MILK", 20, 100, 250, 120)])
+        self.assertEqual([row["text"] for row in rows], ["WHOLE MILK", "1.20"])
+        self.assertEqual(rows[1], {"text": "1.20", "confidence": 0.8, "min_confidence": 0.8,
+                                   "bbox": [400.0, 102.0, 460.0, 122.0], "boxes": 1,
+                                   "spans": [["1.20", 400.0, 460.0]]})
+
+    def test_many_detections(self):
+        """Test row grouping on a long receipt with hundreds of boxes"""
+        detections = []
+        for row in range(300):
+            top = row * 30
+            detections.append(box(f"0.{row % 90 + 10}", 400, top + 1, 460, top + 21))
+            detections.append(box(f"ITEM {row}", 20, top, 200, top + 20))
+
+        start = time.perf_counter()
+        rows = group_rows(detections)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(len(rows), 300)
+        self.assertEqual(rows[5]["text"], "ITEM 5 0.15")
+        self.assertLess(elapsed, 0.5)
+
+if __name__ == '__main__':
+    unittest.main()
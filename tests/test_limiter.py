@@ -0,0 +1,97 @@
+import asyncio
+import time
+import unittest
+
+from app.agent.limiter import AdaptiveLimiter
+
+class TestAdaptiveLimiter(unittest.TestCase):
+
+    def test_additive_increase(self):
+        """Test that the limit grows while fast calls keep it full"""
+        async def run():
+            limiter = AdaptiveLimiter(initial=2, max_limit=4)
+            for _ in range(20):
+                await limiter.acquire()
+                await limiter.acquire()
+                limiter.release("ok", 0.1)
+                limiter.release("ok", 0.1)
+            return limiter
+
+        limiter = asyncio.run(run())
+        self.assertGreater(limiter.limit, 3)
+        self.assertLessEqual(limiter.limit, 4)
+
+    def test_throttle_halves_once_per_window(self):
+        """Test that a burst of 429s cuts the limit once"""
+        async def run():
+            limiter = AdaptiveLimiter(initial=8, max_limit=8)
+            for _ in range(4):
+                await limiter.acquire()
+            for _ in range(4):
+                limiter.release("throttled")
+            return limiter
+
+        limiter = asyncio.run(run())
+        self.assertEqual(limiter.limit, 4)
+        self.assertEqual(limiter.stats()["decreases"], 1)
+
+    def test_slow_calls_back_off(self):
+        """Test that latency well above the baseline cuts the limit"""
+        async def run():
+            limiter = AdaptiveLimiter(initial=8, latency_tolerance=2.0)
+            await limiter.acquire()
+            limiter.release("ok", 0.1)
+            for _ in range(10):
+                await limiter.acquire()
+                limiter.release("ok", 2.0)
+            return limiter
+
+        limiter = asyncio.run(run())
+        self.assertLess(limiter.limit, 8)
+        self.assertGreater(limiter.stats()["slow"], 0)
+
+    def test_retry_after_pauses_callers(self):
+        """Test that waiters are held until Retry-After passes, then served in order"""
+        async def run():
+            limiter = AdaptiveLimiter(initial=2, max_limit=2)
+            order = []
+            await limiter.acquire()
+            limiter.release("throttled", retry_after=0.1)
+            start = time.monotonic()
+
+            async def call(name: str):
+                await limiter.acquire()
+                order.append((name, time.monotonic() - start))
+                limiter.release("ok", 0.01)
+
+            await asyncio.gather(call("a"), call("b"), call("c"))
+            return order
+
+        order = asyncio.run(run())
+        self.assertEqual([name for name, _ in order], ["a", "b", "c"])
+        self.assertGreaterEqual(order[0][1], 0.09)
+
+    def test_limit_caps_concurrency(self):
+        """Test that no more than limit calls run at once"""
+        async def run():
+            limiter = AdaptiveLimiter(initial=3, max_limit=3)
+            running = peak = 0
+
+            async def call():
+                nonlocal running, peak
+                await limiter.acquire()
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+                limiter.release("ok", 0.01)
+
+            await asyncio.gather(*(call() for _ in range(12)))
+            return peak, limiter
+
+        peak, limiter = asyncio.run(run())
+        self.assertEqual(peak, 3)
+        self.assertEqual(limiter.in_flight, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import time
+import unittest
+from types import SimpleNamespace
+
+from app.agent import metrics
+from app.agent.metrics import Registry, observe_timings, record_usage, stage
+
+class TestMetrics(unittest.TestCase):
+
+    def test_histogram_format(self):
+        """Test cumulative buckets, sum and count in the text format"""
+        registry = Registry()
+        histogram = registry.histogram("test_seconds", "Test latency", buckets=(0.01, 1.0), labels=("stage",))
+        histogram.observe(0.005, "ocr")
+        histogram.observe(0.5, "ocr")
+        histogram.observe(3.0, "ocr")
+
+        text = registry.render()
+        self.assertIn("# TYPE test_seconds histogram", text)
+        self.assertIn('test_seconds_bucket{stage="ocr",le="0.01"} 1', text)
+        self.assertIn('test_seconds_bucket{stage="ocr",le="1"} 2', text)
+        self.assertIn('test_seconds_bucket{stage="ocr",le="+Inf"} 3', text)
+        self.assertIn('test_seconds_sum{stage="ocr"} 3.505', text)
+        self.assertIn('test_seconds_count{stage="ocr"} 3', text)
+
+    def test_collectors(self):
+        """Test scrape-time values, label escaping and a failing collector"""
+        registry = Registry()
+        registry.add_collector("queue", lambda: [("queue_length", "gauge", "Waiting", [({"name": 'a"b'}, 4)])])
+        registry.add_collector("broken", lambda: 1 / 0)
+        text = registry.render()
+        self.assertIn("# TYPE queue_length gauge", text)
+        self.assertIn('queue_length{name="a\\"b"} 4', text)
+
+    def test_stage_errors(self):
+        """Test that a stage is timed even when it raises, and the error counted"""
+        before = metrics.STAGE_SECONDS.count("test_stage")
+        errors = metrics.STAGE_ERRORS.value("test_stage")
+        with self.assertRaises(ValueError):
+            with stage("test_stage"):
+                raise ValueError("boom")
+        self.assertEqual(metrics.STAGE_SECONDS.count("test_stage"), before + 1)
+        self.assertEqual(metrics.STAGE_ERRORS.value("test_stage"), errors + 1)
+
+    def test_worker_timings_and_usage(self):
+        """Test recording timings from job metadata and token usage"""
+        before = metrics.STAGE_SECONDS.count("parse")
+        observe_timings({"parse": 0.002, "infer": "n/a", "run": 1.0})
+        self.assertEqual(metrics.STAGE_SECONDS.count("parse"), before + 1)
+
+        prompt = metrics.VLM_TOKENS.value("prompt")
+        record_usage(SimpleNamespace(prompt_tokens=800, completion_tokens=120))
+        record_usage(None)
+        self.assertEqual(metrics.VLM_TOKENS.value("prompt"), prompt + 800)
+
+    def test_overhead(self):
+        """Test that an observation costs microseconds"""
+        histogram = Registry().histogram("overhead_seconds", "Overhead", labels=("stage",))
+        start = time.perf_counter()
+        for i in range(100000):
+            histogram.observe(i * 1e-5, "ocr")
+        self.assertLess(time.perf_counter() - start, 0.5)
+
+if __name__ == '__main__':
+    unittest.main()
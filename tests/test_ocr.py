@@ -0,0 +1,103 @@
+import os
+import sys
+import threading
+import time
+import types
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from app.agent import ocr
+
+class FakeReader:
+    """Stands in for easyocr.Reader; loading is slow and readtext tracks overlapping calls"""
+
+    created = []
+
+    def __init__(self, languages, gpu=False):
+        time.sleep(0.05)
+        self.languages = languages
+        self.active = 0
+        self.max_active = 0
+        self._count_lock = threading.Lock()
+        FakeReader.created.append(tuple(languages))
+
+    def readtext(self, image):
+        with self._count_lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.01)
+        with self._count_lock:
+            self.active -= 1
+        return [([[0, 0], [10, 0], [10, 5], [0, 5]], "Milk 1.20", 0.9)]
+
+class TestReaderRegistry(unittest.TestCase):
+
+    def setUp(self):
+        FakeReader.created = []
+        ocr.clear_readers()
+        fake_easyocr = types.SimpleNamespace(Reader=FakeReader)
+        patcher = mock.patch.dict(sys.modules, {"easyocr": fake_easyocr})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(ocr.clear_readers)
+
+    def test_reader_reused_per_language_set(self):
+        """Test that one reader is built per language set, whatever the order"""
+        with mock.patch.dict(os.environ, {"OCR_LANGUAGES": "en"}):
+            default = ocr.get_reader()
+        self.assertIs(ocr.get_reader(["en"]), default)
+
+        both = ocr.get_reader(["fr", "en"])
+        self.assertIs(ocr.get_reader(["en", "fr", "en"]), both)
+        self.assertIsNot(both, default)
+        self.assertEqual(FakeReader.created, [("en",), ("en", "fr")])
+
+    def test_concurrent_first_use_loads_once(self):
+        """Test that threads asking for a new language set at once share one load"""
+        readers = []
+        threads = [threading.Thread(target=lambda: readers.append(ocr.get_reader(["de"])))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(FakeReader.created, [("de",)])
+        self.assertTrue(all(reader is readers[0] for reader in readers))
+
+    def test_readtext_serialised_per_reader(self):
+        """Test that calls on a shared reader never overlap"""
+        image = np.zeros((5, 10, 3), dtype=np.uint8)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(ocr.read_text_lines(image, ["en"])))
+                   for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), 6)
+        self.assertEqual(results[0][0]["text"], "Milk 1.20")
+        self.assertEqual(ocr.get_reader(["en"]).max_active, 1)
+
+    def test_bbox_format_same_unmerged(self):
+        """Test that rows carry [left, top, right, bottom] boxes whether merged or not"""
+        image = np.zeros((5, 10, 3), dtype=np.uint8)
+        merged = ocr.read_text_lines(image, ["en"])
+        single = ocr.read_text_lines(image, ["en"], merge_rows=False)
+        self.assertEqual(merged[0]["bbox"], [0.0, 0.0, 10.0, 5.0])
+        self.assertEqual(single, merged)
+
+    def test_warm_and_clear(self):
+        """Test that warming loads each set once and clearing drops them"""
+        self.assertEqual(sorted(ocr.warm_readers([["en"], ["fr", "en"], ["en"]])), [("en",), ("en", "fr")])
+        self.assertEqual(len(FakeReader.created), 2)
+
+        ocr.clear_readers()
+        ocr.get_reader(["en"])
+        self.assertEqual(len(FakeReader.created), 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import os
+import tempfile
+import time
+import unittest
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from app.services.outbox import SheetsOutbox
+
+def http_error(status: int, reason: str = "") -> HttpError:
+    return HttpError(httplib2.Response({"status": status}), reason.encode(), uri="fake")
+
+class TestSheetsOutbox(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.calls = []
+        self.errors = []
+
+        def append(values):
+            if self.errors:
+                raise self.errors.pop(0)
+            self.calls.append(values)
+            return len(values)
+
+        self.outbox = SheetsOutbox(os.path.join(self.tmp.name, "outbox.sqlite3"), append=append,
+                                   base_delay=0, max_delay=0)
+
+    def tearDown(self):
+        self.outbox.stop()
+        self.tmp.cleanup()
+
+    def test_batches_many_submissions(self):
+        """Test that rows from several submissions go out in one append"""
+        self.outbox.enqueue([{"Ingredient": "Milk", "Price": "1.20"}], "a.jpg")
+        self.outbox.enqueue([{"Ingredient": "Bread"}, {"Ingredient": "Eggs"}], "b.jpg")
+        self.assertEqual(self.outbox.depth(), 3)
+
+        self.assertEqual(self.outbox.flush(), 3)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual([row[1] for row in self.calls[0]], ["Milk", "Bread", "Eggs"])
+        self.assertEqual(self.outbox.depth(), 0)
+
+    def test_retries_quota_errors(self):
+        """Test that rate-limited batches stay queued and are retried"""
+        self.errors = [http_error(429, "Quota exceeded")]
+        self.outbox.enqueue([{"Ingredient": "Milk"}])
+
+        self.assertEqual(self.outbox.flush_once(), 0)
+        self.assertEqual(self.outbox.depth(), 1)
+        self.assertEqual(self.outbox.flush(), 1)
+        self.assertEqual(self.outbox.stats()["retries"], 1)
+
+    def test_hard_errors_dead_letter(self):
+        """Test that rejected batches move to the dead-letter table"""
+        self.errors = [http_error(400, "Invalid value")]
+        self.outbox.enqueue([{"Ingredient": "Milk"}])
+
+        self.outbox.flush()
+        stats = self.outbox.stats()
+        self.assertEqual(stats["depth"], 0)
+        self.assertEqual(stats["dead_letter"], 1)
+
+    def test_bad_row_dead_lettered_alone(self):
+        """Test that one rejected row doesn't take the rest of its batch with it"""
+        def append(values):
+            if any(row[1] == "Bad" for row in values):
+                raise http_error(400, "Invalid value")
+            self.calls.append(values)
+            return len(values)
+
+        self.outbox.append = append
+        self.outbox.enqueue([{"Ingredient": name} for name in ["Milk", "Bread", "Bad", "Eggs", "Tea"]])
+
+        self.assertEqual(self.outbox.flush(), 4)
+        self.assertEqual([row[1] for values in self.calls for row in values], ["Milk", "Bread", "Eggs", "Tea"])
+        stats = self.outbox.stats()
+        self.assertEqual((stats["depth"], stats["dead_letter"], stats["failed_rows"]), (0, 1, 1))
+
+    def test_retry_during_bisect_keeps_rows(self):
+        """Test that a transient error while bisecting leaves the unsent rows queued"""
+        self.errors = [http_error(400, "Invalid value"), http_error(429, "Quota exceeded")]
+        self.outbox.enqueue([{"Ingredient": "Milk"}, {"Ingredient": "Bread"}])
+
+        self.assertEqual(self.outbox.flush_once(), 0)
+        self.assertEqual(self.outbox.depth(), 2)
+        self.assertEqual(self.outbox.flush(), 2)
+        self.assertEqual(self.outbox.stats()["dead_letter"], 0)
+
+    def test_errors_failing_every_row_pause(self):
+        """Test that auth, permission, config and credential errors keep the rows queued"""
+        for index, error in enumerate([Exception("Failed to load credentials: no such file"), http_error(401, "Unauthorized"),
+                      http_error(403, "The caller does not have permission"),
+                      http_error(404, "Requested entity was not found"), http_error(400, "Unable to parse range")]):
+            outbox = SheetsOutbox(os.path.join(self.tmp.name, f"paused-{index}.sqlite3"), append=self.outbox.append,
+                                  batch_size=50)
+            outbox.backoff_delay = lambda attempts: 0.05
+            self.errors = [error]
+            outbox.enqueue([{"Ingredient": f"Item {i}"} for i in range(200)])
+
+            self.assertEqual(outbox.flush(), 0)
+            stats = outbox.stats()
+            self.assertEqual((stats["depth"], stats["dead_letter"], stats["pauses"]), (200, 0, 1), error)
+            self.assertGreater(stats["paused_for"], 0)
+            # Paused: nothing is claimed or sent until the backoff runs out
+            self.assertEqual(outbox.flush_once(), 0)
+            self.assertEqual(self.calls, [])
+
+            time.sleep(0.06)
+            self.assertEqual(outbox.flush(), 200)
+            self.calls.clear()
+
+    def test_requeue_failed(self):
+        """Test that dead-lettered rows can be sent again"""
+        self.errors = [http_error(400, "Invalid value"), http_error(400, "Invalid value")]
+        self.outbox.enqueue([{"Ingredient": "Milk"}])
+        self.outbox.flush()
+        self.outbox.enqueue([{"Ingredient": "Bread"}])
+        self.outbox.flush()
+        self.assertEqual(self.outbox.stats()["dead_letter"], 2)
+
+        self.assertEqual(self.outbox.requeue_failed([1]), 1)
+        self.assertEqual(self.outbox.flush(), 1)
+        self.assertEqual(self.outbox.requeue_failed(), 1)
+        self.assertEqual(self.outbox.flush(), 1)
+        self.assertEqual([values[0][1] for values in self.calls], ["Milk", "Bread"])
+        self.assertEqual(self.outbox.stats()["dead_letter"], 0)
+
+    def test_rows_survive_restart(self):
+        """Test that queued rows persist across outbox instances"""
+        self.outbox.enqueue([{"Ingredient": "Milk"}])
+        reopened = SheetsOutbox(self.outbox.db_path, append=lambda values: len(values))
+        self.assertEqual(reopened.depth(), 1)
+        self.assertEqual(reopened.flush(), 1)
+
+    def test_background_flusher(self):
+        """Test that the flusher thread sends rows after enqueue"""
+        self.outbox.start()
+        self.outbox.enqueue([{"Ingredient": "Milk"}])
+        self.outbox.stop()
+        self.assertEqual(self.outbox.depth(), 0)
+        self.assertEqual(len(self.calls), 1)
+
+if __name__ == '__main__':
+    unittest.main()
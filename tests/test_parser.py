@@ -1,5 +1,8 @@
 import unittest
-from app.agent.parser import parse_receipt_lines, extract_item_from_line, clean_item_name
+from app.agent.parser import (
+    parse_receipt_lines, parse_receipts, extract_item_from_line, extract_quantity, clean_item_name,
+    is_header_footer, split_price
+)
 
 class TestParser(unittest.TestCase):
     
@@ -54,5 +57,38 @@ class TestParser(unittest.TestCase):
         self.assertEqual(result[0]['Ingredient'], "Whole Milk")
         self.assertEqual(result[1]['Price'], "3.20")
 
+    def test_header_footer_keywords(self):
+        """Test that the combined keyword pattern matches anywhere, any case"""
+        self.assertTrue(is_header_footer("CASHIER: Sam"))
+        self.assertTrue(is_header_footer("Visa Card ****1234"))
+        self.assertTrue(is_header_footer("Thank You for shopping"))
+        self.assertFalse(is_header_footer("Whole Milk 2.40"))
+
+    def test_split_price(self):
+        """Test splitting the trailing price, with and without currency"""
+        self.assertEqual(split_price("Milk $1.99"), ("Milk ", "1.99"))
+        self.assertEqual(split_price("Milk £1.99"), ("Milk ", "1.99"))
+        self.assertEqual(split_price("Cheddar 12.345.67"), ("Cheddar 12.", "345.67"))
+        self.assertIsNone(split_price("Milk 1.9"))
+        self.assertIsNone(split_price("Milk .99"))
+
+    def test_parse_receipts_batch(self):
+        """Test that the batch API matches parsing receipts one at a time"""
+        receipts = [
+            ["GROCERY STORE", "Whole Milk 2.40", "Total: 2.40"],
+            ["Whole Milk 2.40", "2 x Bread 3.20", "Organic Eggs 6 pack £1.99"],
+            [],
+        ]
+        batch = parse_receipts(receipts, date="2025-06-29", memo_size=2)
+        self.assertEqual(batch, [parse_receipt_lines(lines, "2025-06-29") for lines in receipts])
+        self.assertEqual([item['Ingredient'] for item in batch[1]], ["Whole Milk", "Bread", "Eggs"])
+
+    def test_quantity_priority(self):
+        """Test that a count beats a unit and a unit beats a pack size, wherever they sit"""
+        self.assertEqual(extract_quantity("Cheese 200g 2 x"), "2 x")
+        self.assertEqual(extract_quantity("Beer 6 pack 500ML"), "500ML")
+        self.assertEqual(extract_quantity("Eggs 12 Pack 2 bags"), "12 Pack")
+        self.assertEqual(extract_quantity("Bread"), "1")
+
 if __name__ == '__main__':
     unittest.main()
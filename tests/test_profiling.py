@@ -0,0 +1,186 @@
+import asyncio
+import inspect
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from jinja2 import Environment, FileSystemLoader
+
+from app.agent import pipeline
+from app.services import profiling
+from app.services.profiling import Profiler, collapse_stack, instrument, is_admin, uninstrument
+
+def busy(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+class FakeRequest:
+    def __init__(self, path: str = "/upload", headers=None, query=None):
+        self.method = "POST"
+        self.url = mock.Mock(path=path)
+        self.headers = {name.lower(): value for name, value in (headers or {}).items()}
+        self.query_params = query or {}
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self):
+        self.headers = {}
+
+async def call_next(request):
+    return FakeResponse()
+
+class FakeQueue:
+    def __init__(self):
+        self.jobs = {}
+
+    async def submit(self, job_id: str) -> str:
+        self.jobs[job_id] = {"metadata": {}}
+        return job_id
+
+    async def _run(self, job_id: str):
+        busy(0.02)
+        self.jobs[job_id]["metadata"]["timings"] = {"run": 0.02}
+
+    async def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        profiling._profiler = Profiler(enabled=True, interval=0.001)
+
+    def tearDown(self):
+        profiling._profiler = None
+
+    def test_spans_only_when_profiling(self):
+        """Test that wrapped functions record spans only inside a profile"""
+        traced = profiling._span_wrapper(busy, "busy")
+        traced(0)
+        profiler = profiling.get_profiler()
+        profile = profiler.start("POST", "/upload", "req-1")
+        token = profiling._current_profile.set(profile)
+        try:
+            traced(0.03)
+        finally:
+            profiling._current_profile.reset(token)
+        profiler.end_request(profile, 200)
+
+        self.assertEqual([span["name"] for span in profile.spans], ["busy"])
+        self.assertTrue(profile.summary()["finished"])
+        self.assertGreater(profile.samples, 0)
+        self.assertIn("busy (test_profiling.py", profile.folded())
+        self.assertEqual(profiler.recent()[0]["label"], "req-1")
+        self.assertIs(profiler.get(profile.profile_id), profile)
+
+    def test_job_keeps_profile_open(self):
+        """Test that a queued job is linked to the request that submitted it"""
+        queue = FakeQueue()
+        submit = profiling._submit_wrapper(FakeQueue.submit, "JobQueue.submit")
+        run = profiling._run_wrapper(FakeQueue._run, "JobQueue._run")
+        profiler = profiling.get_profiler()
+
+        async def scenario():
+            profile = profiler.start("POST", "/upload")
+            token = profiling._current_profile.set(profile)
+            try:
+                job_id = await submit(queue, "job-1")
+            finally:
+                profiling._current_profile.reset(token)
+            profiler.end_request(profile, 303)
+            self.assertFalse(profile.summary()["finished"])
+            await run(queue, job_id)
+            return profile
+
+        profile = asyncio.run(scenario())
+        self.assertTrue(profile.summary()["finished"])
+        self.assertEqual(profile.jobs, ["job-1"])
+        self.assertEqual(profile.timings["job-1"], {"run": 0.02})
+        self.assertEqual([span["name"] for span in profile.spans], ["JobQueue.submit", "JobQueue._run"])
+
+    def test_sample_rate(self):
+        """Test which requests are profiled"""
+        self.assertTrue(Profiler(enabled=True).wants("/upload/batch", forced=True))
+        self.assertFalse(Profiler(enabled=True).wants("/upload", forced=False))
+        self.assertFalse(Profiler(enabled=True, sample_rate=1).wants("/history", forced=True))
+        self.assertFalse(Profiler(enabled=False, sample_rate=1).wants("/submit", forced=True))
+        self.assertTrue(Profiler(enabled=True, sample_rate=1).wants("/submit", forced=False))
+
+    def test_client_request_id_is_only_a_label(self):
+        """Test that profiles are stored under a generated id, never the client's"""
+        with tempfile.TemporaryDirectory() as directory, \
+                mock.patch.dict(os.environ, {"ADMIN_TOKEN": "secret"}):
+            profiling._profiler = Profiler(enabled=True, interval=0.001, output_dir=directory)
+            request = FakeRequest(headers={"X-Profile": "1", "X-Admin-Token": "secret",
+                                           "X-Request-ID": "../../escape"})
+            response = asyncio.run(profiling.profiling_middleware(request, call_next))
+            profile_id = response.headers["X-Profile-ID"]
+            profile = profiling.get_profiler().get(profile_id)
+
+            self.assertEqual(profile.label, "../../escape")
+            self.assertNotIn("/", profile_id)
+            self.assertIsNone(profiling.get_profiler().get("../../escape"))
+            deadline = time.monotonic() + 2
+            while len(os.listdir(directory)) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(sorted(os.listdir(directory)), [f"{profile_id}.folded", f"{profile_id}.json"])
+
+    def test_force_flag_needs_admin(self):
+        """Test that X-Profile is ignored without the admin token"""
+        profiler = profiling.get_profiler()
+        with mock.patch.dict(os.environ, {"ADMIN_TOKEN": "secret"}):
+            for headers in ({"X-Profile": "1"}, {"X-Profile": "1", "X-Admin-Token": "wrong"}):
+                response = asyncio.run(profiling.profiling_middleware(FakeRequest(headers=headers), call_next))
+                self.assertNotIn("X-Profile-ID", response.headers)
+        self.assertEqual(profiler.recent(), [])
+
+    def test_admin_closed_without_token(self):
+        """Test that admin access is refused while ADMIN_TOKEN is unset"""
+        with mock.patch.dict(os.environ, {}, clear=True):
+            self.assertFalse(is_admin(FakeRequest(headers={"X-Admin-Token": ""})))
+            self.assertFalse(is_admin(FakeRequest(query={"token": "anything"})))
+        with mock.patch.dict(os.environ, {"ADMIN_TOKEN": "secret"}):
+            self.assertTrue(is_admin(FakeRequest(headers={"X-Admin-Token": "secret"})))
+            self.assertTrue(is_admin(FakeRequest(query={"token": "secret"})))
+            self.assertFalse(is_admin(FakeRequest(query={"token": "secre"})))
+
+    def test_instrument_keeps_signatures(self):
+        """Test that instrumenting wraps in place and can be undone"""
+        original = pipeline.parse_receipt_items
+        signature = inspect.signature(original)
+        instrument()
+        try:
+            self.assertIsNot(pipeline.parse_receipt_items, original)
+            self.assertEqual(inspect.signature(pipeline.parse_receipt_items), signature)
+        finally:
+            uninstrument()
+        self.assertIs(pipeline.parse_receipt_items, original)
+
+    def test_collapse_stack(self):
+        """Test folded stacks list the outermost frame first"""
+        def inner():
+            return collapse_stack(inspect.currentframe())
+        stack = inner().split(";")
+        self.assertTrue(stack[-1].startswith("inner (test_profiling.py"))
+        self.assertTrue(stack[-2].startswith("test_collapse_stack"))
+
+    def test_profiles_template(self):
+        """Test that the admin page renders profile summaries"""
+        profiler = profiling.get_profiler()
+        profile = profiler.start("POST", "/submit", "req-3")
+        with profile.span("HistoryStore.add"):
+            pass
+        profiler.end_request(profile, 303)
+
+        env = Environment(loader=FileSystemLoader("app/templates"))
+        html = env.get_template("profiles.html").render(
+            request=None, profiles=profiler.recent(), stats=profiler.stats(), token_query="")
+        self.assertIn(f"/api/profiles/{profile.profile_id}/flame", html)
+        self.assertIn(">req-3<", html)
+        self.assertIn("HistoryStore.add", html)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import asyncio
+import os
+import unittest
+from unittest import mock
+
+from app.agent import pipeline, routing
+from app.agent.routing import find_receipt_total, score_local_result
+
+def detections(*texts, confidence=0.9):
+    return [{"text": text, "confidence": confidence} for text in texts]
+
+ITEMS = [
+    {"Ingredient": "Milk", "Price": "1.20"},
+    {"Ingredient": "Bread", "Price": "0.85"},
+]
+
+class TestScoring(unittest.TestCase):
+
+    def test_find_total(self):
+        """Test that the total is found and subtotals are ignored"""
+        lines = ["MILK 1.20", "SUBTOTAL 2.05", "TOTAL £2.05", "CASH 5.00"]
+        self.assertEqual(find_receipt_total(lines), 2.05)
+        self.assertIsNone(find_receipt_total(["MILK 1.20"]))
+
+    def test_clean_receipt_scores_high(self):
+        """Test that confident, fully parsed receipts matching the total score high"""
+        lines = detections("TESCO", "MILK 1.20", "BREAD 0.85", "TOTAL 2.05")
+        result = score_local_result(lines, ITEMS)
+        self.assertEqual(result["total_match"], 1.0)
+        self.assertEqual(result["parse_coverage"], 1.0)
+        self.assertGreaterEqual(result["score"], 0.75)
+
+    def test_mismatched_total_scores_low(self):
+        """Test that missed lines and a wrong sum pull the score down"""
+        lines = detections("MILK 1.20", "BREAD 0.85", "EGGS 2.10 A", "TOTAL 4.15", confidence=0.6)
+        result = score_local_result(lines, ITEMS)
+        self.assertEqual(result["total_match"], 0.0)
+        self.assertLess(result["score"], 0.75)
+
+    def test_no_items(self):
+        """Test that an empty parse scores zero"""
+        self.assertEqual(score_local_result(detections("TOTAL 2.05"), [])["score"], 0.0)
+
+class TestAutoRouting(unittest.TestCase):
+
+    def setUp(self):
+        self.old_key = os.environ.pop("OPENAI_API_KEY", None)
+        routing._routing_stats = routing.RoutingStats()
+
+    def tearDown(self):
+        routing._routing_stats = None
+        if self.old_key is not None:
+            os.environ["OPENAI_API_KEY"] = self.old_key
+
+    def run_auto(self, score):
+        metadata = {"method": "ocr", "success": True, "error": None,
+                    "timings": {"ocr": 0.1}, "routing": {"score": score}}
+        with mock.patch.object(pipeline, "extract_receipt_local", return_value=(list(ITEMS), metadata)):
+            return asyncio.run(pipeline.extract_receipt_auto(b"image", filename="a.jpg"))
+
+    def test_confident_result_stays_local(self):
+        """Test that a high-scoring local result skips the VLM"""
+        items, metadata = self.run_auto(0.9)
+        self.assertEqual(items, ITEMS)
+        self.assertEqual(metadata["routing"]["decision"], "local")
+        stats = routing.get_routing_stats().stats()
+        self.assertEqual(stats["vlm_calls_saved"], 1)
+
+    def test_low_score_escalates(self):
+        """Test that a low score tries the VLM and keeps the local result if it fails"""
+        items, metadata = self.run_auto(0.2)
+        self.assertEqual(items, ITEMS)
+        self.assertEqual(metadata["routing"]["decision"], "local_fallback")
+        self.assertEqual(metadata["routing"]["escalation_error"], "OpenAI API key not configured")
+        self.assertEqual(routing.get_routing_stats().stats()["decisions"]["local_fallback"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import abc
+import os
+import tempfile
+import time
+import unittest
+
+from app.services.session_store import InMemorySessionStore, SQLiteSessionStore
+
+STATE = {"data": [{"Ingredient": "Milk"}], "metadata": {"method": "vlm"}, "filename": "a.jpg"}
+
+class SessionStoreTests(abc.ABC):
+    """Behaviour shared by every backend (mixed into a TestCase per backend)"""
+
+    @abc.abstractmethod
+    def make_store(self, **limits):
+        """A fresh store of the backend under test"""
+
+    def test_create_and_get(self):
+        """Test that sessions are isolated by id"""
+        store = self.make_store()
+        first = store.create(STATE)
+        second = store.create({**STATE, "filename": "b.jpg"})
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(store.get(first)["filename"], "a.jpg")
+        self.assertEqual(store.get(second)["filename"], "b.jpg")
+        self.assertIsNone(store.get("unknown"))
+
+    def test_ttl_expiry(self):
+        """Test that sessions disappear after their TTL"""
+        store = self.make_store(ttl_seconds=0.05)
+        session_id = store.create(STATE)
+        time.sleep(0.1)
+        self.assertIsNone(store.get(session_id))
+
+    def test_entry_limit_evicts_least_recent(self):
+        """Test LRU eviction when max_entries is exceeded"""
+        store = self.make_store(max_entries=2)
+        first = store.create(STATE)
+        second = store.create(STATE)
+        time.sleep(0.01)
+        store.get(first)
+        store.create(STATE)
+
+        self.assertIsNotNone(store.get(first))
+        self.assertIsNone(store.get(second))
+        self.assertEqual(store.stats()["evictions"], 1)
+
+    def test_delete(self):
+        """Test removing a finished session"""
+        store = self.make_store()
+        session_id = store.create(STATE)
+        store.delete(session_id)
+        self.assertIsNone(store.get(session_id))
+
+class TestInMemorySessionStore(SessionStoreTests, unittest.TestCase):
+
+    def make_store(self, **limits):
+        return InMemorySessionStore(**limits)
+
+    def test_byte_limit(self):
+        """Test eviction when the total size limit is exceeded"""
+        store = self.make_store(max_bytes=300)
+        ids = [store.create(STATE) for _ in range(5)]
+        self.assertIsNone(store.get(ids[0]))
+        self.assertIsNotNone(store.get(ids[-1]))
+        self.assertLessEqual(store.stats()["bytes"], 300)
+
+class TestSQLiteSessionStore(SessionStoreTests, unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def make_store(self, **limits):
+        return SQLiteSessionStore(os.path.join(self.tmp.name, "sessions.sqlite3"), **limits)
+
+    def test_shared_between_instances(self):
+        """Test that another worker's store sees the same sessions"""
+        session_id = self.make_store().create(STATE)
+        self.assertEqual(self.make_store().get(session_id), STATE)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import threading
+import unittest
+
+from google.auth.credentials import AnonymousCredentials
+
+from app.services import sheets
+from benchmarks.fakes import start_fake_sheets
+
+class TestSheetsClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = start_fake_sheets(record=True)
+        self.client = sheets.SheetsClient(credentials=AnonymousCredentials(), api_endpoint=f"{self.server.url}/")
+        sheets.set_sheets_client(self.client)
+        self.old_spreadsheet_id = sheets.SPREADSHEET_ID
+        sheets.SPREADSHEET_ID = "test-sheet"
+
+    def tearDown(self):
+        sheets.SPREADSHEET_ID = self.old_spreadsheet_id
+        sheets.set_sheets_client(None)
+        self.server.stop()
+
+    def test_append_to_sheet(self):
+        """Test appending rows through the shared client"""
+        items = [{"Date": "2025-06-29", "Ingredient": "Whole Milk", "Quantity": "2 PT", "Price": "2.40"}]
+        result = sheets.append_to_sheet(items, "test.jpg")
+
+        self.assertTrue(result["success"], result)
+        self.assertEqual(result["updated_rows"], 1)
+        path, body = self.server.received[0]
+        self.assertEqual(path, "/v4/spreadsheets/test-sheet/values/Sheet1!A:F:append")
+        self.assertEqual(body["values"], [["2025-06-29", "Whole Milk", "", "", "2.40", "2 PT"]])
+
+    def test_service_and_transport_reused(self):
+        """Test that repeated submits reuse one service and one connection"""
+        service = self.client.service()
+        for _ in range(3):
+            sheets.append_to_sheet([{"Ingredient": "Bread"}])
+
+        self.assertIs(self.client.service(), service)
+        self.assertEqual(self.server.stats()["rows"], 3)
+        self.assertEqual(len(self.server.clients), 1)
+
+    def test_service_per_thread(self):
+        """Test that each thread gets its own service object"""
+        services = []
+        thread = threading.Thread(target=lambda: services.append(self.client.service()))
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(services[0], self.client.service())
+
+    def test_create_headers_if_needed(self):
+        """Test header creation against the stand-in endpoint"""
+        self.assertEqual(sheets.create_headers_if_needed(), "Headers created")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import asyncio
+import subprocess
+import sys
+import unittest
+
+from app.services.warmup import Warmup
+from benchmarks.startup import DEFERRED_MODULES, parse_importtime
+
+class TestStartup(unittest.TestCase):
+
+    def test_heavy_dependencies_are_deferred(self):
+        """Test that importing the app doesn't load the SDKs or the OCR stack"""
+        code = ("import sys, app.main; "
+                f"print(','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))")
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "")
+
+    def test_parse_importtime(self):
+        """Test reading -X importtime output"""
+        modules = parse_importtime(
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   app.agent.parser\n"
+            "import time:      3000 |       3120 | app.main\n"
+        )
+        self.assertEqual(modules["app.main"], {"self": 0.003, "cumulative": 0.00312, "depth": 0})
+        self.assertEqual(modules["app.agent.parser"]["depth"], 1)
+
+    def test_warmup_phases(self):
+        """Test that warmup reports readiness, timings and failed phases"""
+        warmup = Warmup(["vlm", "nope"])
+        self.assertFalse(warmup.ready)
+        asyncio.run(warmup.run())
+        status = warmup.status()
+        self.assertTrue(status["ready"])
+        self.assertIn("vlm", status["seconds"])
+        self.assertEqual(status["errors"], {"nope": "unknown phase"})
+        self.assertTrue(Warmup([]).ready)
+
+if __name__ == '__main__':
+    unittest.main()
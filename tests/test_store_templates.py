@@ -0,0 +1,130 @@
+import os
+import tempfile
+import unittest
+
+from app.agent import pipeline, store_templates
+from app.agent.layout import group_rows
+from app.agent.parser import is_header_footer, parse_receipt_lines
+from app.agent.store_templates import TemplateStore, learn_from_submission, line_shape
+
+def box(text, left, top, right):
+    return {"text": text, "confidence": 0.9,
+            "bbox": [[left, top], [right, top], [right, top + 20], [left, top + 20]]}
+
+def corner_mart(date, points, milk="1.20"):
+    """OCR rows of a receipt whose VAT codes sit in their own column or after the price"""
+    return group_rows([
+        box("CORNER MART", 120, 0, 300),
+        box("12 HIGH STREET", 100, 30, 320),
+        box(date, 20, 60, 200),
+        box("WHOLE MILK 2PT", 20, 100, 250), box(milk, 400, 100, 460), box("A", 480, 100, 495),
+        box("BREAD", 20, 130, 110), box("0.85 A", 400, 130, 495),
+        box(f"POINTS EARNED {points}", 20, 160, 250), box("0.00", 400, 160, 460),
+        box("TOTAL", 20, 190, 110), box("2.05", 400, 190, 460),
+    ])
+
+def high_street(store, price="1.20"):
+    """OCR rows of a receipt whose address lines any store on the street could print"""
+    return group_rows([
+        box(store, 150, 0, 300),
+        box("LONDON ROAD", 120, 30, 320),
+        box("VAT REG GB 220430231", 80, 60, 360),
+        box("TEL 0345 677 9000", 100, 90, 340),
+        box("WHOLE MILK 2PT", 20, 130, 250), box(price, 400, 130, 460),
+        box("BREAD", 20, 160, 110), box("0.85", 400, 160, 460),
+    ])
+
+APPROVED = [
+    {"Ingredient": "Whole Milk", "Quantity": "2 PT", "Price": "1.20"},
+    {"Ingredient": "Bread", "Quantity": "1", "Price": "0.85"},
+]
+
+class TestStoreTemplates(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "stores.json")
+        store_templates._template_store = TemplateStore(self.path)
+
+    def tearDown(self):
+        store_templates._template_store = None
+        self.temp_dir.cleanup()
+
+    def test_shape(self):
+        """Test that numbers don't change a line's shape"""
+        self.assertEqual(line_shape("POINTS EARNED 120 0.00"), line_shape("Points earned 9 1.50"))
+
+    def test_learn_and_parse(self):
+        """Test that a learned template parses the store's next receipt"""
+        template = learn_from_submission({"rows": corner_mart("14/03/2025 10:32", 12)}, APPROVED)
+        self.assertEqual(template.store_id, "corner-mart")
+        self.assertEqual(set(template.markers), {"A"})
+        self.assertTrue(os.path.exists(self.path))
+
+        # The generic parser misses items with codes and takes the points line for one
+        rows = corner_mart("02/04/2025 18:05", 40, milk="1.25")
+        generic = parse_receipt_lines([row["text"] for row in rows])
+        self.assertEqual([item["Ingredient"] for item in generic], ["Points Earned 40"])
+
+        match = store_templates.get_template_store().identify(rows)
+        self.assertIsNotNone(match)
+        self.assertEqual(match[0].store_id, "corner-mart")
+
+        items = match[0].parse(rows, date="2025-04-02")
+        self.assertEqual([(item["Ingredient"], item["Price"]) for item in items],
+                         [("Whole Milk", "1.25"), ("Bread", "0.85")])
+        self.assertTrue(is_header_footer("POINTS EARNED 7 0.00", match[0]))
+        self.assertFalse(is_header_footer("BREAD 0.85", match[0]))
+
+    def test_unknown_store(self):
+        """Test that a different header isn't taken for a known store"""
+        learn_from_submission({"rows": corner_mart("14/03/2025 10:32", 12)}, APPROVED)
+        rows = group_rows([box("VALUE FOODS LTD", 100, 0, 300), box("EGGS", 20, 40, 100), box("2.10", 400, 40, 460)])
+        self.assertIsNone(store_templates.get_template_store().identify(rows))
+
+    def test_shared_address_words_dont_match(self):
+        """Test that two stores on the same road get their own templates"""
+        learn_from_submission({"rows": high_street("TESCO")}, APPROVED)
+        store = store_templates.get_template_store()
+        self.assertIsNone(store.identify(high_street("Sainsbury's")))
+
+        sainsburys = learn_from_submission({"rows": high_street("Sainsbury's")}, APPROVED)
+        self.assertEqual(sainsburys.store_id, "sainsbury")
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.get("tesco").receipts, 1)
+        self.assertEqual(store.identify(high_street("TESCO", "1.25"))[0].store_id, "tesco")
+        self.assertEqual(store.identify(high_street("Sainsbury's", "1.25"))[0].store_id, "sainsbury")
+
+    def test_templates_persist(self):
+        """Test that a fresh store (as in an OCR worker process) loads saved templates"""
+        learn_from_submission({"rows": corner_mart("14/03/2025 10:32", 12)}, APPROVED)
+        reloaded = TemplateStore(self.path)
+        self.assertEqual(reloaded.get("corner-mart").receipts, 1)
+
+    def test_concurrent_stores_keep_each_others_templates(self):
+        """Test that two processes' stores learning into one file don't overwrite each other"""
+        first, second = TemplateStore(self.path), TemplateStore(self.path)
+        first.learn_and_save(corner_mart("14/03/2025 10:32", 12), APPROVED)
+        # second loaded before the first save and never reloaded
+        second.learn_and_save(high_street("TESCO"), APPROVED)
+        second.learn_and_save(corner_mart("02/04/2025 18:05", 40), APPROVED)
+        first.learn_and_save(high_street("TESCO", "1.25"), APPROVED)
+
+        saved = TemplateStore(self.path)
+        self.assertEqual(sorted(saved._templates), ["corner-mart", "tesco"])
+        self.assertEqual(saved.get("corner-mart").receipts, 2)
+        self.assertEqual(saved.get("tesco").receipts, 2)
+
+    def test_pipeline_uses_template(self):
+        """Test that local parsing picks the store template and scores the result"""
+        learn_from_submission({"rows": corner_mart("14/03/2025 10:32", 12)}, APPROVED)
+        items, parsed = pipeline.parse_receipt_items(corner_mart("02/04/2025 18:05", 40))
+
+        self.assertEqual([item["Price"] for item in items], ["1.20", "0.85"])
+        self.assertEqual(parsed["routing"]["store"], "corner-mart")
+        self.assertEqual(parsed["routing"]["total_match"], 1.0)
+        self.assertEqual(parsed["routing"]["parse_coverage"], 1.0)
+        self.assertEqual(len(parsed["layout"]["rows"]), 7)
+
+if __name__ == '__main__':
+    unittest.main()
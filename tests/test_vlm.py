@@ -0,0 +1,326 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from app.agent import cache, pipeline, vlm
+from benchmarks.fakes import start_fake_openai
+
+ITEMS = [{"Date": "2025-06-29", "Ingredient": "Whole Milk", "Quantity": "2 PT", "Price": "2.40", "Notes": ""},
+         {"Date": "2025-06-29", "Ingredient": "White Bread", "Quantity": "800g", "Price": "1.10", "Notes": ""}]
+
+# Seconds the fake server takes per reply
+LATENCY = 0.2
+
+class TestAsyncVLM(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Streamed replies come in 7-character chunks, splitting items mid-object
+        cls.server = start_fake_openai(latency=LATENCY, retry_after=0.05, items=ITEMS, chunk_size=7)
+        # The SDK is imported on first use; keep that out of the timed tests
+        vlm.load_client_libraries()
+
+        cls.env = {
+            "OPENAI_API_KEY": "sk-test",
+            "OPENAI_BASE_URL": f"{cls.server.url}/v1",
+            "VLM_MAX_CONCURRENCY": "4",
+            "VLM_MAX_RETRIES": "0",
+        }
+        cls.old_env = {key: os.environ.get(key) for key in cls.env}
+        os.environ.update(cls.env)
+
+        cls.image_paths = []
+        for i in range(4):
+            fd, path = tempfile.mkstemp(suffix=".jpg")
+            with os.fdopen(fd, "wb") as f:
+                f.write(f"not really a jpeg {i}".encode())
+            cls.image_paths.append(path)
+        cls.image_path = cls.image_paths[0]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        for path in cls.image_paths:
+            os.remove(path)
+        for key, value in cls.old_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+    def setUp(self):
+        cache._extraction_cache = cache.ExtractionCache(max_entries=16)
+
+    def run_async(self, coro_factory):
+        async def runner():
+            try:
+                return await coro_factory()
+            finally:
+                await vlm.close_async_client()
+        return asyncio.run(runner())
+
+    def test_extract_async(self):
+        """Test extraction against the fake server, including fence stripping"""
+        items = self.run_async(lambda: vlm.extract_with_gpt4v_async(self.image_path))
+        self.assertEqual(items, ITEMS)
+
+    def test_concurrent_requests_overlap(self):
+        """Test that concurrent extractions share the client and run in parallel"""
+        async def extract_many():
+            return await asyncio.gather(*[
+                vlm.extract_with_gpt4v_async(path) for path in self.image_paths
+            ])
+
+        start = time.perf_counter()
+        results = self.run_async(extract_many)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(results, [ITEMS] * 4)
+        # Four serial calls would take at least 0.8s
+        self.assertLess(elapsed, 4 * LATENCY)
+
+    def test_identical_uploads_coalesce(self):
+        """Test that identical images share one call and are then served from cache"""
+        async def extract_same():
+            first = await asyncio.gather(*[
+                vlm.extract_with_gpt4v_async(self.image_path) for _ in range(3)
+            ])
+            second = await vlm.extract_with_gpt4v_async(self.image_path)
+            return first + [second]
+
+        before = self.server.stats()["requests"]
+        results = self.run_async(extract_same)
+
+        self.assertEqual(results, [ITEMS] * 4)
+        self.assertEqual(self.server.stats()["requests"] - before, 1)
+        stats = cache.get_extraction_cache().stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["coalesced"], 2)
+        self.assertEqual(stats["memory_hits"], 1)
+
+    def test_process_batch(self):
+        """Test that a batch keeps input order and overlaps extractions"""
+        receipts = [(os.path.basename(path), path) for path in self.image_paths]
+        finished = []
+
+        start = time.perf_counter()
+        results = self.run_async(lambda: pipeline.process_batch(
+            receipts, "vlm", decode_workers=2, extract_concurrency=4, queue_size=2,
+            on_result=finished.append
+        ))
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual([result["filename"] for result in results], [name for name, _ in receipts])
+        self.assertTrue(all(result["items"] == ITEMS for result in results))
+        self.assertEqual(len(finished), 4)
+        self.assertIn("decode", results[0]["metadata"]["timings"])
+        self.assertLess(elapsed, 4 * LATENCY)
+
+    def test_process_batch_reports_failures(self):
+        """Test that a receipt that can't be read fails alone"""
+        receipts = [("a.jpg", self.image_path), ("missing.jpg", "/nonexistent/receipt.jpg")]
+        results = self.run_async(lambda: pipeline.process_batch(receipts, "vlm"))
+
+        self.assertEqual(results[0]["items"], ITEMS)
+        self.assertFalse(results[1]["metadata"]["success"])
+        self.assertIn("Processing failed", results[1]["metadata"]["error"])
+
+    def test_process_batch_parses_off_the_loop(self):
+        """Test that OCR output is parsed in a worker thread, not on the event loop"""
+        receipts = [(os.path.basename(path), path) for path in self.image_paths[:2]]
+        threads = []
+
+        def parse(lines):
+            threads.append(threading.current_thread())
+            return ITEMS, {"timings": {}, "routing": {}, "layout": {}}
+
+        with mock.patch.object(pipeline, "ocr_receipt_lines", return_value=([], {})), \
+                mock.patch.object(pipeline, "parse_receipt_items", parse):
+            results = self.run_async(lambda: pipeline.process_batch(receipts, "ocr"))
+
+        self.assertEqual([result["items"] for result in results], [ITEMS, ITEMS])
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.main_thread(), threads)
+
+    def test_rate_limits_are_retried(self):
+        """Test that 429s and 5xx are retried and hard failures are told apart"""
+        retries = {"VLM_MAX_RETRIES": "2", "VLM_RETRY_BASE_DELAY": "0.01"}
+        with mock.patch.dict(os.environ, retries):
+            self.server.failures = [(429, "rate_limit_exceeded"), (503, "overloaded")]
+            report = {}
+            items = self.run_async(lambda: vlm.extract_with_gpt4v_async(self.image_paths[1], report))
+            self.assertEqual(items, ITEMS)
+            self.assertEqual((report["attempts"], report["retries"], report["throttled"]), (3, 2, 1))
+
+            cache._extraction_cache = cache.ExtractionCache(max_entries=16)
+            self.server.failures = [(429, "rate_limit_exceeded")] * 3
+            items, metadata = self.run_async(lambda: pipeline.extract_receipt_vlm(self.image_paths[2]))
+            self.assertEqual(items, [])
+            self.assertEqual(metadata["error_kind"], "rate_limited")
+            self.assertTrue(metadata["retryable"])
+
+            self.server.failures = [(429, "insufficient_quota")]
+            items, metadata = self.run_async(lambda: pipeline.extract_receipt_vlm(self.image_paths[3]))
+            self.assertEqual(metadata["error_kind"], "quota_exhausted")
+            self.assertFalse(metadata["retryable"])
+            self.assertEqual(self.server.failures, [])
+
+    def test_stream_items(self):
+        """Test that streamed items are handed over one by one and then cached"""
+        streamed = []
+        report = {}
+        items = self.run_async(lambda: vlm.extract_with_gpt4v_async(self.image_path, report, streamed.append))
+        self.assertEqual(items, ITEMS)
+        self.assertEqual(streamed, ITEMS)
+        self.assertIn("first_item_seconds", report)
+
+        # A cache hit is replayed through the callback too
+        replayed = []
+        self.run_async(lambda: vlm.extract_with_gpt4v_async(self.image_path, None, replayed.append))
+        self.assertEqual(replayed, ITEMS)
+
+    def test_truncated_reply_not_cached(self):
+        """Test that a reply cut off at max_tokens is flagged and not cached"""
+        calls = []
+
+        async def truncated_reply(messages, report, on_item=None):
+            calls.append(1)
+            report["truncated"] = True
+            return [dict(item) for item in ITEMS]
+
+        with mock.patch.object(vlm, "_send_messages", truncated_reply):
+            items, metadata = self.run_async(lambda: pipeline.extract_receipt_vlm(self.image_paths[1]))
+            self.run_async(lambda: pipeline.extract_receipt_vlm(self.image_paths[1]))
+
+        self.assertEqual(items, ITEMS)
+        self.assertFalse(metadata["success"])
+        self.assertTrue(metadata["partial"])
+        self.assertEqual(metadata["error_kind"], "truncated")
+        self.assertIn("cut off", metadata["error"])
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(cache.get_extraction_cache().stats()["stores"], 0)
+
+    def test_interrupted_stream_is_retryable(self):
+        """Test that a stream that broke off is returned as a retryable partial result"""
+        async def interrupted_reply(messages, report, on_item=None):
+            await asyncio.sleep(0.05)
+            report["stream_interrupted"] = "transient"
+            return [dict(item) for item in ITEMS]
+
+        async def extract_same():
+            reports = [{}, {}]
+            items = await asyncio.gather(*[
+                vlm.extract_with_gpt4v_async(self.image_paths[2], report) for report in reports
+            ])
+            return items, reports
+
+        with mock.patch.object(vlm, "_send_messages", interrupted_reply):
+            items, reports = self.run_async(extract_same)
+            _, metadata = self.run_async(lambda: pipeline.extract_receipt_vlm(self.image_paths[2]))
+
+        self.assertEqual(items, [ITEMS, ITEMS])
+        # The caller that joined the in-flight call gets the leader's outcome
+        self.assertEqual(sorted(report["cache"] for report in reports), ["coalesced", "miss"])
+        self.assertEqual([report["stream_interrupted"] for report in reports], ["transient"] * 2)
+        self.assertEqual(metadata["error_kind"], "transient")
+        self.assertTrue(metadata["retryable"])
+        self.assertTrue(metadata["partial"])
+        self.assertFalse(metadata["success"])
+        self.assertEqual(cache.get_extraction_cache().stats()["stores"], 0)
+
+    def test_coalesced_failure_keeps_error_kind(self):
+        """Test that callers sharing a throttled call see why it failed"""
+        async def throttled(messages, report, on_item=None):
+            await asyncio.sleep(0.05)
+            report["error_kind"] = "rate_limited"
+            report["attempts"] = 4
+            raise RuntimeError("429")
+
+        async def extract_same():
+            return await asyncio.gather(*[
+                pipeline.extract_receipt_vlm(self.image_paths[3]) for _ in range(2)
+            ])
+
+        with mock.patch.object(vlm, "_call_model", throttled):
+            results = self.run_async(extract_same)
+        for items, metadata in results:
+            self.assertEqual(items, [])
+            self.assertEqual(metadata["error_kind"], "rate_limited")
+            self.assertTrue(metadata["retryable"])
+
+    def test_item_stream_parser(self):
+        """Test incremental parsing across chunk boundaries, fences and escapes"""
+        reply = '```json\n[{"Ingredient": "Brace } \\"quoted\\"", "Tags": [1, 2]},\n {"Ingredient": "Eggs"}]\n```'
+        parser = vlm.ItemStreamParser()
+        seen = []
+        for char in reply:
+            seen.extend(parser.feed(char))
+        self.assertEqual([item["Ingredient"] for item in seen], ['Brace } "quoted"', "Eggs"])
+        self.assertTrue(parser.finished)
+
+        truncated = vlm.ItemStreamParser()
+        self.assertEqual(truncated.feed('[{"Ingredient": "Milk"}, {"Ingredient": "Br'), [{"Ingredient": "Milk"}])
+
+    def test_tall_receipt_strips(self):
+        """Test that a tall receipt is sent as strips and the overlap is merged away"""
+        from PIL import Image
+        fd, path = tempfile.mkstemp(suffix=".png")
+        os.close(fd)
+        Image.new('L', (400, 3000), 255).save(path)
+        self.addCleanup(os.remove, path)
+
+        report = {}
+        before = self.server.stats()["requests"]
+        items = self.run_async(lambda: vlm.extract_with_gpt4v_async(path, report))
+        self.assertGreater(report["strips"], 1)
+        self.assertEqual(self.server.stats()["requests"] - before, report["strips"])
+        self.assertEqual(items, ITEMS)
+
+    def test_failed_strip_makes_receipt_partial(self):
+        """Test that a receipt missing a strip is flagged and not cached"""
+        from PIL import Image
+        fd, path = tempfile.mkstemp(suffix=".png")
+        os.close(fd)
+        Image.new('L', (400, 3000), 255).save(path)
+        self.addCleanup(os.remove, path)
+
+        async def second_strip_fails(messages, report, on_item=None):
+            if "part 2 of" in messages[0]["content"][0]["text"]:
+                report["error_kind"] = "transient"
+                raise RuntimeError("503")
+            return [dict(item) for item in ITEMS]
+
+        with mock.patch.object(vlm, "_call_model", second_strip_fails):
+            items, metadata = self.run_async(lambda: pipeline.extract_receipt_vlm(path))
+
+        self.assertEqual(items, ITEMS)
+        self.assertFalse(metadata["success"])
+        self.assertTrue(metadata["partial"])
+        self.assertEqual(metadata["payload"]["failed_strips"], 1)
+        self.assertEqual(metadata["error_kind"], "transient")
+        self.assertTrue(metadata["retryable"])
+        self.assertIn("1 of", metadata["error"])
+        self.assertEqual(cache.get_extraction_cache().stats()["stores"], 0)
+
+    def test_merge_strip_items(self):
+        """Test suffix/prefix de-duplication and date propagation"""
+        top = [{"Date": "2025-06-29", "Ingredient": "Milk", "Price": "1.20"},
+               {"Date": "2025-06-29", "Ingredient": "Bread", "Price": "0.85"}]
+        bottom = [{"Date": "", "Ingredient": "White Bread", "Price": "£0.85"},
+                  {"Date": "", "Ingredient": "Eggs", "Price": "2.10"}]
+        merged = vlm.merge_strip_items([top, bottom])
+        self.assertEqual([item["Ingredient"] for item in merged], ["Milk", "Bread", "Eggs"])
+        self.assertEqual(merged[-1]["Date"], "2025-06-29")
+
+    def test_parse_items(self):
+        """Test parsing plain and fenced replies"""
+        self.assertEqual(vlm.parse_items(json.dumps(ITEMS)), ITEMS)
+        self.assertEqual(vlm.parse_items("```\n" + json.dumps(ITEMS) + "\n```"), ITEMS)
+
+if __name__ == '__main__':
+    unittest.main()